@@ -1,32 +1,121 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Header
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import func, case
 from typing import List, Optional
 import structlog
-from datetime import datetime
 
 from app.core.database import get_db
+from app.core.config import settings
+from app.core.celery_app import celery_app
 from app.api.v1.endpoints.auth import get_current_user
-from app.models.database import User, SecurityLog, AnalysisResult, ThreatLevel
+from app.models.database import User, SecurityLog, AnalysisResult, AnalysisJob, ThreatLevel
 from app.models.schemas import (
     AnalysisRequest,
     AnalysisResponse,
     AnalysisResultResponse,
     BatchAnalysisRequest
 )
-from app.services.analysis_service import AnalysisService
+from app.services.admission import admit, format_eta
+from app.services.analysis_service import AnalysisService, analysis_queue, classify_priority, job_size
 from app.services.log_processor import LogProcessor
 
 logger = structlog.get_logger()
 router = APIRouter()
 
+def refuse_if_overloaded(admission: dict) -> None:
+    """429 with Retry-After for a job admission control turned away"""
+    if not admission["admitted"]:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Analysis queue is full, estimated wait {format_eta(admission['wait'])}",
+            headers={"Retry-After": str(admission["retry_after"])}
+        )
+
+def check_idempotency_key(idempotency_key: Optional[str]) -> Optional[str]:
+    """Validate the Idempotency-Key header; keys are stored in a String(255) column"""
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= 255:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Idempotency-Key must be 1 to 255 characters"
+        )
+    return idempotency_key
+
+def existing_job_response(job: AnalysisJob, reason: str) -> AnalysisResponse:
+    """Response for a request attached to an earlier job instead of starting new work"""
+    logger.info("Analysis request attached to existing job",
+               analysis_id=job.id,
+               user_id=job.user_id,
+               reason=reason)
+    return AnalysisResponse(
+        analysis_id=job.id,
+        status=job.status,
+        message=f"Attached to existing analysis ({reason})",
+        log_count=job.log_count,
+        priority=job.priority,
+        deduplicated=True
+    )
+
+def attach_to_existing_job(
+    db: Session,
+    user_id: str,
+    idempotency_key: Optional[str],
+    log_ids: List[str]
+) -> Optional[AnalysisResponse]:
+    """Response for a request whose work a job already covers, None if no job does"""
+    job = AnalysisService.find_job_by_key(db, user_id, idempotency_key)
+    if job and job.log_set_hash != AnalysisService.log_set_hash(log_ids):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different set of logs"
+        )
+    if job:
+        return existing_job_response(job, "same Idempotency-Key")
+    job = AnalysisService.find_duplicate_job(db, user_id, log_ids)
+    if job:
+        return existing_job_response(job, "same logs already queued")
+    return None
+
+def schedule_analysis(
+    background_tasks: BackgroundTasks,
+    analysis_service: AnalysisService,
+    log_ids: List[str],
+    user_id: str,
+    analysis_id: str,
+    priority: str = "normal"
+) -> None:
+    """Run a job in-process or fan it out to Celery, per ANALYSIS_EXECUTOR"""
+    if settings.ANALYSIS_EXECUTOR == "celery":
+        # Large files are split into shards across the worker cluster; the
+        # job's lane decides which queue (and worker pool) runs them
+        celery_app.send_task(
+            "app.tasks.analysis_tasks.dispatch_analysis_task",
+            args=(log_ids, user_id, analysis_id),
+            queue=analysis_queue(priority)
+        )
+    else:
+        # The task opens its own session, since the request-scoped one is
+        # closed by the time it runs
+        background_tasks.add_task(analysis_service.analyze_logs, log_ids, user_id, analysis_id)
+
 @router.post("/trigger", response_model=AnalysisResponse)
 async def trigger_analysis(
     request: AnalysisRequest,
     background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Trigger analysis on uploaded logs"""
+    """
+    Trigger analysis on uploaded logs
+    
+    Repeating a request with the same Idempotency-Key returns the job the
+    first one created. Without a key, a request for the same logs as a
+    pending or running job of the user (and the same model version)
+    attaches to that job. Both are backed by unique indexes, so concurrent
+    requests coalesce too.
+    """
+    idempotency_key = check_idempotency_key(idempotency_key)
     try:
         # Get logs to analyze
         logs = db.query(SecurityLog).filter(
@@ -42,30 +131,53 @@ async def trigger_analysis(
         
         # Initialize analysis service
         analysis_service = AnalysisService()
+        log_ids = [log.id for log in logs]
+        
+        # Retries and double submits join the job already doing this work
+        existing = attach_to_existing_job(db, current_user.id, idempotency_key, log_ids)
+        if existing:
+            return existing
+        
+        # Small interactive requests get their own lane ahead of big files
+        total_bytes = job_size(logs)
+        priority = classify_priority(total_bytes, "trigger")
+        
+        # Refuse rather than queue behind a backlog that cannot drain in time
+        admission = admit(db, priority, total_bytes)
+        refuse_if_overloaded(admission)
+        
+        # Persist the job; its id is the analysis_id clients poll
+        try:
+            job = analysis_service.create_job(db, current_user.id, log_ids, priority, total_bytes, idempotency_key)
+            db.commit()
+        except IntegrityError:
+            # A concurrent request with the same key or for the same logs won the race
+            db.rollback()
+            existing = attach_to_existing_job(db, current_user.id, idempotency_key, log_ids)
+            if existing:
+                return existing
+            # The winner already finished, or another constraint failed
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A concurrent request for these logs conflicted with this one; retry it"
+            )
+        analysis_id = job.id
         
-        # Create analysis response
-        analysis_id = f"analysis_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{current_user.id}"
-        
-        # Add background task for analysis
-        background_tasks.add_task(
-            analysis_service.analyze_logs,
-            logs,
-            current_user.id,
-            analysis_id,
-            db
-        )
+        schedule_analysis(background_tasks, analysis_service, log_ids, current_user.id, analysis_id, priority)
         
         logger.info("Analysis triggered", 
                    analysis_id=analysis_id,
                    user_id=current_user.id,
-                   log_count=len(logs))
+                   log_count=len(logs),
+                   priority=priority)
         
         return AnalysisResponse(
             analysis_id=analysis_id,
             status="processing",
             message="Analysis started in background",
             log_count=len(logs),
-            estimated_time="2-5 minutes"
+            priority=priority,
+            estimated_time=format_eta(admission["eta"])
         )
         
     except HTTPException:
@@ -83,47 +195,64 @@ async def get_analysis_status(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get analysis status and results"""
+    """
+    Get analysis status and results
+    
+    Reads the AnalysisJob row, whose counters are kept current while the
+    analysis runs. ``all`` sums the counters of all of the user's jobs.
+    """
     try:
-        # Get analysis results
-        results = db.query(AnalysisResult).filter(
-            AnalysisResult.user_id == current_user.id
-        ).all()
-        
-        # Filter by analysis_id if provided
-        if analysis_id != "all":
-            # This would need to be implemented based on how analysis_id is stored
-            pass
-        
-        if not results:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="No analysis results found"
+        if analysis_id == "all":
+            counters = [
+                AnalysisJob.log_count, AnalysisJob.logs_completed, AnalysisJob.logs_failed,
+                AnalysisJob.records_processed, AnalysisJob.records_escalated, AnalysisJob.records_modeled,
+                AnalysisJob.total_results, AnalysisJob.confidence_sum,
+                *(getattr(AnalysisJob, f"{level.value}_count") for level in ThreatLevel)
+            ]
+            row = db.query(
+                func.count(AnalysisJob.id),
+                func.sum(case((AnalysisJob.status.in_(["pending", "processing"]), 1), else_=0)),
+                *(func.coalesce(func.sum(column), 0) for column in counters)
+            ).filter(AnalysisJob.user_id == current_user.id).one()
+            if not row[0]:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="No analysis results found"
+                )
+            job = AnalysisJob(
+                status="processing" if row[1] else "completed",
+                **{column.key: value for column, value in zip(counters, row[2:])}
             )
-        
-        # Calculate statistics
-        total_results = len(results)
-        completed_results = len([r for r in results if r.processing_time is not None])
-        avg_confidence = sum(r.confidence_score for r in results) / total_results if total_results > 0 else 0
-        
-        # Count threats by level
-        threat_counts = {}
-        for level in ThreatLevel:
-            threat_counts[level.value] = len([r for r in results if r.prediction == level])
+        else:
+            job = db.get(AnalysisJob, analysis_id)
+            if not job or job.user_id != current_user.id:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Analysis not found"
+                )
         
         logger.info("Analysis status retrieved", 
                    analysis_id=analysis_id,
                    user_id=current_user.id,
-                   total_results=total_results)
+                   total_results=job.total_results)
         
         return AnalysisResponse(
             analysis_id=analysis_id,
-            status="completed" if completed_results == total_results else "processing",
-            message=f"Analysis completed: {completed_results}/{total_results} results",
-            total_results=total_results,
-            completed_results=completed_results,
-            average_confidence=avg_confidence,
-            threat_distribution=threat_counts
+            status=job.status,
+            message=f"Analysis {job.status}: {job.logs_completed}/{job.log_count} logs, {job.records_processed} records",
+            log_count=job.log_count,
+            priority=job.priority,
+            total_results=job.total_results,
+            completed_results=job.total_results,
+            average_confidence=job.average_confidence,
+            threat_distribution=job.threat_distribution,
+            logs_completed=job.logs_completed,
+            logs_failed=job.logs_failed,
+            records_processed=job.records_processed,
+            records_escalated=job.records_escalated,
+            records_modeled=job.records_modeled,
+            escalation_rate=job.escalation_rate,
+            records_per_second=job.records_per_second
         )
         
     except HTTPException:
@@ -135,6 +264,92 @@ async def get_analysis_status(
             detail="Failed to get analysis status"
         )
 
+@router.post("/cancel/{analysis_id}", response_model=AnalysisResponse)
+async def cancel_analysis(
+    analysis_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Cancel a pending or running analysis
+    
+    Workers stop cooperatively within ANALYSIS_CANCEL_CHECK_INTERVAL
+    seconds; results committed up to that point are kept.
+    """
+    job = db.get(AnalysisJob, analysis_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Analysis not found"
+        )
+    
+    if not AnalysisService.cancel_job(db, analysis_id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Analysis already {job.status}"
+        )
+    db.commit()
+    
+    logger.info("Analysis cancelled", analysis_id=analysis_id, user_id=current_user.id)
+    
+    return AnalysisResponse(
+        analysis_id=analysis_id,
+        status="cancelled",
+        message=f"Analysis cancelled; running workers stop within {settings.ANALYSIS_CANCEL_CHECK_INTERVAL:g} seconds",
+        log_count=job.log_count
+    )
+
+@router.post("/resume/{analysis_id}", response_model=AnalysisResponse)
+async def resume_analysis(
+    analysis_id: str,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Resume an interrupted, cancelled or failed analysis from its checkpoints
+    
+    Needed for the in-process executor, whose jobs do not survive an API
+    restart, and for cancelled jobs; Celery redelivers interrupted shards
+    on its own. A job whose run is still alive (it wrote within
+    ANALYSIS_LEASE_TIMEOUT and has not stopped) is not resumed.
+    """
+    job = db.get(AnalysisJob, analysis_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Analysis not found"
+        )
+    
+    analysis_service = AnalysisService()
+    try:
+        resumed = bool(job.log_ids) and analysis_service.resume_job(db, analysis_id)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Another analysis of the same logs is pending or running"
+        )
+    if not resumed:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Analysis {job.status} cannot be resumed"
+            if job.status == "completed" or not job.log_ids
+            else f"Analysis {job.status} is still running; resume it once its workers have stopped"
+        )
+    db.commit()
+    
+    schedule_analysis(background_tasks, analysis_service, job.log_ids, current_user.id, analysis_id, job.priority)
+    
+    logger.info("Analysis resumed", analysis_id=analysis_id, user_id=current_user.id)
+    
+    return AnalysisResponse(
+        analysis_id=analysis_id,
+        status="processing",
+        message="Analysis resumed from last checkpoint",
+        log_count=job.log_count
+    )
+
 @router.get("/results", response_model=List[AnalysisResultResponse])
 async def get_analysis_results(
     limit: int = 100,
@@ -201,6 +416,9 @@ async def batch_analysis(
 ):
     """Trigger batch analysis on multiple log sources"""
     try:
+        # Refuse before ingesting anything if the lane batches start in is full
+        refuse_if_overloaded(admit(db, "normal", 0))
+        
         # Initialize log processor
         log_processor = LogProcessor()
         
@@ -230,17 +448,19 @@ async def batch_analysis(
         # Initialize analysis service
         analysis_service = AnalysisService()
         
-        # Create analysis response
-        analysis_id = f"batch_analysis_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{current_user.id}"
+        # Batch submissions are never interactive
+        total_bytes = job_size(processed_logs)
+        priority = classify_priority(total_bytes, "batch")
         
-        # Add background task for analysis
-        background_tasks.add_task(
-            analysis_service.analyze_logs,
-            processed_logs,
-            current_user.id,
-            analysis_id,
-            db
-        )
+        # The logs are ingested by now, so the job is accepted with its ETA
+        admission = admit(db, priority, total_bytes, enforce=False)
+        
+        # Persist the job; its id is the analysis_id clients poll
+        job = analysis_service.create_job(db, current_user.id, [log.id for log in processed_logs], priority, total_bytes)
+        db.commit()
+        analysis_id = job.id
+        
+        schedule_analysis(background_tasks, analysis_service, [log.id for log in processed_logs], current_user.id, analysis_id, priority)
         
         logger.info("Batch analysis triggered", 
                    analysis_id=analysis_id,
@@ -253,7 +473,8 @@ async def batch_analysis(
             status="processing",
             message="Batch analysis started in background",
             log_count=len(processed_logs),
-            estimated_time="5-10 minutes"
+            priority=priority,
+            estimated_time=format_eta(admission["eta"])
         )
         
     except HTTPException:
@@ -1,26 +1,133 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request, Header, BackgroundTasks
+from starlette.requests import ClientDisconnect
 from sqlalchemy.orm import Session
+from sqlalchemy import insert
 from typing import List, Optional
 import structlog
 import uuid
+import hashlib
 from datetime import datetime
 import os
 import zipfile
+from urllib.parse import unquote
 import tempfile
-import shutil
-import aiofiles
 import asyncio
+import shutil
 
 from app.core.database import get_db
 from app.api.v1.endpoints.auth import get_current_user
-from app.models.database import User, SecurityLog, ThreatLevel
+from app.models.database import User, SecurityLog, AnalysisResult, ThreatLevel
 from app.core.config import settings
+from app.services.upload_storage import (
+    store_upload_file,
+    iter_upload_file,
+    decode_stream,
+    commit_blob,
+    write_stream,
+    write_stream_at,
+    preallocate_file,
+    store_assembled_file,
+    UploadTooLargeError,
+    OWNER_SUFFIX,
+    PARTIAL_SUFFIX
+)
+from app.services.compressed_storage import (
+    InvalidEncodingError,
+    UnsupportedEncodingError,
+    decoded_filename,
+    is_text_file,
+    open_stored_file,
+    remove_stored_file,
+    should_compress,
+    stored_size,
+    upload_encoding
+)
+from app.services.line_index import read_lines
+from app.services.upload_sessions import get_upload_session_store
+from app.services.analysis_service import AnalysisService
+from app.services.zip_ingest import ZipIngestService, is_zip_upload
 
 logger = structlog.get_logger()
 router = APIRouter()
 
-# Store upload progress in memory (in production, use Redis)
-upload_progress = {}
+# Upper bound on file bytes returned inline by the log detail endpoint
+MAX_PREVIEW_LENGTH = 64 * 1024
+
+# Upper bound on lines returned by one request to the line range endpoint
+MAX_LINES_PER_REQUEST = 10000
+
+def ingest_partial_path(upload_id: str) -> str:
+    """Location of an in-progress raw-body ingest, next to its final path"""
+    return os.path.join(settings.UPLOAD_DIR, f"{upload_id}{PARTIAL_SUFFIX}")
+
+def ingest_owner_path(upload_id: str) -> str:
+    """Sidecar holding the ID of the user a raw-body ingest belongs to"""
+    return ingest_partial_path(upload_id) + OWNER_SUFFIX
+
+def check_ingest_owner(upload_id: str, user_id: str) -> None:
+    """Raise 403 unless ``user_id`` owns the ingest ``upload_id``"""
+    try:
+        with open(ingest_owner_path(upload_id)) as f:
+            owner = f.read()
+    except FileNotFoundError:
+        owner = None
+    if owner != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+def claim_ingest(upload_id: str, user_id: str) -> None:
+    """
+    Record ``user_id`` as the owner of a new ingest, or check it on resume
+    
+    Upload IDs come from clients, so without an owner anyone who learns one
+    could append to another user's partial file and commit it as their own.
+    """
+    if os.path.exists(ingest_partial_path(upload_id)):
+        check_ingest_owner(upload_id, user_id)
+        return
+    try:
+        fd = os.open(ingest_owner_path(upload_id), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        check_ingest_owner(upload_id, user_id)
+        return
+    with os.fdopen(fd, "w") as f:
+        f.write(user_id)
+
+def release_ingest(upload_id: str) -> None:
+    """Forget the owner of an ingest once its partial file is gone"""
+    if not os.path.exists(ingest_partial_path(upload_id)):
+        try:
+            os.remove(ingest_owner_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+def schedule_archive_expansion(
+    background_tasks: BackgroundTasks,
+    log_id: str,
+    filename: Optional[str],
+    content_type: Optional[str]
+) -> bool:
+    """Queue ZIP uploads for expansion into per-member logs"""
+    if not is_zip_upload(filename, content_type):
+        return False
+    background_tasks.add_task(ZipIngestService().expand_archive, log_id)
+    return True
+
+def resolve_upload_encoding(
+    filename: Optional[str],
+    content_type: Optional[str],
+    declared: Optional[str]
+) -> Optional[str]:
+    """Codec a gzip/zstd-encoded upload must be decoded with, or None"""
+    try:
+        return upload_encoding(filename, content_type, declared)
+    except UnsupportedEncodingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=str(e)
+        )
 
 def is_valid_file_type(content_type: str, filename: str) -> bool:
     """Check if file type is allowed"""
@@ -32,7 +139,8 @@ def is_valid_file_type(content_type: str, filename: str) -> bool:
     allowed_extensions = [
         '.txt', '.log', '.csv', '.json', '.xml', '.html', '.css', '.js',
         '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.pdf',
-        '.zip', '.py', '.pyc', '.sql', '.md', '.yaml', '.yml'
+        '.zip', '.py', '.pyc', '.sql', '.md', '.yaml', '.yml',
+        '.gz', '.zst'
     ]
     
     file_ext = os.path.splitext(filename.lower())[1]
@@ -40,6 +148,7 @@ def is_valid_file_type(content_type: str, filename: str) -> bool:
 
 @router.post("/upload")
 async def upload_log_file(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     upload_type: Optional[str] = Form("text"),  # "text" or "visual"
     current_user: User = Depends(get_current_user),
@@ -54,27 +163,30 @@ async def upload_log_file(
                 detail=f"File type not allowed: {file.content_type} ({file.filename})"
             )
         
-        # Read file content
-        content = await file.read()
-        
-        # Validate file size
-        if len(content) > settings.MAX_FILE_SIZE:
+        # Stream file to content-addressed storage in bounded chunks, hashing as
+        # it goes and aborting once it crosses MAX_FILE_SIZE
+        try:
+            stored = await store_upload_file(file)
+        except UploadTooLargeError as e:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(e)
+            )
+        except UnsupportedEncodingError as e:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=str(e)
+            )
+        except InvalidEncodingError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File size {len(content)} exceeds maximum allowed size {settings.MAX_FILE_SIZE}"
+                detail=str(e)
             )
         
-        # Create unique filename
-        file_extension = os.path.splitext(file.filename)[1] if file.filename else ".log"
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
-        
-        # Ensure upload directory exists
-        os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-        
-        # Save file
-        with open(file_path, "wb") as buffer:
-            buffer.write(content)
+        # Blobs are shared, so only this user's own earlier uploads make it a duplicate
+        stored["duplicate"] = stored["duplicate"] and stored["content_hash"] in AnalysisService.owned_content(
+            db, current_user.id, [stored["content_hash"]]
+        )
         
         # Create log entry in database
         log_entry = SecurityLog(
@@ -84,35 +196,52 @@ async def upload_log_file(
             raw_message=f"Uploaded file: {file.filename}",
             parsed_data={
                 "filename": file.filename,
-                "file_path": file_path,
-                "file_size": len(content),
+                "file_path": stored["file_path"],
+                "file_size": stored["file_size"],
                 "content_type": file.content_type,
-                "upload_type": upload_type
+                "upload_type": upload_type,
+                "content_hash": stored["content_hash"],
+                "duplicate": stored["duplicate"],
+                "compression": stored["compression"],
+                "content_encoding": stored["content_encoding"]
             },
             severity=ThreatLevel.NORMAL,
             processed=False,
-            file_path=file_path,
-            file_size=len(content),
+            file_path=stored["file_path"],
+            file_size=stored["file_size"],
+            content_hash=stored["content_hash"],
             user_id=current_user.id
         )
         
         db.add(log_entry)
+        db.flush()
+        
+        # Identical content that was already analyzed is not analyzed again
+        if stored["duplicate"]:
+            AnalysisService().reuse_existing_results(db, log_entry)
+        
         db.commit()
         db.refresh(log_entry)
         
+        archive = schedule_archive_expansion(background_tasks, log_entry.id, file.filename, file.content_type)
+        
         logger.info("Log file uploaded successfully", 
                    user_id=current_user.id,
                    filename=file.filename,
                    log_id=log_entry.id,
-                   upload_type=upload_type)
+                   upload_type=upload_type,
+                   duplicate=stored["duplicate"])
         
         return {
             "log_id": log_entry.id,
             "filename": file.filename,
-            "file_size": len(content),
+            "file_size": stored["file_size"],
             "message": "File uploaded successfully",
-            "status": "pending_analysis",
-            "upload_type": upload_type
+            "status": "analyzed" if log_entry.processed else "pending_analysis",
+            "upload_type": upload_type,
+            "content_hash": stored["content_hash"],
+            "duplicate": stored["duplicate"],
+            "archive_expansion": "scheduled" if archive else None
         }
         
     except HTTPException:
@@ -126,87 +255,112 @@ async def upload_log_file(
 
 @router.post("/upload-folder")
 async def upload_folder(
+    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
     upload_type: Optional[str] = Form("text"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Upload multiple files (folder) for analysis"""
+    """
+    Upload multiple files (folder) for analysis
+    
+    Files are streamed to storage concurrently (at most
+    FOLDER_UPLOAD_CONCURRENCY at a time) and all SecurityLog rows are
+    inserted in one bulk statement and a single commit.
+    """
     try:
+        semaphore = asyncio.Semaphore(settings.FOLDER_UPLOAD_CONCURRENCY)
+        
+        async def store_file(file: UploadFile) -> dict:
+            # Validate file type
+            if not is_valid_file_type(file.content_type or "", file.filename or ""):
+                return {"error": f"File type not allowed: {file.content_type}"}
+            
+            async with semaphore:
+                try:
+                    return await store_upload_file(file)
+                except UploadTooLargeError:
+                    return {"error": "File size exceeds maximum allowed size"}
+                except Exception as e:
+                    return {"error": str(e)}
+        
+        outcomes = await asyncio.gather(*(store_file(file) for file in files))
+        
         uploaded_files = []
         failed_files = []
+        log_rows = []
         
-        for file in files:
-            try:
-                # Validate file type
-                if not is_valid_file_type(file.content_type or "", file.filename or ""):
-                    failed_files.append({
-                        "filename": file.filename,
-                        "error": f"File type not allowed: {file.content_type}"
-                    })
-                    continue
-                
-                # Read file content
-                content = await file.read()
-                
-                # Validate file size
-                if len(content) > settings.MAX_FILE_SIZE:
-                    failed_files.append({
-                        "filename": file.filename,
-                        "error": f"File size {len(content)} exceeds maximum allowed size"
-                    })
-                    continue
-                
-                # Create unique filename
-                file_extension = os.path.splitext(file.filename)[1] if file.filename else ".log"
-                unique_filename = f"{uuid.uuid4()}{file_extension}"
-                file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
-                
-                # Ensure upload directory exists
-                os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-                
-                # Save file
-                with open(file_path, "wb") as buffer:
-                    buffer.write(content)
-                
-                # Create log entry in database
-                log_entry = SecurityLog(
-                    timestamp=datetime.utcnow(),
-                    source="folder_upload",
-                    log_type=upload_type or "security_log",
-                    raw_message=f"Uploaded file from folder: {file.filename}",
-                    parsed_data={
-                        "filename": file.filename,
-                        "file_path": file_path,
-                        "file_size": len(content),
-                        "content_type": file.content_type,
-                        "upload_type": upload_type
-                    },
-                    severity=ThreatLevel.NORMAL,
-                    processed=False,
-                    file_path=file_path,
-                    file_size=len(content),
-                    user_id=current_user.id
-                )
-                
-                db.add(log_entry)
-                db.commit()  # Commit to get the ID
-                db.refresh(log_entry)  # Refresh to get the ID
-                uploaded_files.append({
-                    "log_id": log_entry.id,
-                    "filename": file.filename,
-                    "file_size": len(content),
-                    "status": "pending_analysis"
-                })
-                
-            except Exception as e:
+        for file, stored in zip(files, outcomes):
+            if "error" in stored:
                 failed_files.append({
                     "filename": file.filename,
-                    "error": str(e)
+                    "error": stored["error"]
                 })
+                continue
+            
+            log_rows.append({
+                "id": str(uuid.uuid4()),
+                "timestamp": datetime.utcnow(),
+                "source": "folder_upload",
+                "log_type": upload_type or "security_log",
+                "raw_message": f"Uploaded file from folder: {file.filename}",
+                "parsed_data": {
+                    "filename": file.filename,
+                    "file_path": stored["file_path"],
+                    "file_size": stored["file_size"],
+                    "content_type": file.content_type,
+                    "upload_type": upload_type,
+                    "content_hash": stored["content_hash"],
+                    "duplicate": stored["duplicate"],
+                    "compression": stored["compression"],
+                    "content_encoding": stored["content_encoding"]
+                },
+                "severity": ThreatLevel.NORMAL,
+                "processed": False,
+                "file_path": stored["file_path"],
+                "file_size": stored["file_size"],
+                "content_hash": stored["content_hash"],
+                "user_id": current_user.id
+            })
+        
+        # Blobs are shared, so only this user's own earlier uploads make a duplicate;
+        # content that was already analyzed reuses its results instead of being queued
+        AnalysisService.scope_duplicates(db, log_rows)
+        result_rows = AnalysisService().plan_result_reuse(
+            db, [row for row in log_rows if row["parsed_data"]["duplicate"]]
+        )
+        
+        # One bulk insert and one commit for the whole folder
+        try:
+            if log_rows:
+                db.execute(insert(SecurityLog), log_rows)
+            if result_rows:
+                db.execute(insert(AnalysisResult), result_rows)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error("Folder upload bulk insert failed", error=str(e), user_id=current_user.id)
+            failed_files.extend({
+                "filename": row["parsed_data"]["filename"],
+                "error": f"Failed to record upload: {str(e)}"
+            } for row in log_rows)
+            log_rows = []
         
-        # Commit all successful uploads
-        # db.commit()  # Removed since we commit individually
+        for row in log_rows:
+            archive = schedule_archive_expansion(
+                background_tasks,
+                row["id"],
+                row["parsed_data"]["filename"],
+                row["parsed_data"]["content_type"]
+            )
+            uploaded_files.append({
+                "log_id": row["id"],
+                "filename": row["parsed_data"]["filename"],
+                "file_size": row["file_size"],
+                "status": "analyzed" if row["processed"] else "pending_analysis",
+                "duplicate": row["parsed_data"]["duplicate"],
+                "archive_expansion": "scheduled" if archive else None
+            })
         
         logger.info("Folder upload completed", 
                    user_id=current_user.id,
@@ -274,10 +428,19 @@ async def get_logs(
 @router.get("/{log_id}")
 async def get_log_detail(
     log_id: str,
+    preview_offset: int = 0,
+    preview_length: int = 0,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get detailed information about a specific log"""
+    """
+    Get detailed information about a specific log
+    
+    With ``preview_length`` set, up to MAX_PREVIEW_LENGTH bytes of the stored
+    file starting at ``preview_offset`` are returned as well. Compressed
+    files are read frame by frame, so previews deep into large files do not
+    decompress everything before them.
+    """
     try:
         log = db.query(SecurityLog).filter(
             SecurityLog.id == log_id,
@@ -290,6 +453,13 @@ async def get_log_detail(
                 detail="Log not found"
             )
         
+        preview = None
+        if preview_length > 0 and log.file_path and os.path.exists(log.file_path):
+            length = min(preview_length, MAX_PREVIEW_LENGTH)
+            with open_stored_file(log.file_path, buffer_size=length) as f:
+                f.seek(max(preview_offset, 0))
+                preview = f.read(length).decode("utf-8", errors="replace")
+        
         return {
             "id": log.id,
             "timestamp": log.timestamp,
@@ -300,7 +470,8 @@ async def get_log_detail(
             "severity": log.severity.value if log.severity else "normal",
             "processed": log.processed,
             "file_path": log.file_path,
-            "file_size": log.file_size
+            "file_size": log.file_size,
+            "preview": preview
         }
         
     except HTTPException:
@@ -312,18 +483,102 @@ async def get_log_detail(
             detail="Failed to get log detail"
         )
 
+@router.get("/{log_id}/lines")
+async def get_log_lines(
+    log_id: str,
+    start: int = 0,
+    end: int = 100,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get lines ``[start, end)`` (0-based) of a log file
+    
+    Uses the line-offset index built at upload time to seek close to
+    ``start`` instead of scanning the file from the beginning. Files
+    uploaded without an index get one on first access.
+    
+    Lines longer than UPLOAD_BUFFER_SIZE bytes are cut to that length;
+    their numbers are listed in ``truncated_lines``.
+    """
+    try:
+        if start < 0 or end < start:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Expected 0 <= start <= end"
+            )
+        end = min(end, start + MAX_LINES_PER_REQUEST)
+        
+        log = db.query(SecurityLog).filter(
+            SecurityLog.id == log_id,
+            SecurityLog.user_id == current_user.id
+        ).first()
+        
+        if not log:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Log not found"
+            )
+        
+        if not log.file_path or not os.path.exists(log.file_path):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Log file not found"
+            )
+        
+        lines, truncated_lines, total_lines = await asyncio.to_thread(read_lines, log.file_path, start, end)
+        
+        return {
+            "log_id": log.id,
+            "start": start,
+            "end": start + len(lines),
+            "total_lines": total_lines,
+            "lines": [line.decode("utf-8", errors="replace").rstrip("\r\n") for line in lines],
+            "truncated_lines": truncated_lines
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Failed to get log lines", error=str(e), log_id=log_id)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to get log lines"
+        )
+
 @router.post("/upload-chunk")
 async def upload_chunk(
+    background_tasks: BackgroundTasks,
     chunk: UploadFile = File(...),
     chunk_number: int = Form(...),
     total_chunks: int = Form(...),
     file_id: str = Form(...),
     filename: str = Form(...),
     upload_type: Optional[str] = Form("text"),
+    chunk_size: int = Form(settings.CHUNK_SIZE),
+    total_size: Optional[int] = Form(None),
+    content_encoding: Optional[str] = Form(None),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Upload a chunk of a large file"""
+    """
+    Upload a chunk of a large file
+    
+    Chunk N (1-based) is written straight into its byte range
+    ``[(N - 1) * chunk_size, N * chunk_size)`` of a preallocated file, so
+    chunks may arrive in parallel and in any order and there is no
+    reassembly pass. The last chunk hashes the file and renames it into
+    content-addressed storage; files that are stored compressed are
+    rewritten instead.
+    
+    For gzip/zstd files (``content_encoding`` field, or a ``.gz`` / ``.zst``
+    filename) the chunks carry the compressed bytes; the completed file is
+    decompressed in one streaming pass into content-addressed storage, with
+    MAX_FILE_SIZE applied to the decompressed size.
+    
+    ``file_id`` is chosen by the client and must be a UUID. Uploads left
+    unfinished are removed after UPLOAD_SESSION_TTL.
+    """
     try:
         # Validate file type
         if not is_valid_file_type(chunk.content_type or "", filename):
@@ -332,72 +587,174 @@ async def upload_chunk(
                 detail=f"File type not allowed: {chunk.content_type} ({filename})"
             )
         
-        # Create temp directory for chunks
-        temp_dir = os.path.join(settings.UPLOAD_DIR, "temp", file_id)
-        os.makedirs(temp_dir, exist_ok=True)
+        # File IDs become file names, so only accept UUIDs
+        try:
+            file_id = str(uuid.UUID(file_id))
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="file_id must be a UUID"
+            )
         
-        # Save chunk
-        chunk_path = os.path.join(temp_dir, f"chunk_{chunk_number}")
-        chunk_content = await chunk.read()
+        encoding = resolve_upload_encoding(filename, None, content_encoding)
         
-        async with aiofiles.open(chunk_path, 'wb') as f:
-            await f.write(chunk_content)
+        if not 1 <= chunk_number <= total_chunks:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Chunk number {chunk_number} out of range 1-{total_chunks}"
+            )
         
-        # Update progress
-        if file_id not in upload_progress:
-            upload_progress[file_id] = {
-                "filename": filename,
-                "total_chunks": total_chunks,
-                "received_chunks": set(),
-                "upload_type": upload_type,
-                "user_id": current_user.id
-            }
+        if chunk_size <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="chunk_size must be positive"
+            )
         
-        upload_progress[file_id]["received_chunks"].add(chunk_number)
+        if (total_size or (total_chunks - 1) * chunk_size) > settings.MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File size exceeds maximum allowed size of {settings.MAX_FILE_SIZE / (1024**3):.1f}GB"
+            )
         
-        # Check if all chunks received
-        if len(upload_progress[file_id]["received_chunks"]) == total_chunks:
-            # Combine chunks
-            final_path = os.path.join(settings.UPLOAD_DIR, f"{file_id}_{filename}")
-            
-            async with aiofiles.open(final_path, 'wb') as outfile:
-                for i in range(1, total_chunks + 1):
-                    chunk_file = os.path.join(temp_dir, f"chunk_{i}")
-                    if os.path.exists(chunk_file):
-                        async with aiofiles.open(chunk_file, 'rb') as infile:
-                            content = await infile.read()
-                            await outfile.write(content)
-            
-            # Clean up temp directory
-            shutil.rmtree(temp_dir)
-            
-            # Create log entry
-            file_size = os.path.getsize(final_path)
-            log_entry = SecurityLog(
-                timestamp=datetime.utcnow(),
-                source="chunked_upload",
-                log_type=upload_type or "security_log",
-                raw_message=f"Uploaded large file: {filename}",
-                parsed_data={
-                    "filename": filename,
-                    "file_path": final_path,
-                    "file_size": file_size,
-                    "upload_type": upload_type,
-                    "chunks": total_chunks
-                },
-                severity=ThreatLevel.NORMAL,
-                processed=False,
-                file_path=final_path,
-                file_size=file_size,
+        # Chunks of one upload may hit different workers; the store is shared
+        session_store = get_upload_session_store()
+        session = session_store.get(file_id)
+        if session and session["user_id"] != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied"
+            )
+        
+        partial_path = os.path.join(settings.UPLOAD_DIR, f"{file_id}_{os.path.basename(filename)}{PARTIAL_SUFFIX}")
+        
+        # Reserve the whole file up front; safe to repeat for every chunk
+        preallocate_file(partial_path, total_size)
+        
+        # Stream the chunk into its own byte range
+        try:
+            chunk_bytes = await write_stream_at(
+                iter_upload_file(chunk),
+                partial_path,
+                offset=(chunk_number - 1) * chunk_size,
+                max_length=chunk_size
+            )
+        except UploadTooLargeError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Chunk {chunk_number} is larger than chunk_size {chunk_size}"
+            )
+        
+        # Atomically mark the chunk received; exactly one request sees completion
+        try:
+            session, completed = session_store.register_chunk(
+                file_id,
+                chunk_number,
+                chunk_bytes,
+                filename=filename,
+                total_chunks=total_chunks,
+                upload_type=upload_type,
                 user_id=current_user.id
             )
+        except PermissionError:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied"
+            )
+        
+        if completed:
+            stored = None
+            try:
+                # Preallocation reserved total_size bytes, and a short chunk leaves
+                # a gap; either way part of the file would be NUL padding
+                received = session["bytes_received"]
+                if (total_size and received != total_size) or os.path.getsize(partial_path) != received:
+                    expected = total_size or os.path.getsize(partial_path)
+                    session_store.delete(file_id)
+                    os.remove(partial_path)
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Received {received} bytes but the file spans {expected}; upload it again"
+                    )
+                
+                # Hash the assembled file into content-addressed storage; decoded
+                # or compressed at rest on the way if it has to be rewritten
+                try:
+                    stored = await store_assembled_file(partial_path, filename, encoding)
+                except (UploadTooLargeError, InvalidEncodingError) as e:
+                    # The assembled body itself is unusable, so a retry cannot help
+                    session_store.delete(file_id)
+                    os.remove(partial_path)
+                    raise HTTPException(
+                        status_code=(
+                            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                            if isinstance(e, UploadTooLargeError)
+                            else status.HTTP_400_BAD_REQUEST
+                        ),
+                        detail=str(e)
+                    )
+                final_path = stored["file_path"]
+                file_size = stored["file_size"]
+                content_hash = stored["content_hash"]
+                duplicate = stored["duplicate"] and content_hash in AnalysisService.owned_content(
+                    db, current_user.id, [content_hash]
+                )
+                
+                # Create log entry
+                log_entry = SecurityLog(
+                    timestamp=datetime.utcnow(),
+                    source="chunked_upload",
+                    log_type=upload_type or "security_log",
+                    raw_message=f"Uploaded large file: {filename}",
+                    parsed_data={
+                        "filename": filename,
+                        "file_path": final_path,
+                        "file_size": file_size,
+                        "upload_type": upload_type,
+                        "chunks": total_chunks,
+                        "content_hash": content_hash,
+                        "duplicate": duplicate,
+                        "compression": stored["compression"],
+                        "content_encoding": encoding
+                    },
+                    severity=ThreatLevel.NORMAL,
+                    processed=False,
+                    file_path=final_path,
+                    file_size=file_size,
+                    content_hash=content_hash,
+                    user_id=current_user.id
+                )
+                
+                db.add(log_entry)
+                db.flush()
+                if duplicate:
+                    AnalysisService().reuse_existing_results(db, log_entry)
+                db.commit()
+                db.refresh(log_entry)
+                
+            except HTTPException:
+                raise
+            except Exception as e:
+                # Only this request may finalize, so hand that back to the next
+                # request for the upload with the assembled bytes where it expects them
+                db.rollback()
+                if stored and not os.path.exists(partial_path):
+                    # The assembled file was renamed into a blob other uploads may
+                    # share by now, so put back a copy
+                    shutil.copyfile(stored["file_path"], partial_path)
+                session_store.release(file_id)
+                logger.error("Chunked upload finalization failed, released for retry",
+                             error=str(e), user_id=current_user.id, file_id=file_id)
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Upload could not be finalized; re-send the last chunk to retry"
+                )
             
-            db.add(log_entry)
-            db.commit()
-            db.refresh(log_entry)
+            # Clean up progress; a rewritten file leaves the assembled one behind
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            session_store.delete(file_id)
             
-            # Clean up progress
-            del upload_progress[file_id]
+            archive = schedule_archive_expansion(background_tasks, log_entry.id, filename, chunk.content_type)
             
             logger.info("Large file upload completed", 
                        user_id=current_user.id,
@@ -411,18 +768,24 @@ async def upload_chunk(
                 "file_size": file_size,
                 "message": "File upload completed",
                 "status": "completed",
-                "upload_type": upload_type
+                "upload_type": upload_type,
+                "content_hash": content_hash,
+                "duplicate": duplicate,
+                "archive_expansion": "scheduled" if archive else None
             }
         else:
             # Return progress
-            progress = len(upload_progress[file_id]["received_chunks"]) / total_chunks * 100
+            progress = session["chunks_received"] / total_chunks * 100
             return {
                 "message": "Chunk uploaded successfully",
                 "progress": round(progress, 2),
-                "chunks_received": len(upload_progress[file_id]["received_chunks"]),
+                "chunks_received": session["chunks_received"],
+                "bytes_received": session["bytes_received"],
                 "total_chunks": total_chunks
             }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("Chunk upload failed", error=str(e), user_id=current_user.id)
         raise HTTPException(
@@ -436,36 +799,46 @@ async def get_upload_progress(
     current_user: User = Depends(get_current_user)
 ):
     """Get upload progress for a file"""
-    if file_id not in upload_progress:
+    progress_data = get_upload_session_store().get(file_id)
+    if progress_data is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Upload not found"
         )
     
-    progress_data = upload_progress[file_id]
     if progress_data["user_id"] != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
         )
     
-    progress = len(progress_data["received_chunks"]) / progress_data["total_chunks"] * 100
+    progress = progress_data["chunks_received"] / progress_data["total_chunks"] * 100
     return {
         "filename": progress_data["filename"],
         "progress": round(progress, 2),
-        "chunks_received": len(progress_data["received_chunks"]),
+        "chunks_received": progress_data["chunks_received"],
+        "bytes_received": progress_data["bytes_received"],
         "total_chunks": progress_data["total_chunks"]
     }
 
 @router.post("/upload-streaming")
 async def upload_streaming(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     upload_type: Optional[str] = Form("text"),
     resume_upload_id: Optional[str] = Form(None),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Streaming upload for very large files (20GB+)"""
+    """
+    Streaming upload for very large files (20GB+)
+    
+    gzip/zstd files (part Content-Encoding, ``.gz`` / ``.zst`` name or
+    content type) are decompressed while they are written; MAX_FILE_SIZE
+    then applies to the decompressed size. Encoded uploads cannot be
+    resumed, since a resume offset into the decoded output does not map
+    back to the compressed body.
+    """
     try:
         # Validate file type
         if not is_valid_file_type(file.content_type or "", file.filename or ""):
@@ -474,38 +847,49 @@ async def upload_streaming(
                 detail=f"File type not allowed: {file.content_type} ({file.filename})"
             )
         
+        encoding = resolve_upload_encoding(file.filename, file.content_type, file.headers.get("content-encoding"))
+        if encoding and resume_upload_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Compressed uploads cannot be resumed; upload the whole file again"
+            )
+        
         # Generate or use existing upload ID
         upload_id = resume_upload_id or str(uuid.uuid4())
         temp_file_path = os.path.join(settings.TEMP_UPLOAD_DIR, f"{upload_id}.tmp")
         
-        # Create temp directory if it doesn't exist
-        os.makedirs(os.path.dirname(temp_file_path), exist_ok=True)
-        
-        # Stream the file content directly to disk
-        total_size = 0
-        chunk_size = 1024 * 1024  # 1MB buffer for streaming
-        
-        mode = 'ab' if resume_upload_id and os.path.exists(temp_file_path) else 'wb'
-        
-        async with aiofiles.open(temp_file_path, mode) as f:
-            while True:
-                chunk = await file.read(chunk_size)
-                if not chunk:
-                    break
-                await f.write(chunk)
-                total_size += len(chunk)
-                
-                # Check if we're approaching memory limits
-                if total_size > settings.MAX_FILE_SIZE:
-                    await f.close()
-                    os.remove(temp_file_path)
-                    raise HTTPException(
-                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                        detail=f"File size exceeds maximum allowed size of {settings.MAX_FILE_SIZE / (1024**3):.1f}GB"
-                    )
+        # Stream the file content directly to disk, decoding and hashing as it goes
+        hasher = hashlib.sha256()
+        if encoding:
+            stored_name, stored_type = decoded_filename(file.filename or "", encoding), None
+        else:
+            stored_name, stored_type = file.filename, file.content_type
+        codec = should_compress(stored_name, stored_type)
+        try:
+            final_size = await write_stream(
+                decode_stream(iter_upload_file(file), encoding),
+                temp_file_path,
+                append=bool(resume_upload_id) and os.path.exists(temp_file_path),
+                keep_partial=not encoding,
+                hasher=hasher,
+                codec=codec,
+                line_index=is_text_file(stored_name, stored_type)
+            )
+        except UploadTooLargeError as e:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(e)
+            )
+        except InvalidEncodingError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
         
-        # Get final file size
-        final_size = os.path.getsize(temp_file_path)
+        # Move the completed file into content-addressed storage
+        content_hash = hasher.hexdigest()
+        file_path, duplicate = commit_blob(temp_file_path, content_hash)
+        duplicate = duplicate and content_hash in AnalysisService.owned_content(db, current_user.id, [content_hash])
         
         # Create log entry
         log_entry = SecurityLog(
@@ -515,23 +899,33 @@ async def upload_streaming(
             raw_message=f"Uploaded large file via streaming: {file.filename}",
             parsed_data={
                 "filename": file.filename,
-                "file_path": temp_file_path,
+                "file_path": file_path,
                 "file_size": final_size,
                 "upload_type": upload_type,
                 "upload_id": upload_id,
-                "upload_method": "streaming"
+                "upload_method": "streaming",
+                "content_hash": content_hash,
+                "duplicate": duplicate,
+                "compression": codec,
+                "content_encoding": encoding
             },
             severity=ThreatLevel.NORMAL,
             processed=False,
-            file_path=temp_file_path,
+            file_path=file_path,
             file_size=final_size,
+            content_hash=content_hash,
             user_id=current_user.id
         )
         
         db.add(log_entry)
+        db.flush()
+        if duplicate:
+            AnalysisService().reuse_existing_results(db, log_entry)
         db.commit()
         db.refresh(log_entry)
         
+        archive = schedule_archive_expansion(background_tasks, log_entry.id, file.filename, file.content_type)
+        
         logger.info("Streaming upload completed", 
                    user_id=current_user.id,
                    filename=file.filename,
@@ -546,7 +940,10 @@ async def upload_streaming(
             "message": "Large file uploaded successfully via streaming",
             "status": "completed",
             "upload_type": upload_type,
-            "upload_method": "streaming"
+            "upload_method": "streaming",
+            "content_hash": content_hash,
+            "duplicate": duplicate,
+            "archive_expansion": "scheduled" if archive else None
         }
         
     except HTTPException:
@@ -558,6 +955,189 @@ async def upload_streaming(
             detail=f"Failed to upload file via streaming: {str(e)}"
         )
 
+@router.post("/ingest")
+async def ingest_stream(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    x_filename: str = Header(...),
+    x_upload_type: Optional[str] = Header("text"),
+    x_upload_id: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Raw-body streaming ingest for very large files (20GB+)
+    
+    The request body is the file itself and metadata travels in headers
+    (X-Filename, X-Upload-Type, X-Upload-Id), so there is no multipart
+    spooling: every byte is written once, straight into UPLOAD_DIR.
+    Interrupted uploads keep their partial file and continue when the
+    same X-Upload-Id is sent again with the remaining bytes.
+    
+    Bodies sent with ``Content-Encoding: gzip`` or ``zstd`` are decompressed
+    while they are written and MAX_FILE_SIZE applies to the decompressed
+    size. Encoded bodies are not resumable.
+    """
+    content_type = request.headers.get("content-type", "")
+    x_filename = unquote(x_filename)  # clients percent-encode non-ASCII names
+    try:
+        # Validate file type
+        if not is_valid_file_type(content_type, x_filename):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"File type not allowed: {content_type} ({x_filename})"
+            )
+        
+        # Upload IDs become file names, so only accept UUIDs
+        try:
+            upload_id = str(uuid.UUID(x_upload_id)) if x_upload_id else str(uuid.uuid4())
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="X-Upload-Id must be a UUID"
+            )
+        
+        encoding = resolve_upload_encoding(x_filename, content_type, request.headers.get("content-encoding"))
+        
+        content_length = request.headers.get("content-length")
+        if content_length is not None and not content_length.isdigit():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid Content-Length"
+            )
+        
+        # Before touching the partial file: it may be another user's upload
+        claim_ingest(upload_id, current_user.id)
+        
+        partial_path = ingest_partial_path(upload_id)
+        # A decoded prefix cannot be continued from a compressed body
+        resuming = os.path.exists(partial_path) and not encoding
+        already_received = stored_size(partial_path) if resuming else 0
+        
+        # Reject oversized bodies before reading them when the length is known
+        if content_length is not None and already_received + int(content_length) > settings.MAX_FILE_SIZE:
+            release_ingest(upload_id)
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File size exceeds maximum allowed size of {settings.MAX_FILE_SIZE / (1024**3):.1f}GB"
+            )
+        
+        hasher = hashlib.sha256()
+        if encoding:
+            stored_name, stored_type = decoded_filename(x_filename, encoding), None
+        else:
+            stored_name, stored_type = x_filename, content_type
+        codec = should_compress(stored_name, stored_type)
+        try:
+            final_size = await write_stream(
+                decode_stream(request.stream(), encoding),
+                partial_path,
+                append=resuming,
+                keep_partial=not encoding,
+                hasher=hasher,
+                codec=codec,
+                line_index=is_text_file(stored_name, stored_type)
+            )
+        except UploadTooLargeError as e:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(e)
+            )
+        except InvalidEncodingError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        except ClientDisconnect:
+            logger.warning("Ingest interrupted, partial upload kept for resume",
+                          user_id=current_user.id,
+                          upload_id=upload_id,
+                          bytes_received=stored_size(partial_path) if os.path.exists(partial_path) else 0)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=(
+                    "Client disconnected; compressed uploads must be sent again" if encoding
+                    else f"Client disconnected; resume with X-Upload-Id: {upload_id}"
+                )
+            )
+        finally:
+            # Encoded bodies drop their partial file when they fail
+            release_ingest(upload_id)
+        
+        # Same filesystem, so this is a rename rather than a second copy
+        content_hash = hasher.hexdigest()
+        file_path, duplicate = commit_blob(partial_path, content_hash)
+        release_ingest(upload_id)
+        duplicate = duplicate and content_hash in AnalysisService.owned_content(db, current_user.id, [content_hash])
+        
+        # Create log entry only once the file is complete
+        log_entry = SecurityLog(
+            timestamp=datetime.utcnow(),
+            source="streaming_upload",
+            log_type=x_upload_type or "security_log",
+            raw_message=f"Uploaded large file via streaming ingest: {x_filename}",
+            parsed_data={
+                "filename": x_filename,
+                "file_path": file_path,
+                "file_size": final_size,
+                "content_type": content_type,
+                "upload_type": x_upload_type,
+                "upload_id": upload_id,
+                "upload_method": "ingest",
+                "resumed": resuming,
+                "content_hash": content_hash,
+                "duplicate": duplicate,
+                "compression": codec,
+                "content_encoding": encoding
+            },
+            severity=ThreatLevel.NORMAL,
+            processed=False,
+            file_path=file_path,
+            file_size=final_size,
+            content_hash=content_hash,
+            user_id=current_user.id
+        )
+        
+        db.add(log_entry)
+        db.flush()
+        if duplicate:
+            AnalysisService().reuse_existing_results(db, log_entry)
+        db.commit()
+        db.refresh(log_entry)
+        
+        archive = schedule_archive_expansion(background_tasks, log_entry.id, x_filename, content_type)
+        
+        logger.info("Streaming ingest completed", 
+                   user_id=current_user.id,
+                   filename=x_filename,
+                   log_id=log_entry.id,
+                   resumed=resuming,
+                   file_size_gb=final_size / (1024**3))
+        
+        return {
+            "log_id": log_entry.id,
+            "filename": x_filename,
+            "file_size": final_size,
+            "file_size_gb": round(final_size / (1024**3), 2),
+            "message": "Large file uploaded successfully via streaming ingest",
+            "status": "completed",
+            "upload_type": x_upload_type,
+            "upload_id": upload_id,
+            "upload_method": "ingest",
+            "content_hash": content_hash,
+            "duplicate": duplicate,
+            "archive_expansion": "scheduled" if archive else None
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Streaming ingest failed", error=str(e), user_id=current_user.id)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to ingest file: {str(e)}"
+        )
+
 @router.post("/upload-resume")
 async def resume_upload(
     upload_id: str = Form(...),
@@ -568,14 +1148,20 @@ async def resume_upload(
     try:
         temp_file_path = os.path.join(settings.TEMP_UPLOAD_DIR, f"{upload_id}.tmp")
         
+        # Raw-body ingests keep their partial file in UPLOAD_DIR
+        if not os.path.exists(temp_file_path):
+            temp_file_path = ingest_partial_path(upload_id)
+            if os.path.exists(temp_file_path):
+                check_ingest_owner(upload_id, current_user.id)
+        
         if not os.path.exists(temp_file_path):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Upload session not found"
             )
         
-        # Get file info
-        file_size = os.path.getsize(temp_file_path)
+        # Get file info (uncompressed bytes received so far)
+        file_size = stored_size(temp_file_path)
         
         return {
             "upload_id": upload_id,
@@ -603,15 +1189,22 @@ async def cancel_upload(
     try:
         temp_file_path = os.path.join(settings.TEMP_UPLOAD_DIR, f"{upload_id}.tmp")
         
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-            logger.info("Upload cancelled", user_id=current_user.id, upload_id=upload_id)
+        if os.path.exists(ingest_partial_path(upload_id)):
+            check_ingest_owner(upload_id, current_user.id)
+        
+        for path in (temp_file_path, ingest_partial_path(upload_id)):
+            if os.path.exists(path):
+                remove_stored_file(path)
+                logger.info("Upload cancelled", user_id=current_user.id, upload_id=upload_id)
+        release_ingest(upload_id)
         
         return {
             "message": "Upload cancelled successfully",
             "upload_id": upload_id
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("Cancel upload failed", error=str(e), user_id=current_user.id)
         raise HTTPException(
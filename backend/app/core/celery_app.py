@@ -1,6 +1,10 @@
 from celery import Celery
+from celery.signals import worker_init, worker_process_init
+from celery.worker.control import inspect_command
+from kombu import Queue
 from app.core.config import settings
 import structlog
+import os
 
 logger = structlog.get_logger()
 
@@ -25,19 +29,81 @@ celery_app.conf.update(
     worker_prefetch_multiplier=1,
     worker_max_tasks_per_child=1000,
     broker_connection_retry_on_startup=True,
+    # A worker consuming several lanes takes turns between them instead of
+    # draining them in -Q order, so a busy lane never starves the others
+    broker_transport_options={'queue_order_strategy': 'round_robin'},
 )
 
+# One queue per analysis lane (see ANALYSIS_QUEUES); jobs are sent to their
+# lane explicitly and everything else in analysis_tasks goes to "normal"
+celery_app.conf.task_queues = [
+    Queue('celery'),
+    Queue('notifications'),
+    *(Queue(queue) for queue in settings.ANALYSIS_QUEUES.values()),
+]
+
 # Task routing
 celery_app.conf.task_routes = {
-    'app.tasks.analysis_tasks.*': {'queue': 'analysis'},
+    # Off the analysis lanes, so it runs while they are saturated
+    'app.tasks.analysis_tasks.pump_fair_queues_task': {'queue': 'celery'},
+    'app.tasks.analysis_tasks.*': {'queue': settings.ANALYSIS_QUEUES['normal']},
     'app.tasks.notification_tasks.*': {'queue': 'notifications'},
 }
 
 @celery_app.on_after_configure.connect
 def setup_periodic_tasks(sender, **kwargs):
     """Setup periodic tasks"""
-    # Add periodic tasks here if needed
-    pass
+    # Backstop for the fair queues: shards are normally released as others
+    # finish, this recovers slots of shards whose worker was lost
+    sender.add_periodic_task(
+        60.0,
+        sender.signature('app.tasks.analysis_tasks.pump_fair_queues_task'),
+        name='pump analysis fair queues'
+    )
+
+@worker_init.connect
+def preload_models_before_fork(**kwargs):
+    """With WORKER_PRELOAD_BEFORE_FORK, load models in the parent so prefork children share them"""
+    if not settings.WORKER_PRELOAD_BEFORE_FORK:
+        return
+    from app.ml.registry import model_registry
+
+    model_registry.share_before_fork()
+
+@worker_process_init.connect
+def preload_models(**kwargs):
+    """Load and warm up WORKER_PRELOAD_MODELS once per worker process, before it takes tasks"""
+    from app.core.database import engine
+    from app.core.monitoring import process_memory
+    from app.ml.registry import model_registry
+    from app.services.result_cache import reset_after_fork
+
+    # Database and result cache connections opened before fork stay with the parent
+    engine.dispose(close=False)
+    reset_after_fork()
+
+    model_registry.preload()
+    try:
+        logger.info("Worker process ready", pid=os.getpid(), **process_memory())
+    except OSError:
+        pass  # No /proc outside Linux
+
+@inspect_command()
+def worker_memory(state, **kwargs):
+    """
+    RSS and PSS of this worker's parent and pool processes
+    
+    Run in the parent: ``celery -A app.core.celery_app inspect worker_memory``.
+    With WORKER_PRELOAD_BEFORE_FORK the children's PSS should sit well below
+    their RSS, the difference being the weights they share.
+    """
+    from app.core.monitoring import child_memory, process_memory
+
+    return {
+        'parent': {'pid': os.getpid(), **process_memory()},
+        'children': child_memory(),
+        'preload_before_fork': settings.WORKER_PRELOAD_BEFORE_FORK
+    }
 
 @celery_app.task(bind=True)
 def debug_task(self):
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List, Optional
+from typing import Dict, List, Optional
 import os
 
 class Settings(BaseSettings):
@@ -34,8 +34,24 @@ class Settings(BaseSettings):
     CHUNK_SIZE: int = 10 * 1024 * 1024  # 10MB chunks for very large files
     CHUNKED_UPLOAD_THRESHOLD: int = 50 * 1024 * 1024  # 50MB threshold for chunked upload
     STREAMING_UPLOAD_THRESHOLD: int = 1024 * 1024 * 1024  # 1GB threshold for streaming upload
+    UPLOAD_BUFFER_SIZE: int = 1024 * 1024  # 1MB read buffer when streaming uploads to disk
+    FOLDER_UPLOAD_CONCURRENCY: int = 8  # Files streamed to disk in parallel per folder upload
+    COMPRESSED_STORAGE: Optional[str] = None  # "gzip" or "zstd" to compress text uploads at rest
+    COMPRESSION_FRAME_SIZE: int = 4 * 1024 * 1024  # Uncompressed bytes per independently seekable frame
+    LINE_INDEX_INTERVAL: int = 1024  # Record the byte offset of every Nth line of text uploads
+    
+    # ZIP expansion limits (zip-bomb protection, checked against actual decompressed bytes)
+    ZIP_MAX_MEMBERS: int = 100000
+    ZIP_MAX_MEMBER_SIZE: int = 25 * 1024 * 1024 * 1024  # 25GB per member
+    ZIP_MAX_TOTAL_SIZE: int = 100 * 1024 * 1024 * 1024  # 100GB per archive
+    ZIP_MAX_COMPRESSION_RATIO: int = 200  # Text logs compress 10-20x; bombs reach 1000x
+    ZIP_INSERT_BATCH_SIZE: int = 1000  # Member rows per bulk insert
     UPLOAD_DIR: str = "./uploads"
     TEMP_UPLOAD_DIR: str = "./uploads/temp"
+    UPLOAD_SESSION_BACKEND: str = "sqlite"  # "redis" to share chunked uploads across hosts
+    UPLOAD_SESSION_SQLITE_PATH: str = "./uploads/upload_sessions.db"
+    UPLOAD_SESSION_TTL: int = 24 * 60 * 60  # Expire idle chunked uploads after 24 hours
+    UPLOAD_SWEEP_INTERVAL: int = 60 * 60  # How often the API removes partial uploads idle for UPLOAD_SESSION_TTL
     ALLOWED_FILE_TYPES: List[str] = [
         "text/plain",
         "text/csv",
@@ -64,6 +80,73 @@ class Settings(BaseSettings):
     BERT_MODEL_NAME: str = "bert-base-uncased"
     RESNET_MODEL_PATH: str = "models/resnet_security.pth"
     ENSEMBLE_MODEL_PATH: str = "models/ensemble_security.pkl"
+    MODEL_VERSION: str = "1.0.0"  # Recorded on every AnalysisResult
+    WORKER_PRELOAD_MODELS: List[str] = ["text", "visual"]  # Loaded and warmed up in every Celery worker process
+    WORKER_PRELOAD_BEFORE_FORK: bool = False  # Load them once in the Celery parent; prefork children share the weights
+    INFERENCE_BACKEND: str = "eager"  # "eager", "torchscript" or "onnx"; exported with python -m app.ml.export
+    INFERENCE_ARTIFACT_DIR: str = "models/exported"  # Where exported models and their manifests live
+    
+    # Log analysis pipeline
+    ANALYSIS_BATCH_SIZE: int = 32  # Records per text analyzer call
+    ANALYSIS_TOKEN_BUDGET: int = 2048  # Padded tokens per batched BERT forward pass
+    ANALYSIS_INSERT_BATCH_SIZE: int = 1000  # AnalysisResult rows per bulk insert
+    ANALYSIS_MAX_RECORD_LENGTH: int = 8192  # Longer records are truncated before analysis
+    ANALYSIS_STORE_NORMAL_RESULTS: bool = False  # Also persist per-record results for normal records
+    ANALYSIS_EXECUTOR: str = "background"  # "celery" to fan analysis out to the worker cluster
+    ANALYSIS_SHARD_SIZE: int = 64 * 1024 * 1024  # Bytes of a log file per Celery shard task
+    ANALYSIS_CANCEL_CHECK_INTERVAL: float = 2.0  # Seconds between cancellation checks in workers
+    ANALYSIS_LEASE_TIMEOUT: int = 10 * 60  # A run that wrote nothing for this long is presumed dead and can be resumed
+    
+    # Priority lanes: jobs are classified at submission and routed to one queue per lane
+    ANALYSIS_INTERACTIVE_MAX_BYTES: int = 1024 * 1024  # /trigger jobs up to this size are interactive
+    ANALYSIS_BULK_MIN_BYTES: int = 1024 * 1024 * 1024  # Jobs from this size up are bulk
+    ANALYSIS_QUEUES: Dict[str, str] = {
+        "interactive": "analysis_interactive",
+        "normal": "analysis",
+        "bulk": "analysis_bulk"
+    }
+    
+    # Per-tenant fair scheduling of Celery shards within each lane
+    FAIR_TENANT_KEY: str = "company"  # Tenants are companies ("company", users without one stand alone) or "user"
+    TENANT_WEIGHTS: Dict[str, float] = {}  # Tenant (company name or user id) -> share of its lane
+    TENANT_DEFAULT_WEIGHT: float = 1.0
+    FAIR_MAX_IN_FLIGHT: Dict[str, int] = {  # Shards handed to Celery at a time per lane
+        "interactive": 4,
+        "normal": 8,
+        "bulk": 8
+    }
+    FAIR_IN_FLIGHT_TIMEOUT: int = 35 * 60  # Free the slot of a shard not reported back after this
+    
+    # Admission control: refuse jobs whose lane backlog would take too long to drain
+    ADMISSION_CONTROL: bool = True
+    ADMISSION_MAX_WAIT: Dict[str, int] = {  # Seconds of estimated queue wait accepted per lane
+        "interactive": 5 * 60,
+        "normal": 2 * 60 * 60,
+        "bulk": 24 * 60 * 60
+    }
+    ADMISSION_THROUGHPUT_WINDOW: int = 15 * 60  # Seconds of recent jobs lane throughput is measured over
+    ADMISSION_DEFAULT_THROUGHPUT: int = 1024 * 1024  # Bytes/s assumed for a lane with no recent jobs
+    
+    # Triage tier ahead of the text model
+    ANALYSIS_TRIAGE: bool = True  # Give obviously normal lines a fast verdict instead of running BERT
+    TRIAGE_THRESHOLD: float = 0.2  # Lines scoring below this are not escalated
+    TRIAGE_MODEL_PATH: Optional[str] = None  # Fitted weights (.npz); built-in priors when unset
+    
+    # Log template mining: one model call per message shape
+    ANALYSIS_TEMPLATES: bool = True  # Propagate a representative line's verdict to its template
+    TEMPLATE_DEPTH: int = 4  # Parse tree depth (token count + depth - 2 prefix tokens)
+    TEMPLATE_SIMILARITY: float = 0.4  # Fraction of matching tokens to join a template
+    TEMPLATE_MAX_CHILDREN: int = 100  # Children per parse tree node
+    TEMPLATE_MAX_TEMPLATES: int = 10000  # Templates kept per log range
+    TEMPLATE_EXAMPLES: int = 3  # Example variable sets kept per template
+    TEMPLATE_SUMMARY_LIMIT: int = 50  # Templates reported per log
+    
+    # Analyzer result cache, keyed by content hash, model name and model version
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_BACKEND: Optional[str] = "sqlite"  # "redis" to share across hosts, empty for in-process only
+    RESULT_CACHE_SQLITE_PATH: str = "./models/result_cache.db"
+    RESULT_CACHE_LRU_SIZE: int = 10000  # Entries in each process's in-memory tier
+    RESULT_CACHE_TTL: int = 7 * 24 * 60 * 60  # Shared tier entries expire after a week
     
     # Monitoring
     PROMETHEUS_PORT: int = 9090
@@ -49,7 +49,7 @@ async def init_db():
     """Initialize database tables"""
     try:
         # Import all models to ensure they are registered
-        from app.models.database import User, AnalysisResult, SecurityLog, Alert, SystemMetrics, ModelPerformance, AuditLog, FileUpload, ThreatIntelligence
+        from app.models.database import User, AnalysisResult, AnalysisJob, AnalysisCheckpoint, SecurityLog, Alert, SystemMetrics, ModelPerformance, AuditLog, FileUpload, ThreatIntelligence
         
         # Create all tables
         Base.metadata.create_all(bind=engine)
@@ -1,6 +1,7 @@
 from prometheus_client import start_http_server, Counter, Histogram, Gauge
 import structlog
-from typing import Optional
+from typing import Dict, List, Optional
+import os
 from app.core.config import settings
 
 logger = structlog.get_logger()
@@ -12,6 +13,21 @@ THREAT_DETECTIONS = Counter('vista_threat_detections_total', 'Total threat detec
 ACTIVE_USERS = Gauge('vista_active_users', 'Number of active users')
 SYSTEM_MEMORY = Gauge('vista_system_memory_bytes', 'System memory usage')
 SYSTEM_CPU = Gauge('vista_system_cpu_percent', 'System CPU usage')
+ANALYSIS_JOB_LATENCY = Histogram(
+    'vista_analysis_job_latency_seconds', 'Analysis job time from submission to completion', ['priority'],
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600, 4 * 3600, 24 * 3600)
+)
+RESULT_CACHE_LOOKUPS = Counter('vista_result_cache_lookups_total', 'Analyzer result cache lookups', ['kind', 'tier', 'outcome'])
+ANALYSIS_BACKLOG = Gauge('vista_analysis_backlog_bytes', 'Bytes waiting or running per analysis lane', ['priority'])
+ANALYSIS_THROUGHPUT = Gauge('vista_analysis_throughput_bytes_per_second', 'Measured analysis throughput per lane', ['priority'])
+ANALYSIS_ADMISSIONS = Counter('vista_analysis_admissions_total', 'Analysis job admission decisions', ['priority', 'outcome'])
+MODEL_LOAD_SECONDS = Gauge('vista_model_load_seconds', 'Time this process took to load a model', ['model'])
+MODEL_WARM = Gauge('vista_model_warm', 'Whether a loaded model has been warmed up (1) or not (0)', ['model'])
+TENANT_QUEUE_DEPTH = Gauge('vista_tenant_queue_depth', 'Analysis shards waiting per tenant', ['lane', 'tenant'])
+TENANT_WAIT_TIME = Histogram(
+    'vista_tenant_wait_seconds', 'Time an analysis shard waited in the fair queue', ['lane', 'tenant'],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600, 4 * 3600)
+)
 
 def setup_monitoring():
     """Setup Prometheus monitoring"""
@@ -28,10 +44,82 @@ def record_analysis_request(analysis_type: str, status: str, duration: Optional[
     if duration is not None:
         ANALYSIS_DURATION.labels(type=analysis_type).observe(duration)
 
+def record_job_latency(priority: str, seconds: float):
+    """Record the submission-to-completion time of an analysis job"""
+    ANALYSIS_JOB_LATENCY.labels(priority=priority).observe(seconds)
+
+def update_lane_backlog(priority: str, backlog_bytes: int, throughput: float):
+    """Update the backlog and throughput gauges of an analysis lane"""
+    ANALYSIS_BACKLOG.labels(priority=priority).set(backlog_bytes)
+    ANALYSIS_THROUGHPUT.labels(priority=priority).set(throughput)
+
+def record_admission(priority: str, admitted: bool):
+    """Record an admission control decision"""
+    ANALYSIS_ADMISSIONS.labels(priority=priority, outcome='admitted' if admitted else 'refused').inc()
+
+def record_model_load(model: str, seconds: float):
+    """Record how long a model took to load"""
+    MODEL_LOAD_SECONDS.labels(model=model).set(seconds)
+
+def record_model_warm(model: str, warm: bool):
+    """Record whether a loaded model has been warmed up"""
+    MODEL_WARM.labels(model=model).set(1 if warm else 0)
+
 def record_threat_detection(severity: str, threat_type: str):
     """Record threat detection metrics"""
     THREAT_DETECTIONS.labels(severity=severity, type=threat_type).inc()
 
+def record_cache_lookup(kind: str, tier: str, hit: bool):
+    """Record a result cache hit or miss"""
+    RESULT_CACHE_LOOKUPS.labels(kind=kind, tier=tier, outcome='hit' if hit else 'miss').inc()
+
+def record_tenant_queue_depth(lane: str, tenant: str, depth: int):
+    """Record how many shards a tenant has waiting in a lane"""
+    TENANT_QUEUE_DEPTH.labels(lane=lane, tenant=tenant).set(depth)
+
+def record_tenant_wait(lane: str, tenant: str, seconds: float):
+    """Record how long a shard waited before being handed to Celery"""
+    TENANT_WAIT_TIME.labels(lane=lane, tenant=tenant).observe(seconds)
+
+def process_memory(pid="self") -> Dict[str, int]:
+    """
+    Resident memory of a process, in bytes, from /proc/<pid>/smaps_rollup (Linux)
+    
+    ``pss`` charges each shared page to its sharers in equal parts, so the
+    PSS of prefork children that share weights copy-on-write adds up to the
+    real footprint where their RSS counts the weights once per child.
+    """
+    fields = {
+        'Rss': 'rss',
+        'Pss': 'pss',
+        'Shared_Clean': 'shared_clean',
+        'Shared_Dirty': 'shared_dirty',
+        'Private_Clean': 'private_clean',
+        'Private_Dirty': 'private_dirty'
+    }
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in fields:
+                memory[fields[key]] = int(value.split()[0]) * 1024
+    return memory
+
+def child_memory(parent_pid: Optional[int] = None) -> List[Dict]:
+    """process_memory of every child of ``parent_pid`` (default: this process), with its pid"""
+    parent_pid = parent_pid or os.getpid()
+    report = []
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                # ppid is the second field after the parenthesized command name
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            if ppid == parent_pid:
+                report.append({'pid': int(pid), **process_memory(pid)})
+        except (OSError, IndexError, ValueError):
+            continue  # Exited while being read
+    return report
+
 def update_active_users(count: int):
     """Update active users gauge"""
     ACTIVE_USERS.set(count)
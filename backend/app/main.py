@@ -3,6 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import time
 import structlog
 from prometheus_client import Counter, Histogram
@@ -12,6 +13,7 @@ from app.core.config import settings
 from app.core.database import init_db
 from app.api.v1.api import api_router
 from app.core.monitoring import setup_monitoring
+from app.services.upload_storage import sweep_abandoned_uploads
 
 # Configure structured logging
 structlog.configure(
@@ -38,6 +40,15 @@ logger = structlog.get_logger()
 REQUEST_COUNT = Counter('vista_requests_total', 'Total requests', ['method', 'endpoint', 'status'])
 REQUEST_DURATION = Histogram('vista_request_duration_seconds', 'Request duration', ['method', 'endpoint'])
 
+async def sweep_uploads_periodically():
+    """Remove abandoned partial uploads every UPLOAD_SWEEP_INTERVAL seconds"""
+    while True:
+        try:
+            await asyncio.to_thread(sweep_abandoned_uploads)
+        except Exception as e:
+            logger.error("Partial upload sweep failed", error=str(e))
+        await asyncio.sleep(settings.UPLOAD_SWEEP_INTERVAL)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan events"""
@@ -45,12 +56,14 @@ async def lifespan(app: FastAPI):
     logger.info("Starting VISTA AI Cybersecurity Platform")
     await init_db()
     setup_monitoring()
+    sweeper = asyncio.create_task(sweep_uploads_periodically())
     logger.info("VISTA platform started successfully")
     
     yield
     
     # Shutdown
     logger.info("Shutting down VISTA platform")
+    sweeper.cancel()
 
 def create_app() -> FastAPI:
     """Create and configure FastAPI application"""
@@ -0,0 +1,141 @@
+"""
+Export the text and visual models for the torchscript or onnx inference backend.
+
+    python -m app.ml.export --backend onnx --models text visual
+
+Artifacts are written to INFERENCE_ARTIFACT_DIR with a manifest naming the
+model and version they were exported from; analyzers only run an artifact
+whose manifest matches their own model (see app.ml.inference). Export
+again whenever the weights change.
+"""
+from typing import List, Optional
+import argparse
+import inspect
+import os
+import time
+import structlog
+import torch
+import torch.nn as nn
+
+from app.core.config import settings
+from app.ml.inference import ARTIFACT_SUFFIXES, artifact_path, write_manifest
+
+logger = structlog.get_logger()
+
+ONNX_OPSET = 17
+
+SAMPLE_LINES = [
+    "2024-01-15 10:30:15 WARNING Failed login attempt from IP 10.0.0.1 for user admin",
+    "GET /index.html 200",
+]
+
+
+class TextExportWrapper(nn.Module):
+    """BERT with positional inputs, returning logits and the last layer's attentions only"""
+
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor):
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask,
+                             output_attentions=True, return_dict=True)
+        return outputs.logits, outputs.attentions[-1]
+
+
+def export_network(network: nn.Module, inputs: tuple, path: str, backend: str,
+                   input_names: List[str], output_names: List[str], dynamic_axes: dict) -> None:
+    """Trace ``network`` on example ``inputs`` and save it as a TorchScript or ONNX artifact"""
+    network.eval()
+    with torch.no_grad():
+        if backend == "torchscript":
+            traced = torch.jit.trace(network, inputs, check_trace=False)
+            torch.jit.freeze(traced).save(path)
+            return
+        kwargs = {}
+        # Newer torch defaults to the dynamo exporter; the tracing one handles BERT's dynamic axes
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            kwargs["dynamo"] = False
+        torch.onnx.export(network, inputs, path, input_names=input_names, output_names=output_names,
+                          dynamic_axes=dynamic_axes, opset_version=ONNX_OPSET, do_constant_folding=True, **kwargs)
+
+
+def export_text(analyzer, backend: str, directory: Optional[str] = None) -> str:
+    """Export a SecurityTextAnalyzer's BERT with dynamic batch and sequence length"""
+    path = artifact_path("text", backend, directory)
+    # Two lines of different lengths, so the trace sees a padded batch
+    inputs = analyzer.tokenizer(SAMPLE_LINES, return_tensors="pt", padding=True)
+    sequence = {0: "batch", 1: "sequence"}
+    export_network(
+        TextExportWrapper(analyzer.model).to("cpu"),
+        (inputs["input_ids"], inputs["attention_mask"]),
+        path, backend,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits", "attentions"],
+        dynamic_axes={"input_ids": sequence, "attention_mask": sequence, "logits": {0: "batch"},
+                      "attentions": {0: "batch", 2: "sequence", 3: "sequence"}}
+    )
+    return path
+
+
+def export_visual(analyzer, backend: str, directory: Optional[str] = None) -> str:
+    """Export a SecurityVisualAnalyzer's ResNet with a dynamic batch size"""
+    path = artifact_path("visual", backend, directory)
+    export_network(
+        analyzer.model.to("cpu"),
+        (torch.zeros(2, 3, 224, 224),),
+        path, backend,
+        input_names=["image"],
+        output_names=["logits"],
+        dynamic_axes={"image": {0: "batch"}, "logits": {0: "batch"}}
+    )
+    return path
+
+
+EXPORTERS = {"text": export_text, "visual": export_visual}
+
+
+def export_model(kind: str, analyzer, backend: str, directory: Optional[str] = None) -> str:
+    """Export ``analyzer``'s network and record its model name and version in the manifest"""
+    os.makedirs(directory or settings.INFERENCE_ARTIFACT_DIR, exist_ok=True)
+    start_time = time.time()
+    path = EXPORTERS[kind](analyzer, backend, directory)
+    analyzer.model.to(analyzer.device)
+    write_manifest(
+        path,
+        kind=kind,
+        backend=backend,
+        model_name=analyzer.model_name,
+        model_version=analyzer.model_version,
+        torch_version=torch.__version__,
+        exported_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    )
+    logger.info("Model exported", model=kind, backend=backend, path=path, export_time=time.time() - start_time)
+    return path
+
+
+def load_analyzer(kind: str):
+    """A fresh analyzer with the weights the workers serve"""
+    if kind == "text":
+        from app.ml.models.text_analyzer import SecurityTextAnalyzer
+
+        return SecurityTextAnalyzer(model_name=settings.BERT_MODEL_NAME)
+    from app.ml.models.visual_analyzer import SecurityVisualAnalyzer
+
+    return SecurityVisualAnalyzer(model_path=settings.RESNET_MODEL_PATH)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export models for the torchscript or onnx inference backend")
+    parser.add_argument("--backend", choices=sorted(ARTIFACT_SUFFIXES), default="onnx")
+    parser.add_argument("--models", nargs="+", choices=sorted(EXPORTERS), default=sorted(EXPORTERS))
+    parser.add_argument("--output-dir", default=None, help="defaults to INFERENCE_ARTIFACT_DIR")
+    args = parser.parse_args(argv)
+
+    for kind in args.models:
+        path = export_model(kind, load_analyzer(kind), args.backend, args.output_dir)
+        print(f"{kind}: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+from typing import Dict, Optional, Tuple
+import json
+import os
+import structlog
+import torch
+
+from app.core.config import settings
+
+try:
+    import onnxruntime
+except ImportError:  # ONNX Runtime is optional; without it the onnx backend falls back to eager
+    onnxruntime = None
+
+logger = structlog.get_logger()
+
+INFERENCE_BACKENDS = ("eager", "torchscript", "onnx")
+
+# Artifact file per exported backend, written by app.ml.export
+ARTIFACT_SUFFIXES = {"torchscript": ".pt", "onnx": ".onnx"}
+
+# Sidecar next to an artifact recording which weights it was exported from
+MANIFEST_SUFFIX = ".json"
+
+
+def artifact_path(kind: str, backend: str, directory: Optional[str] = None) -> str:
+    """Path of the ``kind`` ("text" or "visual") model exported for ``backend``"""
+    return os.path.join(directory or settings.INFERENCE_ARTIFACT_DIR, f"{kind}{ARTIFACT_SUFFIXES[backend]}")
+
+
+def write_manifest(path: str, **fields) -> None:
+    """Record ``fields`` (model name, version, ...) next to an exported artifact"""
+    with open(path + MANIFEST_SUFFIX, "w") as f:
+        json.dump(fields, f, indent=2)
+
+
+def read_manifest(path: str) -> Optional[Dict]:
+    """The manifest of an exported artifact, None if either is missing"""
+    if not os.path.exists(path) or not os.path.exists(path + MANIFEST_SUFFIX):
+        return None
+    with open(path + MANIFEST_SUFFIX) as f:
+        return json.load(f)
+
+
+class ExportedModel:
+    """An exported network run with torch tensors in and a tuple of torch tensors out"""
+
+    def __init__(self, path: str, backend: str, device: torch.device):
+        self.path = path
+        self.backend = backend
+        self.device = device
+        if backend == "torchscript":
+            self.module = torch.jit.load(path, map_location=device)
+            self.module.eval()
+        else:
+            options = onnxruntime.SessionOptions()
+            # Same thread count as eager torch, so worker sizing does not change with the backend
+            options.intra_op_num_threads = torch.get_num_threads()
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+            self.input_names = [node.name for node in self.session.get_inputs()]
+
+    def __call__(self, *inputs: torch.Tensor) -> Tuple[torch.Tensor, ...]:
+        if self.backend == "torchscript":
+            outputs = self.module(*inputs)
+            return outputs if isinstance(outputs, tuple) else (outputs,)
+        feeds = {name: tensor.detach().cpu().numpy() for name, tensor in zip(self.input_names, inputs)}
+        return tuple(torch.from_numpy(output).to(self.device) for output in self.session.run(None, feeds))
+
+
+def load_exported(kind: str, backend: str, model_name: str, model_version: str,
+                  device: torch.device, directory: Optional[str] = None) -> Optional[ExportedModel]:
+    """
+    Open the ``kind`` model exported for ``backend``, or None to run eager.
+
+    An artifact is only used if its manifest names the analyzer's current
+    model and version: weights loaded or trained after the export would
+    otherwise be silently ignored. Unknown backends, a missing runtime or
+    artifact, stale artifacts and load errors all fall back to eager with
+    a warning rather than failing the analyzer.
+    """
+    if backend == "eager":
+        return None
+    if backend not in ARTIFACT_SUFFIXES:
+        logger.warning("Unknown inference backend, running eager", backend=backend, model=kind)
+        return None
+    if backend == "onnx" and onnxruntime is None:
+        logger.warning("onnxruntime not installed, running eager", model=kind)
+        return None
+
+    path = artifact_path(kind, backend, directory)
+    manifest = read_manifest(path)
+    if manifest is None:
+        logger.warning("No exported model, running eager (see app.ml.export)", backend=backend, model=kind, path=path)
+        return None
+    if manifest.get("model_name") != model_name or manifest.get("model_version") != model_version:
+        logger.warning("Exported model is stale, running eager", backend=backend, model=kind, path=path,
+                       exported_version=manifest.get("model_version"), model_version=model_version)
+        return None
+
+    try:
+        exported = ExportedModel(path, backend, device)
+    except Exception as e:
+        logger.error("Failed to load exported model, running eager", backend=backend, model=kind, error=str(e))
+        return None
+    logger.info("Exported model loaded", backend=backend, model=kind, path=path, model_version=model_version)
+    return exported
+
+
+class InferenceBackend:
+    """
+    The inference backend an analyzer runs its network with.
+
+    Exported models are opened on first use rather than at construction:
+    an ONNX Runtime session's thread pool does not survive fork, so with
+    WORKER_PRELOAD_BEFORE_FORK each prefork child opens its own. The model
+    is reopened whenever the analyzer's model name, version or device
+    changes, e.g. after ``load_model``.
+    """
+
+    def __init__(self, kind: str, backend: Optional[str] = None, directory: Optional[str] = None):
+        self.kind = kind
+        self.name = backend or settings.INFERENCE_BACKEND
+        self.directory = directory
+        self._exported: Optional[ExportedModel] = None
+        self._key = None
+
+    def get(self, model_name: str, model_version: str, device: torch.device) -> Optional[ExportedModel]:
+        """The exported model to run, None to run the eager one"""
+        if self.name == "eager":
+            return None
+        key = (model_name, model_version, str(device))
+        if key != self._key:
+            self._key = key
+            self._exported = load_exported(self.kind, self.name, model_name, model_version, device, self.directory)
+        return self._exported
@@ -9,8 +9,8 @@ import structlog
 from pathlib import Path
 
 from app.core.config import settings
-from app.ml.models.text_analyzer import TextAnalyzer
-from app.ml.models.visual_analyzer import VisualAnalyzer
+from app.ml.models.text_analyzer import SecurityTextAnalyzer as TextAnalyzer
+from app.ml.models.visual_analyzer import SecurityVisualAnalyzer as VisualAnalyzer
 
 logger = structlog.get_logger()
 
@@ -20,9 +20,10 @@ class EnsembleAnalyzer:
     for comprehensive threat detection
     """
     
-    def __init__(self):
-        self.text_analyzer = TextAnalyzer()
-        self.visual_analyzer = VisualAnalyzer()
+    def __init__(self, text_analyzer: TextAnalyzer = None, visual_analyzer: VisualAnalyzer = None):
+        # Shared analyzers (see ModelRegistry) are used as given, not reloaded
+        self.text_analyzer = text_analyzer or TextAnalyzer()
+        self.visual_analyzer = visual_analyzer or VisualAnalyzer()
         self.ensemble_model = None
         self.scaler = StandardScaler()
         self.is_trained = False
@@ -198,10 +199,10 @@ class EnsembleAnalyzer:
         visual_prediction = None
         
         if text_data:
-            text_prediction = self.text_analyzer.predict(text_data)
+            text_prediction = self.text_analyzer.analyze(text_data)
         
         if image_data:
-            visual_prediction = self.visual_analyzer.predict(image_data)
+            visual_prediction = self.visual_analyzer.analyze_image_bytes(image_data)
         
         # Determine confidence and severity
         confidence = max(probabilities)
@@ -8,6 +8,11 @@ from typing import Dict, List, Tuple, Optional
 import structlog
 from datetime import datetime
 
+from app.core.config import settings
+from app.ml.models.triage import THREAT_KEYWORDS, IP_PATTERN, URL_PATTERN, SPECIAL_CHARS_PATTERN
+from app.ml.inference import InferenceBackend
+from app.services.result_cache import file_digest, get_result_cache, text_digest
+
 logger = structlog.get_logger()
 
 class SecurityTextAnalyzer:
@@ -17,7 +22,10 @@ class SecurityTextAnalyzer:
     
     def __init__(self, model_name: str = "bert-base-uncased", max_length: int = 512):
         self.model_name = model_name
+        self.model_version = settings.MODEL_VERSION
         self.max_length = max_length
+        self.token_budget = settings.ANALYSIS_TOKEN_BUDGET
+        self.result_cache = get_result_cache("text")
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         
         # Initialize BERT model and tokenizer
@@ -29,6 +37,9 @@ class SecurityTextAnalyzer:
         )
         self.model.to(self.device)
         
+        # Eager, or a TorchScript/ONNX export of self.model (see forward)
+        self.inference = InferenceBackend("text")
+        
         # TF-IDF for additional features
         self.tfidf = TfidfVectorizer(
             max_features=1000,
@@ -36,17 +47,12 @@ class SecurityTextAnalyzer:
             stop_words='english'
         )
         
-        # Threat indicators
-        self.threat_keywords = {
-            'critical': ['exploit', 'vulnerability', 'breach', 'hack', 'attack', 'malware', 'virus'],
-            'high': ['suspicious', 'unauthorized', 'failed', 'denied', 'blocked', 'firewall'],
-            'medium': ['warning', 'error', 'timeout', 'connection', 'port', 'scan'],
-            'low': ['info', 'debug', 'trace', 'log', 'access', 'request']
-        }
+        # Threat indicators (shared with the triage tier)
+        self.threat_keywords = {severity: list(keywords) for severity, keywords in THREAT_KEYWORDS.items()}
         
         # IP address patterns
-        self.ip_pattern = re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}\b')
-        self.url_pattern = re.compile(r'https?://[^\s<>"]+|www\.[^\s<>"]+')
+        self.ip_pattern = IP_PATTERN
+        self.url_pattern = URL_PATTERN
         
         logger.info("SecurityTextAnalyzer initialized", model_name=model_name, device=str(self.device))
     
@@ -92,7 +98,7 @@ class SecurityTextAnalyzer:
     
     def count_special_chars(self, text: str) -> int:
         """Count special characters that might indicate encoding or injection attempts"""
-        special_chars = re.findall(r'[<>\"\'&;(){}[\]]', text)
+        special_chars = SPECIAL_CHARS_PATTERN.findall(text)
         return len(special_chars)
     
     def calculate_uppercase_ratio(self, text: str) -> float:
@@ -114,6 +120,24 @@ class SecurityTextAnalyzer:
         return text
     
     def analyze(self, text: str) -> Dict:
+        """Analyze text for security threats, reusing the verdict for text seen before"""
+        if self.result_cache is None:
+            return self.analyze_uncached(text)
+        
+        start_time = datetime.now()
+        digest = text_digest(text)
+        result = self.result_cache.get(self.model_name, self.model_version, digest)
+        if result is not None:
+            result['processing_time'] = (datetime.now() - start_time).total_seconds()
+            result['cached'] = True
+            return result
+        
+        result = self.analyze_uncached(text)
+        if 'error' not in result:
+            self.result_cache.set(self.model_name, self.model_version, digest, result)
+        return result
+    
+    def analyze_uncached(self, text: str) -> Dict:
         """Analyze text for security threats"""
         start_time = datetime.now()
         
@@ -138,38 +162,17 @@ class SecurityTextAnalyzer:
             
             # Get model predictions
             with torch.no_grad():
-                outputs = self.model(**inputs)
-                logits = outputs.logits
-                attentions = outputs.attentions
+                logits, attentions = self.forward(inputs)
                 probabilities = torch.softmax(logits, dim=1)
                 
-                # Get prediction and confidence
-                prediction = torch.argmax(probabilities, dim=1).item()
-                confidence = float(torch.max(probabilities))
-                
                 # Get attention weights for explainability
                 attention_weights = self.extract_attention_weights(attentions, inputs['input_ids'])
             
             # Calculate processing time
             processing_time = (datetime.now() - start_time).total_seconds()
             
-            # Map prediction to threat level
-            threat_levels = ['normal', 'low', 'medium', 'high', 'critical']
-            threat_level = threat_levels[prediction]
-            
-            # Calculate additional risk score based on features
-            risk_score = self.calculate_risk_score(features, confidence)
-            
-            result = {
-                'threat_level': threat_level,
-                'confidence': confidence,
-                'risk_score': risk_score,
-                'features': features,
-                'attention_weights': attention_weights,
-                'processing_time': processing_time,
-                'model_name': self.model_name,
-                'prediction_probabilities': probabilities.cpu().numpy().tolist()[0]
-            }
+            result = self.prediction_result(features, probabilities[0], attention_weights, processing_time)
+            threat_level, confidence = result['threat_level'], result['confidence']
             
             logger.info("Text analysis completed",
                        threat_level=threat_level,
@@ -189,22 +192,57 @@ class SecurityTextAnalyzer:
                 'processing_time': (datetime.now() - start_time).total_seconds()
             }
     
-    def extract_attention_weights(self, attentions, input_ids) -> Dict:
-        """Extract attention weights for explainability"""
+    def forward(self, inputs: Dict) -> Tuple[torch.Tensor, Tuple[torch.Tensor, ...]]:
+        """
+        Logits and attentions for tokenized inputs, from the configured INFERENCE_BACKEND
+        
+        Exported models only return the last layer's attentions, which is
+        all ``extract_attention_weights`` reads.
+        """
+        exported = self.inference.get(self.model_name, self.model_version, self.device)
+        if exported is None:
+            outputs = self.model(**inputs)
+            return outputs.logits, outputs.attentions
+        logits, attentions = exported(inputs['input_ids'], inputs['attention_mask'])
+        return logits, (attentions,)
+    
+    def prediction_result(self, features: Dict, probabilities, attention_weights: Dict, processing_time: float) -> Dict:
+        """Analysis result from one text's features and class probabilities"""
+        prediction = int(torch.argmax(probabilities))
+        confidence = float(probabilities[prediction])
+        
+        # Map prediction to threat level
+        threat_levels = ['normal', 'low', 'medium', 'high', 'critical']
+        
+        return {
+            'threat_level': threat_levels[prediction],
+            'confidence': confidence,
+            # Calculate additional risk score based on features
+            'risk_score': self.calculate_risk_score(features, confidence),
+            'features': features,
+            'attention_weights': attention_weights,
+            'processing_time': processing_time,
+            'model_name': self.model_name,
+            'prediction_probabilities': probabilities.cpu().numpy().tolist()
+        }
+    
+    def extract_attention_weights(self, attentions, input_ids, index: int = 0, length: Optional[int] = None) -> Dict:
+        """Extract attention weights of the ``index``-th text of a batch, over its first ``length`` tokens"""
         if not attentions:
             return {}
         
-        # Get attention from last layer
-        last_attention = attentions[-1][0]  # Shape: (batch_size, num_heads, seq_len, seq_len)
+        # Get attention from last layer for this text
+        last_attention = attentions[-1][index]  # Shape: (num_heads, seq_len, seq_len)
         
         # Average across attention heads
-        avg_attention = torch.mean(last_attention, dim=1)  # Shape: (batch_size, seq_len, seq_len)
+        avg_attention = torch.mean(last_attention, dim=0)  # Shape: (seq_len, seq_len)
         
-        # Get attention to [CLS] token (first token)
-        cls_attention = avg_attention[0, 0, :].cpu().numpy()
+        # Get attention from the [CLS] token (first token), without padding
+        length = length or input_ids.shape[1]
+        cls_attention = avg_attention[0, :length].cpu().numpy()
         
         # Get tokens
-        tokens = self.tokenizer.convert_ids_to_tokens(input_ids[0].cpu().numpy())
+        tokens = self.tokenizer.convert_ids_to_tokens(input_ids[index][:length].cpu().numpy())
         
         # Create attention mapping
         attention_mapping = {}
@@ -238,11 +276,117 @@ class SecurityTextAnalyzer:
         return min(risk_score, 1.0)
     
     def batch_analyze(self, texts: List[str]) -> List[Dict]:
-        """Analyze multiple texts in batch"""
-        results = []
-        for text in texts:
-            result = self.analyze(text)
-            results.append(result)
+        """
+        Analyze multiple texts in batch, returning results in input order
+        
+        Cached verdicts are reused and repeated texts are analyzed once; the
+        rest go through ``analyze_uncached_batch``.
+        """
+        start_time = datetime.now()
+        results: List[Optional[Dict]] = [None] * len(texts)
+        misses: Dict[str, List[int]] = {}
+        
+        for i, text in enumerate(texts):
+            digest = text_digest(text)
+            if digest in misses:
+                misses[digest].append(i)
+                continue
+            if self.result_cache is not None:
+                result = self.result_cache.get(self.model_name, self.model_version, digest)
+                if result is not None:
+                    result['processing_time'] = (datetime.now() - start_time).total_seconds()
+                    result['cached'] = True
+                    results[i] = result
+                    continue
+            misses[digest] = [i]
+        
+        unique = list(misses.items())
+        computed = self.analyze_uncached_batch([texts[indices[0]] for _, indices in unique])
+        for (digest, indices), result in zip(unique, computed):
+            if self.result_cache is not None and 'error' not in result:
+                self.result_cache.set(self.model_name, self.model_version, digest, result)
+            for i in indices:
+                results[i] = result if i == indices[0] else dict(result)
+        return results
+    
+    def warm_up(self):
+        """Run a dummy line through tokenizer and model so the first real call is not slowed by setup"""
+        self.analyze_uncached_batch(["2024-01-15 10:30:15 INFO warm-up request from 127.0.0.1"])
+    
+    def length_buckets(self, lengths: List[int]) -> List[List[int]]:
+        """
+        Group text indices by token count into forward-pass buckets
+        
+        Indices are sorted by length and a bucket is closed before its size
+        times its longest member would exceed ``token_budget`` padded
+        tokens, so every bucket pads to a length close to its own texts'.
+        """
+        buckets, bucket = [], []
+        for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+            if bucket and (len(bucket) + 1) * lengths[i] > self.token_budget:
+                buckets.append(bucket)
+                bucket = []
+            bucket.append(i)
+        if bucket:
+            buckets.append(bucket)
+        return buckets
+    
+    def analyze_uncached_batch(self, texts: List[str]) -> List[Dict]:
+        """
+        Analyze texts with batched forward passes
+        
+        All texts are tokenized in one call without padding, bucketed by
+        length (``length_buckets``) and each bucket is padded to its longest
+        member only. A bucket that fails is retried text by text, so one bad
+        input only errors its own result.
+        """
+        if not texts:
+            return []
+        start_time = datetime.now()
+        processed = [self.preprocess_text(text) for text in texts]
+        input_ids = self.tokenizer(processed, truncation=True, max_length=self.max_length)['input_ids']
+        buckets = self.length_buckets([len(ids) for ids in input_ids])
+        
+        results: List[Optional[Dict]] = [None] * len(texts)
+        for bucket in buckets:
+            try:
+                bucket_results = self.forward_bucket([processed[i] for i in bucket], [input_ids[i] for i in bucket])
+            except Exception as e:
+                logger.warning("Batched text analysis failed, analyzing texts one by one",
+                               error=str(e), size=len(bucket))
+                bucket_results = [self.analyze_uncached(texts[i]) for i in bucket]
+            for i, result in zip(bucket, bucket_results):
+                results[i] = result
+        
+        logger.info("Batched text analysis completed",
+                    texts=len(texts),
+                    buckets=len(buckets),
+                    processing_time=(datetime.now() - start_time).total_seconds())
+        return results
+    
+    def forward_bucket(self, processed_texts: List[str], input_ids: List[List[int]]) -> List[Dict]:
+        """One padded forward pass over a bucket of tokenized texts"""
+        start_time = datetime.now()
+        inputs = self.tokenizer.pad({'input_ids': input_ids}, padding=True, return_tensors="pt")
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        
+        with torch.no_grad():
+            logits, attentions = self.forward(inputs)
+            probabilities = torch.softmax(logits, dim=1)
+        
+        results = [
+            self.prediction_result(
+                self.extract_features(text),
+                probabilities[row],
+                self.extract_attention_weights(attentions, inputs['input_ids'], row, len(input_ids[row])),
+                0.0
+            )
+            for row, text in enumerate(processed_texts)
+        ]
+        # The pass is shared, so each text is charged an equal part of it
+        processing_time = (datetime.now() - start_time).total_seconds() / len(results)
+        for result in results:
+            result['processing_time'] = processing_time
         return results
     
     def save_model(self, path: str):
@@ -251,7 +395,8 @@ class SecurityTextAnalyzer:
             'model_state_dict': self.model.state_dict(),
             'tokenizer': self.tokenizer,
             'tfidf': self.tfidf,
-            'threat_keywords': self.threat_keywords
+            'threat_keywords': self.threat_keywords,
+            'model_version': self.model_version
         }, path)
         logger.info("Model saved", path=path)
     
@@ -262,4 +407,6 @@ class SecurityTextAnalyzer:
         self.tokenizer = checkpoint['tokenizer']
         self.tfidf = checkpoint['tfidf']
         self.threat_keywords = checkpoint['threat_keywords']
-        logger.info("Model loaded", path=path) 
\ No newline at end of file
+        # New weights must not be served verdicts cached for the old ones
+        self.model_version = checkpoint.get('model_version') or f"{settings.MODEL_VERSION}+{file_digest(path)[:12]}"
+        logger.info("Model loaded", path=path, model_version=self.model_version) 
\ No newline at end of file
@@ -0,0 +1,136 @@
+import re
+import math
+import numpy as np
+from typing import Dict, List, Optional
+import structlog
+from datetime import datetime
+
+logger = structlog.get_logger()
+
+# Threat indicators shared with SecurityTextAnalyzer
+THREAT_KEYWORDS = {
+    'critical': ['exploit', 'vulnerability', 'breach', 'hack', 'attack', 'malware', 'virus'],
+    'high': ['suspicious', 'unauthorized', 'failed', 'denied', 'blocked', 'firewall'],
+    'medium': ['warning', 'error', 'timeout', 'connection', 'port', 'scan'],
+    'low': ['info', 'debug', 'trace', 'log', 'access', 'request']
+}
+
+IP_PATTERN = re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}\b')
+URL_PATTERN = re.compile(r'https?://[^\s<>"]+|www\.[^\s<>"]+')
+SPECIAL_CHARS_PATTERN = re.compile(r'[<>\"\'&;(){}[\]]')
+
+FEATURE_NAMES = [
+    'critical_keywords', 'high_keywords', 'medium_keywords', 'low_keywords',
+    'ip_addresses', 'urls', 'special_char_ratio', 'special_chars_log',
+    'uppercase_ratio', 'length_log'
+]
+
+# Hand-set priors for the linear model: any critical or high keyword, or a
+# dense run of injection characters, pushes a line over the default
+# threshold. ``TriageFilter.fit`` replaces them with weights learned from
+# labeled lines.
+DEFAULT_WEIGHTS = [3.0, 2.0, 0.5, 0.1, 0.3, 0.5, 6.0, 0.5, 1.0, 0.1]
+DEFAULT_BIAS = -3.0
+
+
+class TriageFilter:
+    """
+    Cheap first tier ahead of the BERT text analyzer.
+
+    Scores each line with a logistic model over a handful of features
+    (threat keyword counts, IP/URL matches, special character density,
+    uppercase ratio, length). Lines scoring below ``threshold`` are
+    obviously normal and get a fast verdict; the rest are suspicious or
+    uncertain and are escalated to the full model.
+    """
+
+    def __init__(self, threshold: float = 0.2, model_path: Optional[str] = None):
+        self.threshold = threshold
+        self.weights = np.array(DEFAULT_WEIGHTS, dtype=np.float64)
+        self.bias = DEFAULT_BIAS
+        self._keyword_patterns = {
+            severity: re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+            for severity, keywords in THREAT_KEYWORDS.items()
+        }
+        if model_path:
+            self.load_model(model_path)
+
+    def extract_features(self, text: str) -> List[float]:
+        """Feature vector of one line, in FEATURE_NAMES order"""
+        text_lower = text.lower()
+        # Distinct keywords per severity, as SecurityTextAnalyzer.count_threat_keywords counts them
+        keyword_counts = [
+            len(set(self._keyword_patterns[severity].findall(text_lower)))
+            for severity in ('critical', 'high', 'medium', 'low')
+        ]
+        length = max(len(text), 1)
+        special_chars = len(SPECIAL_CHARS_PATTERN.findall(text))
+        uppercase = sum(map(str.isupper, text))
+        return keyword_counts + [
+            min(len(IP_PATTERN.findall(text)), 3),
+            min(len(URL_PATTERN.findall(text)), 3),
+            special_chars / length,
+            math.log1p(special_chars),
+            uppercase / length,
+            math.log1p(length)
+        ]
+
+    def score_batch(self, texts: List[str]) -> np.ndarray:
+        """Probability that each line is a threat, according to the linear model"""
+        if not texts:
+            return np.zeros(0)
+        features = np.array([self.extract_features(text) for text in texts], dtype=np.float64)
+        return 1.0 / (1.0 + np.exp(-(features @ self.weights + self.bias)))
+
+    def triage(self, texts: List[str]) -> List[Optional[Dict]]:
+        """
+        Split a batch into fast verdicts and escalations.
+
+        Returns:
+            Per input line, in order: a normal analysis result for lines
+            below the threshold, or None for lines to escalate
+        """
+        start_time = datetime.now()
+        scores = self.score_batch(texts)
+        processing_time = (datetime.now() - start_time).total_seconds() / max(len(texts), 1)
+        return [
+            {
+                'threat_level': 'normal',
+                'confidence': float(1.0 - score),
+                'risk_score': float(score),
+                'features': {},
+                'processing_time': processing_time,
+                'model_name': 'triage'
+            } if score < self.threshold else None
+            for score in scores
+        ]
+
+    def fit(self, texts: List[str], labels: List[int]):
+        """
+        Learn weights from labeled lines (1 = threat, 0 = normal).
+
+        Classes are balanced, since real logs are overwhelmingly normal.
+        """
+        from sklearn.linear_model import LogisticRegression
+
+        features = np.array([self.extract_features(text) for text in texts], dtype=np.float64)
+        model = LogisticRegression(class_weight='balanced', max_iter=1000)
+        model.fit(features, labels)
+        self.weights = model.coef_[0].astype(np.float64)
+        self.bias = float(model.intercept_[0])
+        logger.info("Triage model fitted", samples=len(texts))
+        return self
+
+    def save_model(self, path: str):
+        """Save the linear model weights to disk"""
+        np.savez(path, weights=self.weights, bias=np.array([self.bias]), feature_names=np.array(FEATURE_NAMES))
+        logger.info("Triage model saved", path=path)
+
+    def load_model(self, path: str):
+        """Load linear model weights saved by ``save_model``"""
+        data = np.load(path)
+        if list(data['feature_names']) != FEATURE_NAMES:
+            raise ValueError(f"Triage model at {path} was trained on different features")
+        self.weights = data['weights'].astype(np.float64)
+        self.bias = float(data['bias'][0])
+        logger.info("Triage model loaded", path=path)
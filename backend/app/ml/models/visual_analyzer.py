@@ -9,6 +9,11 @@ from typing import Dict, List, Tuple, Optional
 import structlog
 from datetime import datetime
 import os
+import tempfile
+
+from app.core.config import settings
+from app.ml.inference import InferenceBackend
+from app.services.result_cache import file_digest, get_result_cache
 
 logger = structlog.get_logger()
 
@@ -20,6 +25,9 @@ class SecurityVisualAnalyzer:
     def __init__(self, model_path: Optional[str] = None, num_classes: int = 3):
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.num_classes = num_classes
+        self.model_name = 'resnet50_security'
+        self.model_version = settings.MODEL_VERSION
+        self.result_cache = get_result_cache("image")
         
         # Initialize ResNet model
         self.model = resnet50(weights=ResNet50_Weights.IMAGENET1K_V2)
@@ -41,6 +49,9 @@ class SecurityVisualAnalyzer:
         self.model.to(self.device)
         self.model.eval()
         
+        # Eager, or a TorchScript/ONNX export of self.model (see forward)
+        self.inference = InferenceBackend("visual")
+        
         # Image preprocessing
         self.transform = transforms.Compose([
             transforms.Resize((224, 224)),
@@ -64,15 +75,16 @@ class SecurityVisualAnalyzer:
     
     def extract_image_features(self, image: np.ndarray) -> Dict:
         """Extract security-relevant features from image"""
+        # Plain Python numbers, so results stay JSON serializable (Celery, result cache)
         features = {
-            'entropy': self.calculate_entropy(image),
-            'color_variance': self.calculate_color_variance(image),
-            'edge_density': self.calculate_edge_density(image),
-            'file_size': self.get_file_size(image),
-            'dimensions': image.shape,
+            'entropy': float(self.calculate_entropy(image)),
+            'color_variance': float(self.calculate_color_variance(image)),
+            'edge_density': float(self.calculate_edge_density(image)),
+            'file_size': int(self.get_file_size(image)),
+            'dimensions': list(image.shape),
             'aspect_ratio': image.shape[1] / image.shape[0],
-            'brightness': np.mean(image),
-            'contrast': np.std(image)
+            'brightness': float(np.mean(image)),
+            'contrast': float(np.std(image))
         }
         return features
     
@@ -205,6 +217,34 @@ class SecurityVisualAnalyzer:
         return entropy_map
     
     def analyze_image(self, image_path: str) -> Dict:
+        """Analyze image for security threats, reusing the verdict for identical image bytes"""
+        if self.result_cache is None:
+            return self.analyze_image_uncached(image_path)
+        
+        start_time = datetime.now()
+        try:
+            digest = file_digest(image_path)
+        except OSError:
+            return self.analyze_image_uncached(image_path)
+        result = self.result_cache.get(self.model_name, self.model_version, digest)
+        if result is not None:
+            result['processing_time'] = (datetime.now() - start_time).total_seconds()
+            result['cached'] = True
+            return result
+        
+        result = self.analyze_image_uncached(image_path)
+        if 'error' not in result:
+            self.result_cache.set(self.model_name, self.model_version, digest, result)
+        return result
+    
+    def analyze_image_bytes(self, image_data: bytes) -> Dict:
+        """Analyze an in-memory image, e.g. a task payload, through a temporary file"""
+        with tempfile.NamedTemporaryFile(dir=settings.TEMP_UPLOAD_DIR, suffix=".img") as f:
+            f.write(image_data)
+            f.flush()
+            return self.analyze_image(f.name)
+    
+    def analyze_image_uncached(self, image_path: str) -> Dict:
         """Analyze image for security threats"""
         start_time = datetime.now()
         
@@ -223,7 +263,7 @@ class SecurityVisualAnalyzer:
             
             # Get model predictions
             with torch.no_grad():
-                outputs = self.model(image_tensor)
+                outputs = self.forward(image_tensor)
                 probabilities = torch.softmax(outputs, dim=1)
                 
                 # Get prediction and confidence
@@ -248,7 +288,7 @@ class SecurityVisualAnalyzer:
                 'suspicious_patterns': suspicious_patterns,
                 'salient_regions': salient_regions,
                 'processing_time': processing_time,
-                'model_name': 'resnet50_security',
+                'model_name': self.model_name,
                 'prediction_probabilities': probabilities.cpu().numpy().tolist()[0]
             }
             
@@ -297,6 +337,18 @@ class SecurityVisualAnalyzer:
         
         return min(risk_score, 1.0)
     
+    def warm_up(self):
+        """Run one dummy image through the network so the first real call is not slowed by setup"""
+        with torch.no_grad():
+            self.forward(torch.zeros(1, 3, 224, 224, device=self.device))
+    
+    def forward(self, image_tensor: torch.Tensor) -> torch.Tensor:
+        """Class logits for a batch of preprocessed images, from the configured INFERENCE_BACKEND"""
+        exported = self.inference.get(self.model_name, self.model_version, self.device)
+        if exported is None:
+            return self.model(image_tensor)
+        return exported(image_tensor)[0]
+    
     def batch_analyze(self, image_paths: List[str]) -> List[Dict]:
         """Analyze multiple images in batch"""
         results = []
@@ -310,7 +362,8 @@ class SecurityVisualAnalyzer:
         torch.save({
             'model_state_dict': self.model.state_dict(),
             'num_classes': self.num_classes,
-            'malware_patterns': self.malware_patterns
+            'malware_patterns': self.malware_patterns,
+            'model_version': self.model_version
         }, path)
         logger.info("Model saved", path=path)
     
@@ -320,4 +373,6 @@ class SecurityVisualAnalyzer:
         self.model.load_state_dict(checkpoint['model_state_dict'])
         self.num_classes = checkpoint.get('num_classes', 3)
         self.malware_patterns = checkpoint.get('malware_patterns', self.malware_patterns)
-        logger.info("Model loaded", path=path) 
\ No newline at end of file
+        # New weights must not be served verdicts cached for the old ones
+        self.model_version = checkpoint.get('model_version') or f"{settings.MODEL_VERSION}+{file_digest(path)[:12]}"
+        logger.info("Model loaded", path=path, model_version=self.model_version) 
\ No newline at end of file
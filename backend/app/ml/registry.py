@@ -0,0 +1,123 @@
+from typing import Any, Callable, Dict, Iterable, Optional
+import threading
+import time
+import gc
+import structlog
+
+from app.core.config import settings
+from app.core.monitoring import record_model_load, record_model_warm
+
+logger = structlog.get_logger()
+
+
+def _load_text():
+    from app.ml.models.text_analyzer import SecurityTextAnalyzer
+
+    return SecurityTextAnalyzer(model_name=settings.BERT_MODEL_NAME)
+
+
+def _load_visual():
+    from app.ml.models.visual_analyzer import SecurityVisualAnalyzer
+
+    return SecurityVisualAnalyzer(model_path=settings.RESNET_MODEL_PATH)
+
+
+def _load_ensemble():
+    from app.ml.models.ensemble_analyzer import EnsembleAnalyzer
+
+    # Built on the registry's own text and visual models instead of loading copies
+    return EnsembleAnalyzer(text_analyzer=model_registry.get("text"), visual_analyzer=model_registry.get("visual"))
+
+
+class ModelRegistry:
+    """
+    Process-wide analyzer instances, loaded once and shared by every task.
+
+    ``get`` loads a model on first use; Celery workers call ``preload`` from
+    ``worker_process_init`` so each worker process pays for
+    ``from_pretrained`` and ResNet weights once, at startup, instead of per
+    task. Loaded models are warmed up with a dummy input (see the analyzers'
+    ``warm_up``) so the first real task does not carry one-time allocation
+    costs. Load time and warm state are exported per model.
+
+    Borrowed instances are shared: callers must not retrain or reconfigure
+    them. Training builds its own analyzer.
+    """
+
+    def __init__(self, loaders: Dict[str, Callable[[], Any]]):
+        self._loaders = loaders
+        self._models: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+
+    def get(self, name: str) -> Any:
+        """The shared instance of ``name`` ("text", "visual" or "ensemble"), loading it if needed"""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            if name not in self._models:
+                if name not in self._loaders:
+                    raise ValueError(f"Unknown model: {name}")
+                start_time = time.time()
+                model = self._loaders[name]()
+                duration = time.time() - start_time
+                record_model_load(name, duration)
+                record_model_warm(name, False)
+                self._models[name] = model
+                logger.info("Model loaded", model=name, load_time=duration)
+            return self._models[name]
+
+    def warm_up(self, name: str) -> None:
+        """Run a dummy input through a loaded model"""
+        model = self.get(name)
+        warm_up = getattr(model, "warm_up", None)
+        start_time = time.time()
+        if warm_up is not None:
+            warm_up()
+        record_model_warm(name, True)
+        logger.info("Model warmed up", model=name, warm_up_time=time.time() - start_time)
+
+    def preload(self, names: Optional[Iterable[str]] = None) -> None:
+        """Load and warm up ``names`` (default WORKER_PRELOAD_MODELS); failures are logged, not raised"""
+        for name in names if names is not None else settings.WORKER_PRELOAD_MODELS:
+            try:
+                self.warm_up(name)
+            except Exception as e:
+                # The worker still starts; the model is loaded by the first task that needs it
+                logger.error("Model preload failed", model=name, error=str(e))
+
+    def share_before_fork(self, names: Optional[Iterable[str]] = None) -> None:
+        """
+        Load ``names`` (default WORKER_PRELOAD_MODELS) in a parent process so forked children share them.
+        
+        Children see the parent's pages copy-on-write; a page stays shared
+        until someone writes to it. Networks are put in eval mode with
+        gradients off so inference never writes to the weights, and every
+        object that exists now is moved out of the garbage collector's
+        reach (``gc.freeze``), since collections in the children would
+        otherwise write to object headers all over the shared heap.
+        
+        Models are not warmed up here: a forward pass would start torch's
+        thread pool, which does not survive fork. Each child warms up in
+        ``preload`` instead, which only touches activations.
+        """
+        for name in names if names is not None else settings.WORKER_PRELOAD_MODELS:
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error("Model preload failed", model=name, error=str(e))
+        for model in self._models.values():
+            network = getattr(model, "model", None)
+            if hasattr(network, "requires_grad_"):
+                network.eval()
+                network.requires_grad_(False)
+        gc.collect()
+        gc.freeze()
+        logger.info("Models loaded before fork", models=list(self._models), frozen_objects=gc.get_freeze_count())
+
+
+model_registry = ModelRegistry({
+    "text": _load_text,
+    "visual": _load_visual,
+    "ensemble": _load_ensemble,
+})
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, JSON, ForeignKey, Float, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, Text, JSON, ForeignKey, Float, Enum, Index, UniqueConstraint, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from typing import Optional
 from datetime import datetime
 import enum
 import uuid
@@ -51,6 +52,7 @@ class SecurityLog(Base):
     processed = Column(Boolean, default=False)
     file_path = Column(String(500))
     file_size = Column(Integer)
+    content_hash = Column(String(64), index=True)  # SHA-256 of the stored file
     user_id = Column(String, ForeignKey("users.id"))
     created_at = Column(DateTime, default=func.now())
     
@@ -71,11 +73,115 @@ class AnalysisResult(Base):
     features = Column(JSON)
     processing_time = Column(Float)  # seconds
     model_version = Column(String(50))
+    analysis_id = Column(String, ForeignKey("analysis_jobs.id"), index=True)
     created_at = Column(DateTime, default=func.now())
     
     # Relationships
     log = relationship("SecurityLog", back_populates="analysis_results")
     user = relationship("User", back_populates="analysis_results")
+    job = relationship("AnalysisJob", back_populates="results")
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+    __table_args__ = (
+        UniqueConstraint("user_id", "idempotency_key"),
+        # At most one pending or running job per user over the same logs and
+        # model version; concurrent requests for the same work coalesce on it
+        Index(
+            "uq_analysis_jobs_active_log_set", "user_id", "log_set_hash", "model_version",
+            unique=True,
+            postgresql_where=text("status IN ('pending', 'processing')"),
+            sqlite_where=text("status IN ('pending', 'processing')")
+        ),
+    )
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    status = Column(String(20), default="pending")  # pending, processing, completed, failed, cancelled
+    log_ids = Column(JSON)
+    log_count = Column(Integer, default=0)
+    priority = Column(String(20), default="normal")  # interactive, normal, bulk
+    total_bytes = Column(BigInteger, default=0)
+    
+    # Deduplication of repeated submissions
+    idempotency_key = Column(String(255))  # Idempotency-Key header of the creating request
+    log_set_hash = Column(String(64), index=True)  # SHA-256 of the sorted log ids
+    model_version = Column(String(50))
+    
+    # Counters, incremented in SQL as result batches are written
+    logs_completed = Column(Integer, default=0)
+    logs_failed = Column(Integer, default=0)
+    records_processed = Column(Integer, default=0)
+    records_escalated = Column(Integer, default=0)  # Records the triage tier passed on to the model
+    records_modeled = Column(Integer, default=0)  # Records the text model actually ran on
+    total_results = Column(Integer, default=0)  # AnalysisResult rows stored
+    confidence_sum = Column(Float, default=0.0)  # over all records processed
+    normal_count = Column(Integer, default=0)
+    low_count = Column(Integer, default=0)
+    medium_count = Column(Integer, default=0)
+    high_count = Column(Integer, default=0)
+    critical_count = Column(Integer, default=0)
+    
+    # Fencing of concurrent runs: only the latest run may write, and a job
+    # can only be resumed once its run has stopped renewing the lease
+    run_generation = Column(Integer, default=0)  # Incremented by every run that starts
+    lease_expires_at = Column(DateTime)
+    
+    error = Column(Text)
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    # Relationships
+    results = relationship("AnalysisResult", back_populates="job")
+    checkpoints = relationship("AnalysisCheckpoint", back_populates="job")
+    
+    @property
+    def threat_distribution(self) -> dict:
+        return {level.value: getattr(self, f"{level.value}_count") or 0 for level in ThreatLevel}
+    
+    @property
+    def escalation_rate(self) -> Optional[float]:
+        if not self.records_processed:
+            return None
+        return (self.records_escalated or 0) / self.records_processed
+    
+    @property
+    def records_per_second(self) -> Optional[float]:
+        if not self.started_at or not self.records_processed:
+            return None
+        elapsed = ((self.completed_at or datetime.utcnow()) - self.started_at).total_seconds()
+        return self.records_processed / elapsed if elapsed > 0 else None
+    
+    @property
+    def average_confidence(self) -> float:
+        return (self.confidence_sum or 0.0) / self.records_processed if self.records_processed else 0.0
+
+class AnalysisCheckpoint(Base):
+    __tablename__ = "analysis_checkpoints"
+    __table_args__ = (UniqueConstraint("analysis_id", "log_id", "shard_start"),)
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    analysis_id = Column(String, ForeignKey("analysis_jobs.id"), nullable=False, index=True)
+    log_id = Column(String, ForeignKey("security_logs.id"), nullable=False)
+    shard_start = Column(BigInteger, nullable=False, default=0)
+    shard_end = Column(BigInteger)  # None: to the end of the file
+    
+    # Resume point and partial aggregates, committed with each result batch
+    offset = Column(BigInteger, nullable=False, default=0)
+    next_line = Column(BigInteger, nullable=False, default=0)
+    records = Column(BigInteger, default=0)
+    threat_distribution = Column(JSON)
+    severity = Column(String(20), default="normal")
+    templates = Column(JSON)  # Template summary of the analyzed part
+    completed = Column(Boolean, default=False)
+    error = Column(Text)  # Why the range failed, when it did
+    reduced = Column(Boolean, default=False)  # On a log's first range: shards merged into the log
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    # Relationships
+    job = relationship("AnalysisJob", back_populates="checkpoints")
 
 class Alert(Base):
     __tablename__ = "alerts"
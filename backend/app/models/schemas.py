@@ -40,11 +40,20 @@ class AnalysisResponse(BaseModel):
     status: str
     message: Optional[str] = None
     log_count: Optional[int] = None
+    priority: Optional[str] = None
     estimated_time: Optional[str] = None
+    deduplicated: Optional[bool] = None  # Attached to an earlier job instead of starting one
     total_results: Optional[int] = None
     completed_results: Optional[int] = None
     average_confidence: Optional[float] = None
     threat_distribution: Optional[dict] = None
+    logs_completed: Optional[int] = None
+    logs_failed: Optional[int] = None
+    records_processed: Optional[int] = None
+    records_escalated: Optional[int] = None
+    records_modeled: Optional[int] = None
+    escalation_rate: Optional[float] = None
+    records_per_second: Optional[float] = None
 
 class AnalysisResultResponse(BaseModel):
     model_config = ConfigDict(protected_namespaces=())
@@ -0,0 +1,129 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, case, func, or_
+from typing import Dict
+from datetime import datetime, timedelta
+import structlog
+import math
+
+from app.core.config import settings
+from app.core.monitoring import record_admission, update_lane_backlog
+from app.models.database import AnalysisJob, AnalysisCheckpoint
+
+logger = structlog.get_logger()
+
+ACTIVE_STATUSES = ["pending", "processing"]
+
+
+def lane_backlog(db: Session, priority: str) -> int:
+    """Bytes still to analyze in a lane: active jobs' sizes minus checkpointed progress"""
+    lane = AnalysisJob.priority == priority
+    total = db.query(func.coalesce(func.sum(AnalysisJob.total_bytes), 0)).filter(
+        lane, AnalysisJob.status.in_(ACTIVE_STATUSES)
+    ).scalar()
+    done = db.query(
+        func.coalesce(func.sum(AnalysisCheckpoint.offset - AnalysisCheckpoint.shard_start), 0)
+    ).join(AnalysisJob, AnalysisCheckpoint.analysis_id == AnalysisJob.id).filter(
+        lane, AnalysisJob.status.in_(ACTIVE_STATUSES)
+    ).scalar()
+    return max(int(total) - int(done), 0)
+
+
+def lane_throughput(db: Session, priority: str) -> float:
+    """
+    Bytes per second a lane analyzed over the last ADMISSION_THROUGHPUT_WINDOW.
+
+    Every job that ran during the window contributes the share of its bytes
+    that falls in the window, assuming it progressed at a steady rate. The
+    sum is divided by the time the lane was busy, from the earliest such
+    job's start, so an idle lane does not look slow. Without any recent
+    job the lane is assumed to run at ADMISSION_DEFAULT_THROUGHPUT.
+
+    Runs as one query: the checkpointed progress of running jobs is summed
+    in the database rather than loaded checkpoint by checkpoint.
+    """
+    now = datetime.utcnow()
+    window_start = now - timedelta(seconds=settings.ADMISSION_THROUGHPUT_WINDOW)
+    progress = func.coalesce(func.sum(case(
+        (AnalysisCheckpoint.offset > AnalysisCheckpoint.shard_start,
+         AnalysisCheckpoint.offset - AnalysisCheckpoint.shard_start),
+        else_=0
+    )), 0)
+    jobs = db.query(
+        AnalysisJob.status, AnalysisJob.total_bytes, AnalysisJob.started_at, AnalysisJob.completed_at, progress
+    ).outerjoin(
+        # Finished jobs count with their full size, so only running ones need checkpoints
+        AnalysisCheckpoint,
+        and_(AnalysisCheckpoint.analysis_id == AnalysisJob.id, AnalysisJob.status == "processing")
+    ).filter(
+        AnalysisJob.priority == priority,
+        AnalysisJob.started_at.isnot(None),
+        or_(AnalysisJob.status == "processing", AnalysisJob.completed_at >= window_start)
+    ).group_by(
+        AnalysisJob.id, AnalysisJob.status, AnalysisJob.total_bytes, AnalysisJob.started_at, AnalysisJob.completed_at
+    ).all()
+
+    processed, busy_since = 0.0, now
+    for status, total_bytes, started_at, completed_at, checkpointed in jobs:
+        end = completed_at or now
+        done = checkpointed if status == "processing" else total_bytes or 0
+        span = (end - started_at).total_seconds()
+        overlap_start = max(started_at, window_start)
+        overlap = (end - overlap_start).total_seconds()
+        if span <= 0 or overlap <= 0:
+            continue
+        processed += done * overlap / span
+        busy_since = min(busy_since, overlap_start)
+
+    busy = (now - busy_since).total_seconds()
+    if processed <= 0 or busy <= 0:
+        return float(settings.ADMISSION_DEFAULT_THROUGHPUT)
+    return processed / busy
+
+
+def admit(db: Session, priority: str, total_bytes: int, enforce: bool = True) -> Dict:
+    """
+    Decide whether a job of ``total_bytes`` may join its lane, and when it would finish.
+
+    The wait is the lane's backlog divided by its measured throughput. A job
+    whose wait exceeds the lane's ADMISSION_MAX_WAIT is refused (when
+    ADMISSION_CONTROL is on) with the seconds until the backlog has drained
+    below it; with ``enforce=False`` it is only given its ETA. Backlog and
+    throughput are exported as gauges.
+
+    Returns:
+        Dict with admitted, wait and eta (wait plus the job's own time) in
+        seconds, retry_after for refused jobs, backlog_bytes and throughput
+    """
+    backlog = lane_backlog(db, priority)
+    throughput = max(lane_throughput(db, priority), 1.0)
+    update_lane_backlog(priority, backlog, throughput)
+
+    wait = backlog / throughput
+    max_wait = settings.ADMISSION_MAX_WAIT.get(priority)
+    admitted = not (enforce and settings.ADMISSION_CONTROL) or max_wait is None or wait <= max_wait
+    decision = {
+        "admitted": admitted,
+        "wait": wait,
+        "eta": wait + total_bytes / throughput,
+        "retry_after": None if admitted else max(math.ceil(wait - max_wait), 1),
+        "backlog_bytes": backlog,
+        "throughput": throughput
+    }
+    if enforce:
+        record_admission(priority, admitted)
+    if not admitted:
+        logger.warning("Analysis job refused, lane backlog too deep",
+                       priority=priority, backlog_bytes=backlog, throughput=throughput,
+                       wait=wait, retry_after=decision["retry_after"])
+    return decision
+
+
+def format_eta(seconds: float) -> str:
+    """Human-readable duration for AnalysisResponse.estimated_time"""
+    if seconds < 60:
+        return "under a minute"
+    if seconds < 3600:
+        minutes = math.ceil(seconds / 60)
+        return f"about {minutes} minute{'s' if minutes > 1 else ''}"
+    hours = seconds / 3600
+    return f"about {hours:.1f} hours"
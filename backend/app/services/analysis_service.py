@@ -1,10 +1,1242 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, case, func, insert, or_, update
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from datetime import datetime, timedelta
+import structlog
+import hashlib
+import bisect
+import time
+import uuid
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.monitoring import record_job_latency
+from app.models.database import User, SecurityLog, AnalysisResult, AnalysisJob, AnalysisCheckpoint, ThreatLevel
+from app.services.compressed_storage import is_text_file
+from app.services.line_index import LineIndex, build_line_index, has_line_index
+from app.services.log_processor import LogProcessor
+from app.services.template_miner import LogTemplate, TemplateMiner, merge_template_summaries
+
+logger = structlog.get_logger()
+
+# Severity order, lowest first
+THREAT_ORDER = [ThreatLevel.NORMAL, ThreatLevel.LOW, ThreatLevel.MEDIUM, ThreatLevel.HIGH, ThreatLevel.CRITICAL]
+
+# Characters of a record kept with its result
+EXCERPT_LENGTH = 500
+
+_triage_filter = None
+
+
+class AnalysisCancelled(Exception):
+    """Raised inside a running analysis once its job has been cancelled"""
+
+
+class AnalysisSuperseded(AnalysisCancelled):
+    """Raised inside a run of a job that a newer run (a resume) has taken over"""
+
+
+def lease_deadline() -> datetime:
+    """When a job run that writes now stops being presumed alive"""
+    return datetime.utcnow() + timedelta(seconds=settings.ANALYSIS_LEASE_TIMEOUT)
+
+
+def get_text_analyzer():
+    """Process-wide SecurityTextAnalyzer from the model registry, loaded on first use"""
+    from app.ml.registry import model_registry
+
+    return model_registry.get("text")
+
+
+def get_triage_filter():
+    """Process-wide TriageFilter, or None when ANALYSIS_TRIAGE is off"""
+    global _triage_filter
+    if not settings.ANALYSIS_TRIAGE:
+        return None
+    if _triage_filter is None:
+        from app.ml.models.triage import TriageFilter
+
+        _triage_filter = TriageFilter(settings.TRIAGE_THRESHOLD, settings.TRIAGE_MODEL_PATH)
+    return _triage_filter
+
+
+def job_size(logs: Iterable[SecurityLog]) -> int:
+    """Bytes a job will analyze: file sizes, or the raw message of file-less logs"""
+    return sum(log.file_size or len(log.raw_message or "") for log in logs)
+
+
+def classify_priority(total_bytes: int, origin: str) -> str:
+    """
+    Lane of a job at submission: "interactive", "normal" or "bulk".
+
+    Large jobs are bulk whatever their origin; small ones submitted from an
+    interactive request (``origin="trigger"``) are interactive.
+    """
+    if total_bytes >= settings.ANALYSIS_BULK_MIN_BYTES:
+        return "bulk"
+    if origin == "trigger" and total_bytes <= settings.ANALYSIS_INTERACTIVE_MAX_BYTES:
+        return "interactive"
+    return "normal"
+
+
+def analysis_queue(priority: Optional[str]) -> str:
+    """Celery queue of a priority lane"""
+    return settings.ANALYSIS_QUEUES.get(priority or "normal", settings.ANALYSIS_QUEUES["normal"])
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    """Group an iterable into lists of at most ``size`` items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class JobProgress:
+    """
+    Counter deltas for one AnalysisJob.
+
+    Accumulated in memory and applied with ``flush`` as SQL increments
+    (``col = col + delta``), so concurrent writers never overwrite each
+    other's counts and the job row is always current to the last flush.
+
+    With the ``generation`` of a run, every flush is fenced: it renews the
+    job's lease and only applies while that run is the job's latest.
+    Results and checkpoints are written in the same transaction as the
+    flush, so a superseded run cannot commit any of them.
+    """
+
+    def __init__(self, analysis_id: str, generation: Optional[int] = None):
+        self.analysis_id = analysis_id
+        self.generation = generation
+        self.reset()
+
+    def reset(self) -> None:
+        self.records = 0
+        self.escalated = 0
+        self.modeled = 0
+        self.results = 0
+        self.confidence_sum = 0.0
+        self.levels = {level: 0 for level in THREAT_ORDER}
+
+    def add(
+        self,
+        level: ThreatLevel,
+        confidence: float,
+        stored: bool,
+        escalated: bool = True,
+        modeled: bool = True
+    ) -> None:
+        self.records += 1
+        self.escalated += escalated
+        self.modeled += modeled
+        self.results += stored
+        self.confidence_sum += confidence
+        self.levels[level] += 1
+
+    def flush(self, db: Session, **counters: int) -> None:
+        """
+        Apply accumulated deltas plus any extra ``counters`` increments.
+
+        Raises:
+            AnalysisSuperseded: if a newer run of the job started; the
+                transaction is rolled back
+        """
+        deltas = {
+            "records_processed": self.records,
+            "records_escalated": self.escalated,
+            "records_modeled": self.modeled,
+            "total_results": self.results,
+            "confidence_sum": self.confidence_sum,
+            **{f"{level.value}_count": count for level, count in self.levels.items()},
+            **counters
+        }
+        values = {name: getattr(AnalysisJob, name) + delta for name, delta in deltas.items() if delta}
+        query = update(AnalysisJob).where(AnalysisJob.id == self.analysis_id)
+        if self.generation is not None:
+            query = query.where(AnalysisJob.run_generation == self.generation)
+            values["lease_expires_at"] = lease_deadline()
+        self.reset()
+        if values and not db.execute(query.values(**values)).rowcount and self.generation is not None:
+            db.rollback()
+            raise AnalysisSuperseded(self.analysis_id)
+
+
 class AnalysisService:
-    def analyze_logs(self, logs, user_id, analysis_id, db):
-        # Placeholder for background analysis logic
-        # In production, this would run ML models and store results
-        print(f"Analyzing {len(logs)} logs for user {user_id} (analysis_id={analysis_id})")
-        # Simulate analysis
-        for log in logs:
-            pass
-        # You can add database result creation here if needed
-        return True 
\ No newline at end of file
+    def __init__(self, analyzer=None, triage=None):
+        self._analyzer = analyzer
+        self.triage = triage if triage is not None else get_triage_filter()
+        # Generation of the job run this instance works for (see start_job);
+        # None leaves its writes unfenced
+        self.run_generation: Optional[int] = None
+
+    @property
+    def analyzer(self):
+        if self._analyzer is None:
+            self._analyzer = get_text_analyzer()
+        return self._analyzer
+
+    @property
+    def model_version(self) -> str:
+        """Version recorded on this service's results; MODEL_VERSION while no analyzer is loaded"""
+        return getattr(self._analyzer, "model_version", None) or settings.MODEL_VERSION
+
+    @staticmethod
+    def log_set_hash(log_ids: Iterable[str]) -> str:
+        """Order-independent digest of a set of log ids"""
+        return hashlib.sha256("\n".join(sorted(set(log_ids))).encode()).hexdigest()
+
+    @staticmethod
+    def create_job(
+        db: Session,
+        user_id: str,
+        log_ids: List[str],
+        priority: str = "normal",
+        total_bytes: int = 0,
+        idempotency_key: Optional[str] = None
+    ) -> AnalysisJob:
+        """Persist a pending AnalysisJob; its id is the analysis_id. The caller commits."""
+        job = AnalysisJob(
+            user_id=user_id,
+            log_ids=list(log_ids),
+            log_count=len(log_ids),
+            priority=priority,
+            total_bytes=total_bytes,
+            idempotency_key=idempotency_key,
+            log_set_hash=AnalysisService.log_set_hash(log_ids),
+            model_version=settings.MODEL_VERSION,
+            status="pending",
+            lease_expires_at=lease_deadline()
+        )
+        db.add(job)
+        db.flush()
+        return job
+
+    @staticmethod
+    def find_job_by_key(db: Session, user_id: str, idempotency_key: Optional[str]) -> Optional[AnalysisJob]:
+        """The job a user's earlier request with this Idempotency-Key created, whatever its state"""
+        if not idempotency_key:
+            return None
+        return db.query(AnalysisJob).filter(
+            AnalysisJob.user_id == user_id,
+            AnalysisJob.idempotency_key == idempotency_key
+        ).first()
+
+    @classmethod
+    def find_duplicate_job(cls, db: Session, user_id: str, log_ids: List[str]) -> Optional[AnalysisJob]:
+        """
+        A pending or running job of the user over the same logs and model version.
+
+        A new request for the same work attaches to it instead of analyzing
+        the logs again. Finished jobs are not reused, so re-analysis after
+        completion stays possible.
+        """
+        return db.query(AnalysisJob).filter(
+            AnalysisJob.user_id == user_id,
+            AnalysisJob.log_set_hash == cls.log_set_hash(log_ids),
+            AnalysisJob.model_version == settings.MODEL_VERSION,
+            AnalysisJob.status.in_(["pending", "processing"])
+        ).order_by(AnalysisJob.created_at).first()
+
+    def analyze_logs(self, log_ids: List[str], user_id: str, analysis_id: str) -> Dict:
+        """
+        Analyze the files behind ``log_ids`` record by record.
+
+        Runs outside the request (background task or worker) with its own
+        session. Each file is streamed through ``LogProcessor.iter_records``,
+        analyzed ANALYSIS_BATCH_SIZE records at a time and the resulting
+        AnalysisResult rows are bulk inserted every ANALYSIS_INSERT_BATCH_SIZE
+        rows, so memory stays flat regardless of file size. The AnalysisJob
+        ``analysis_id`` is updated as batches are written.
+
+        Progress is checkpointed with every write, so running the same job
+        again (see ``resume_job``) continues where it stopped. Cancelling
+        the job stops the run between batches, and a newer run of the job
+        fences this one out (see ``JobProgress``).
+
+        Returns:
+            Summary with per-log record counts and threat distribution
+        """
+        db = SessionLocal()
+        summary = {"analysis_id": analysis_id, "logs": {}, "records": 0, "failed": []}
+        try:
+            job = self.start_job(db, log_ids, user_id, analysis_id)
+            if job.status == "cancelled":
+                return summary
+            self.run_generation = job.run_generation
+
+            progress = JobProgress(analysis_id, self.run_generation)
+            for log_id in log_ids:
+                if self.is_cancelled(db, analysis_id):
+                    break
+                log = db.query(SecurityLog).filter(
+                    SecurityLog.id == log_id,
+                    SecurityLog.user_id == user_id
+                ).first()
+                if not log:
+                    summary["failed"].append({"log_id": log_id, "error": "Log not found"})
+                    progress.flush(db, logs_failed=1)
+                    db.commit()
+                    continue
+
+                try:
+                    log_summary = self.analyze_log(db, log, analysis_id, progress)
+                except AnalysisSuperseded:
+                    raise
+                except AnalysisCancelled:
+                    break
+                except Exception as e:
+                    db.rollback()
+                    progress.reset()
+                    logger.error("Log analysis failed", error=str(e), log_id=log_id, analysis_id=analysis_id)
+                    summary["failed"].append({"log_id": log_id, "error": str(e)})
+                    progress.flush(db, logs_failed=1)
+                    db.commit()
+                    continue
+
+                summary["logs"][log_id] = log_summary
+                summary["records"] += log_summary["records"]
+
+            all_failed = log_ids and len(summary["failed"]) == len(log_ids)
+            # A cancelled job keeps its status, and a superseded run leaves it to the newer one
+            finished = db.execute(update(AnalysisJob).where(
+                AnalysisJob.id == analysis_id,
+                AnalysisJob.status == "processing",
+                AnalysisJob.run_generation == self.run_generation
+            ).values(
+                status="failed" if all_failed else "completed",
+                error="; ".join(f"{f['log_id']}: {f['error']}" for f in summary["failed"]) or None,
+                completed_at=datetime.utcnow()
+            ))
+            db.commit()
+            if finished.rowcount:
+                self.record_latency(db, analysis_id)
+            self.release_lease(db, analysis_id)
+
+            logger.info("Analysis completed",
+                        analysis_id=analysis_id,
+                        user_id=user_id,
+                        logs=len(summary["logs"]),
+                        records=summary["records"],
+                        failed=len(summary["failed"]))
+            return summary
+        except AnalysisSuperseded:
+            logger.info("Analysis run superseded by a newer run", analysis_id=analysis_id,
+                        generation=self.run_generation)
+            return summary
+        finally:
+            db.close()
+
+    @staticmethod
+    def start_job(db: Session, log_ids: List[str], user_id: str, analysis_id: str) -> AnalysisJob:
+        """
+        Move a job to processing as a new run (creating it if needed); cancelled jobs stay cancelled.
+
+        Every run gets the next ``run_generation`` and a fresh lease. Writes
+        fenced with an older generation fail from then on, so a run that is
+        still going when a newer one starts cannot duplicate its work.
+        """
+        job = db.get(AnalysisJob, analysis_id)
+        if job is None:
+            job = AnalysisJob(id=analysis_id, user_id=user_id, log_ids=list(log_ids), log_count=len(log_ids))
+            db.add(job)
+            db.flush()
+        db.execute(update(AnalysisJob).where(
+            AnalysisJob.id == analysis_id,
+            AnalysisJob.status != "cancelled"
+        ).values(
+            status="processing",
+            run_generation=func.coalesce(AnalysisJob.run_generation, 0) + 1,
+            started_at=func.coalesce(AnalysisJob.started_at, datetime.utcnow()),
+            lease_expires_at=lease_deadline()
+        ))
+        # Read back this run's generation before another start can commit
+        db.refresh(job)
+        db.commit()
+        return job
+
+    def check_running(self, db: Session, analysis_id: str) -> None:
+        """
+        Stop this run if it should not go on (a primary key read of the job).
+
+        Raises:
+            AnalysisCancelled: if the job was cancelled
+            AnalysisSuperseded: if a newer run of the job took it over
+        """
+        row = db.query(AnalysisJob.status, AnalysisJob.run_generation).filter(AnalysisJob.id == analysis_id).first()
+        if row is None:
+            return
+        if self.run_generation is not None and row.run_generation != self.run_generation:
+            raise AnalysisSuperseded(analysis_id)
+        if row.status == "cancelled":
+            raise AnalysisCancelled(analysis_id)
+
+    def is_cancelled(self, db: Session, analysis_id: str) -> bool:
+        """Whether this run should stop: the job was cancelled, or a newer run took it over"""
+        try:
+            self.check_running(db, analysis_id)
+        except AnalysisCancelled:
+            return True
+        return False
+
+    def release_lease(self, db: Session, analysis_id: str) -> None:
+        """Let a job be resumed right away once this run has stopped (no-op for a superseded run)"""
+        if self.run_generation is None:
+            return
+        db.execute(update(AnalysisJob).where(
+            AnalysisJob.id == analysis_id,
+            AnalysisJob.run_generation == self.run_generation
+        ).values(lease_expires_at=datetime.utcnow()))
+        db.commit()
+
+    @staticmethod
+    def cancel_job(db: Session, analysis_id: str) -> bool:
+        """
+        Cancel a pending or running job. The caller commits.
+
+        Running workers notice within ANALYSIS_CANCEL_CHECK_INTERVAL seconds,
+        commit what they have analyzed so far and stop; queued shards exit
+        as soon as they start.
+
+        Returns:
+            False if the job had already finished
+        """
+        cancelled = db.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == analysis_id, AnalysisJob.status.in_(["pending", "processing"]))
+            .values(status="cancelled", completed_at=datetime.utcnow())
+        )
+        return cancelled.rowcount > 0
+
+    @staticmethod
+    def resume_job(db: Session, analysis_id: str) -> bool:
+        """
+        Reopen a failed job, or an interrupted or cancelled one whose run has
+        stopped, so it can be scheduled again.
+
+        A pending, processing or cancelled job is only resumable once its
+        lease has expired (or was released by a run that stopped), so a job
+        whose workers are alive is not run twice; should a run outlive its
+        lease, the new run's generation fences it out. Reopening takes the
+        lease for the run about to be scheduled, so concurrent resumes
+        reopen the job once.
+
+        Finished logs and checkpointed ranges are skipped on the next run;
+        failures are recounted by it. The caller commits and reschedules.
+
+        Raises IntegrityError if another pending or running job of the user
+        covers the same logs.
+
+        Returns:
+            False if the job cannot be resumed (completed, or still running)
+        """
+        resumed = db.execute(
+            update(AnalysisJob)
+            .where(
+                AnalysisJob.id == analysis_id,
+                or_(
+                    AnalysisJob.status == "failed",
+                    and_(
+                        AnalysisJob.status.in_(["pending", "processing", "cancelled"]),
+                        or_(AnalysisJob.lease_expires_at.is_(None), AnalysisJob.lease_expires_at < datetime.utcnow())
+                    )
+                )
+            )
+            .values(status="pending", logs_failed=0, error=None, completed_at=None,
+                    lease_expires_at=lease_deadline())
+        )
+        return resumed.rowcount > 0
+
+    def iter_log_records(
+        self,
+        log: SecurityLog,
+        start: int = 0,
+        end: Optional[int] = None,
+        first_line: int = 0
+    ) -> Iterator[Tuple[int, str, Optional[int]]]:
+        """Records to analyze for a log: its file's lines, or the raw message"""
+        filename = (log.parsed_data or {}).get("filename")
+        if log.file_path:
+            if not is_text_file(filename or log.file_path, None):
+                return
+            yield from LogProcessor().iter_records(log.file_path, start, end, first_line)
+        elif log.raw_message and start == 0:
+            yield 0, log.raw_message, None
+
+    def load_checkpoint(
+        self,
+        db: Session,
+        analysis_id: str,
+        log_id: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        first_line: int = 0
+    ) -> AnalysisCheckpoint:
+        """The checkpoint of one log range within a job, created at the range start if new"""
+        checkpoint = db.query(AnalysisCheckpoint).filter(
+            AnalysisCheckpoint.analysis_id == analysis_id,
+            AnalysisCheckpoint.log_id == log_id,
+            AnalysisCheckpoint.shard_start == start
+        ).first()
+        if checkpoint is None:
+            checkpoint = AnalysisCheckpoint(
+                analysis_id=analysis_id,
+                log_id=log_id,
+                shard_start=start,
+                shard_end=end,
+                offset=start,
+                next_line=first_line,
+                records=0,
+                threat_distribution={level.value: 0 for level in THREAT_ORDER},
+                severity=ThreatLevel.NORMAL.value,
+                completed=False
+            )
+            db.add(checkpoint)
+            db.commit()
+        return checkpoint
+
+    def analyze_range(
+        self,
+        db: Session,
+        log: SecurityLog,
+        analysis_id: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        first_line: int = 0,
+        progress: Optional[JobProgress] = None
+    ) -> Dict:
+        """
+        Analyze the byte range [start, end) of a log, resuming from its checkpoint.
+
+        A range that was interrupted continues at the byte offset and line
+        of its last committed batch, with the aggregates committed so far.
+
+        Raises:
+            AnalysisCancelled: if the job is cancelled before or during the
+                run, or ``AnalysisSuperseded`` if a newer run takes it over
+        """
+        self.check_running(db, analysis_id)
+        checkpoint = self.load_checkpoint(db, analysis_id, log.id, start, end, first_line)
+        if not checkpoint.completed:
+            if checkpoint.records:
+                logger.info("Resuming analysis from checkpoint",
+                            log_id=log.id,
+                            analysis_id=analysis_id,
+                            offset=checkpoint.offset,
+                            records=checkpoint.records)
+            records = self.iter_log_records(log, checkpoint.offset, end, checkpoint.next_line)
+            return self.analyze_records(db, log, analysis_id, records, progress, checkpoint)
+        return {
+            "records": checkpoint.records,
+            "threat_distribution": dict(checkpoint.threat_distribution),
+            "severity": checkpoint.severity,
+            "templates": checkpoint.templates or []
+        }
+
+    def analyze_log(
+        self,
+        db: Session,
+        log: SecurityLog,
+        analysis_id: str,
+        progress: Optional[JobProgress] = None
+    ) -> Dict:
+        """Stream one whole log through the text analyzer and store its results"""
+        start_time = time.time()
+        log_summary = self.analyze_range(db, log, analysis_id, progress=progress)
+        log_summary["duration"] = time.time() - start_time
+        self.finish_log(db, log, analysis_id, log_summary)
+        db.commit()
+        return log_summary
+
+    def analyze_records(
+        self,
+        db: Session,
+        log: SecurityLog,
+        analysis_id: str,
+        records: Iterable[Tuple[int, str, Optional[int]]],
+        progress: Optional[JobProgress] = None,
+        checkpoint: Optional[AnalysisCheckpoint] = None
+    ) -> Dict:
+        """
+        Analyze ``records`` of ``log`` in batches and store their results.
+
+        Result rows, job counters and the ``checkpoint`` (resume offset plus
+        aggregates so far) are written every ANALYSIS_INSERT_BATCH_SIZE
+        records or rows and committed together, so a restart never loses or
+        repeats committed work. The job is checked for cancellation every
+        ANALYSIS_CANCEL_CHECK_INTERVAL seconds.
+
+        With ANALYSIS_TEMPLATES each call mines its own templates (see
+        ``analyze_batches``), so memory is bounded per log range.
+
+        Returns:
+            Summary with record count, threat distribution, highest severity
+            and the most frequent templates
+
+        Raises:
+            AnalysisCancelled: after committing the work done so far
+        """
+        progress = progress or JobProgress(analysis_id, self.run_generation)
+        if checkpoint is not None:
+            distribution = dict(checkpoint.threat_distribution)
+            highest = ThreatLevel(checkpoint.severity)
+            count = checkpoint.records
+            previous_templates = checkpoint.templates or []
+        else:
+            distribution = {level.value: 0 for level in THREAT_ORDER}
+            highest = ThreatLevel.NORMAL
+            count = 0
+            previous_templates = []
+        miner = TemplateMiner() if settings.ANALYSIS_TEMPLATES else None
+        pending_rows: List[Dict] = []
+        position = None
+        templates = previous_templates
+        last_cancel_check = time.monotonic()
+
+        def commit(completed: bool = False) -> None:
+            # Results, the counters that describe them and the resume point commit together
+            nonlocal templates
+            if pending_rows:
+                db.execute(insert(AnalysisResult), pending_rows)
+                pending_rows.clear()
+            progress.flush(db)
+            if checkpoint is not None:
+                if position is not None:
+                    checkpoint.next_line, checkpoint.offset = position
+                checkpoint.records = count
+                checkpoint.threat_distribution = dict(distribution)
+                checkpoint.severity = highest.value
+                checkpoint.completed = completed
+                if miner is not None:
+                    templates = merge_template_summaries([previous_templates, miner.summary()])
+                    checkpoint.templates = templates
+            db.commit()
+
+        for batch in self.analyze_batches(records, miner):
+            for (line_number, text, _), result, stage in batch:
+                level = ThreatLevel(result.get("threat_level", "normal"))
+                distribution[level.value] += 1
+                if THREAT_ORDER.index(level) > THREAT_ORDER.index(highest):
+                    highest = level
+                stored = level != ThreatLevel.NORMAL or settings.ANALYSIS_STORE_NORMAL_RESULTS
+                if stored:
+                    pending_rows.append(self.result_row(log, analysis_id, line_number, text, result, level))
+                progress.add(level, result.get("confidence", 0.0), stored, stage != "triage", stage == "model")
+            count += len(batch)
+            (line_number, _, next_offset), _, _ = batch[-1]
+            if next_offset is not None:
+                position = (line_number + 1, next_offset)
+
+            if len(pending_rows) >= settings.ANALYSIS_INSERT_BATCH_SIZE or progress.records >= settings.ANALYSIS_INSERT_BATCH_SIZE:
+                commit()
+
+            if time.monotonic() - last_cancel_check >= settings.ANALYSIS_CANCEL_CHECK_INTERVAL:
+                last_cancel_check = time.monotonic()
+                if self.is_cancelled(db, analysis_id):
+                    commit()
+                    # This worker has stopped; the job may be resumed without waiting for the lease
+                    self.release_lease(db, analysis_id)
+                    logger.info("Analysis cancelled", log_id=log.id, analysis_id=analysis_id, records=count)
+                    raise AnalysisCancelled(analysis_id)
+
+        commit(completed=True)
+        if checkpoint is None and miner is not None:
+            templates = miner.summary()
+
+        return {
+            "records": count,
+            "threat_distribution": distribution,
+            "severity": highest.value,
+            "templates": templates
+        }
+
+    def analyze_batches(
+        self,
+        records: Iterable[Tuple[int, str, Optional[int]]],
+        miner: Optional[TemplateMiner] = None
+    ) -> Iterator[List[Tuple]]:
+        """
+        Run records through the triage tier, the template miner and the text analyzer.
+
+        Each stage is optional. Records the triage tier finds obviously
+        normal keep its verdict. With a ``miner`` the remaining records are
+        grouped by template: the first record of a template is analyzed as
+        its representative and the verdict is propagated to every other
+        member. Only what is left reaches the analyzer, in full
+        ANALYSIS_BATCH_SIZE batches; records in between wait with their
+        verdict (at most ANALYSIS_INSERT_BATCH_SIZE) so output order is kept.
+
+        Yields:
+            Lists of (record, result, stage) in input order, where stage is
+            "triage", "template" or "model" depending on who gave the verdict
+        """
+        pending: List[List] = []
+        modeled: List[List] = []
+        # Templates whose representative is waiting for the model, with their members
+        waiting: Dict[int, Tuple[LogTemplate, List, List[List]]] = {}
+
+        def resolve() -> List[Tuple]:
+            if modeled:
+                results = self.analyzer.batch_analyze([entry[0][1] for entry in modeled])
+                for entry, result in zip(modeled, results):
+                    entry[1] = result
+            for template, representative, members in waiting.values():
+                template.result = representative[1]
+                for member in members:
+                    member[1] = self.template_result(template)
+            resolved = [tuple(entry) for entry in pending]
+            pending.clear()
+            modeled.clear()
+            waiting.clear()
+            return resolved
+
+        for batch in batched(records, settings.ANALYSIS_BATCH_SIZE):
+            if self.triage is not None:
+                verdicts = self.triage.triage([text for _, text, _ in batch])
+            else:
+                verdicts = [None] * len(batch)
+
+            for record, verdict in zip(batch, verdicts):
+                entry = [record, verdict, "triage"]
+                pending.append(entry)
+                if verdict is not None:
+                    continue
+
+                template = miner.add(record[1]) if miner is not None else None
+                if template is None:
+                    entry[2] = "model"
+                    modeled.append(entry)
+                elif template.result is not None:
+                    entry[1:] = [self.template_result(template), "template"]
+                elif template.template_id in waiting:
+                    entry[2] = "template"
+                    waiting[template.template_id][2].append(entry)
+                else:
+                    entry[2] = "model"
+                    modeled.append(entry)
+                    waiting[template.template_id] = (template, entry, [])
+
+            if len(modeled) >= settings.ANALYSIS_BATCH_SIZE or len(pending) >= settings.ANALYSIS_INSERT_BATCH_SIZE:
+                yield resolve()
+        if pending:
+            yield resolve()
+
+    @staticmethod
+    def template_result(template: LogTemplate) -> Dict:
+        """A template's verdict as the result of one of its other members"""
+        return {
+            **template.result,
+            "features": {},
+            "processing_time": 0.0,
+            "template": template.text
+        }
+
+    def finish_log(self, db: Session, log: SecurityLog, analysis_id: str, log_summary: Dict) -> None:
+        """Record a log's overall outcome and count it as completed for the job. The caller commits."""
+        if ((log.parsed_data or {}).get("analysis") or {}).get("analysis_id") == analysis_id:
+            # Redelivered reduce or resumed job: this log is already counted
+            return
+        parsed_data = dict(log.parsed_data or {})
+        parsed_data["analysis"] = {"analysis_id": analysis_id, "model_version": self.model_version, **log_summary}
+        log.parsed_data = parsed_data
+        log.severity = ThreatLevel(log_summary["severity"])
+        log.processed = True
+        JobProgress(analysis_id, self.run_generation).flush(db, logs_completed=1)
+
+        logger.info("Log analyzed",
+                    log_id=log.id,
+                    analysis_id=analysis_id,
+                    records=log_summary["records"],
+                    severity=log_summary["severity"],
+                    records_per_second=log_summary["records"] / max(log_summary.get("duration", 0), 1e-6))
+
+    @staticmethod
+    def merge_summaries(summaries: List[Dict]) -> Dict:
+        """Combine per-shard summaries of one log into a log summary"""
+        distribution = {level.value: 0 for level in THREAT_ORDER}
+        severity = ThreatLevel.NORMAL
+        for summary in summaries:
+            for level, count in summary["threat_distribution"].items():
+                distribution[level] += count
+            level = ThreatLevel(summary["severity"])
+            if THREAT_ORDER.index(level) > THREAT_ORDER.index(severity):
+                severity = level
+        return {
+            "records": sum(summary["records"] for summary in summaries),
+            "threat_distribution": distribution,
+            "severity": severity.value,
+            "templates": merge_template_summaries(summary.get("templates") for summary in summaries),
+            "shards": len(summaries),
+            # Sum of shard times; wall time is lower when shards run in parallel
+            "duration": sum(summary.get("duration", 0) for summary in summaries)
+        }
+
+    def plan_shards(self, log: SecurityLog, shard_size: Optional[int] = None) -> List[Tuple[int, Optional[int], int]]:
+        """
+        Cut a log file into line-aligned byte ranges of about ``shard_size``.
+
+        Boundaries are taken from the line-offset index, so every range
+        starts at a known line number and no line is split or counted twice.
+
+        Returns:
+            (start, end, first_line) per shard; the last shard's end is None
+        """
+        shard_size = shard_size or settings.ANALYSIS_SHARD_SIZE
+        if not log.file_path or (log.file_size or 0) <= shard_size:
+            return [(0, None, 0)]
+        if not has_line_index(log.file_path):
+            build_line_index(log.file_path)
+
+        shards = []
+        start, first_line = 0, 0
+        with LineIndex(log.file_path) as index:
+            while True:
+                slot = bisect.bisect_left(index.offsets, start + shard_size)
+                if slot >= len(index.offsets):
+                    break
+                end = index.offsets[slot]
+                shards.append((start, end, first_line))
+                start, first_line = end, slot * index.interval
+        shards.append((start, None, first_line))
+        return shards
+
+    def dispatch_job(self, log_ids: List[str], user_id: str, analysis_id: str) -> int:
+        """
+        Fan a job out to the Celery cluster.
+
+        Every log is cut into shards by ``plan_shards``, each with its
+        checkpoint row. Shards that are not complete yet go to the job's
+        lane of the tenant fair queue (see ``fair_scheduler``), which hands
+        them to ``analyze_log_shard_task`` in weighted round-robin between
+        tenants. Once all shards of a log are done, the last one to finish
+        merges them into the log (``reduce_if_done``).
+
+        Dispatching a resumed job again only queues its unfinished shards,
+        under the new run's generation: shards of the older run that are
+        still queued or running are fenced out when they next write.
+
+        Returns:
+            Number of shard tasks queued
+        """
+        from app.services.fair_scheduler import get_fair_queue, release_shards, shard_item_id, tenant_of
+
+        db = SessionLocal()
+        try:
+            job = self.start_job(db, log_ids, user_id, analysis_id)
+            if job.status == "cancelled":
+                return 0
+            self.run_generation = job.run_generation
+            # Shards stay in the job's lane
+            lane = job.priority or "normal"
+            tenant = tenant_of(db.get(User, user_id) or User(id=user_id))
+            fair_queue = get_fair_queue()
+
+            queued = 0
+            for log_id in log_ids:
+                log = db.query(SecurityLog).filter(
+                    SecurityLog.id == log_id,
+                    SecurityLog.user_id == user_id
+                ).first()
+                if not log:
+                    JobProgress(analysis_id, self.run_generation).flush(db, logs_failed=1)
+                    db.commit()
+                    continue
+
+                shards = self.plan_shards(log)
+                checkpoints = [self.load_checkpoint(db, analysis_id, log_id, *shard) for shard in shards]
+                pending = []
+                for (start, end, first_line), checkpoint in zip(shards, checkpoints):
+                    if checkpoint.completed:
+                        continue
+                    # A resumed log retries its failed shards and is reduced again
+                    checkpoint.error = None
+                    checkpoints[0].reduced = False
+                    size = (end if end is not None else log.file_size or len(log.raw_message or "")) - start
+                    pending.append((start, end, first_line, size))
+                db.commit()
+                if not pending:
+                    self.reduce_if_done(db, analysis_id, log_id)
+
+                for start, end, first_line, size in pending:
+                    fair_queue.enqueue(
+                        lane,
+                        shard_item_id(analysis_id, log_id, start, self.run_generation),
+                        tenant,
+                        size,
+                        {
+                            "analysis_id": analysis_id,
+                            "log_id": log_id,
+                            "start": start,
+                            "end": end,
+                            "first_line": first_line,
+                            "generation": self.run_generation
+                        }
+                    )
+                queued += len(pending)
+
+            self.complete_job_if_done(db, analysis_id)
+            db.commit()
+            release_shards(lane)
+            logger.info("Analysis dispatched", analysis_id=analysis_id, logs=len(log_ids),
+                        shards=queued, priority=lane, tenant=tenant, generation=self.run_generation)
+            return queued
+        except AnalysisSuperseded:
+            logger.info("Analysis dispatch superseded by a newer run", analysis_id=analysis_id,
+                        generation=self.run_generation)
+            return 0
+        finally:
+            db.close()
+
+    def analyze_shard(
+        self,
+        analysis_id: str,
+        log_id: str,
+        start: int,
+        end: Optional[int],
+        first_line: int,
+        generation: Optional[int] = None
+    ) -> Dict:
+        """
+        Map step: analyze the records of one byte range of a log.
+
+        Safe to run again after a crash or time limit; it resumes from the
+        range's checkpoint. Raises ``AnalysisCancelled`` if the job is
+        cancelled, or ``AnalysisSuperseded`` if ``generation`` (the run that
+        dispatched the shard) is no longer the job's latest.
+        """
+        self.run_generation = generation
+        db = SessionLocal()
+        try:
+            log = db.get(SecurityLog, log_id)
+            if not log:
+                raise ValueError(f"Log {log_id} not found")
+            start_time = time.time()
+            summary = self.analyze_range(db, log, analysis_id, start, end, first_line)
+            summary["duration"] = time.time() - start_time
+            return summary
+        finally:
+            db.close()
+
+    def finish_shard(self, analysis_id: str, log_id: str, start: int, error: Optional[str] = None,
+                     generation: Optional[int] = None) -> Optional[Dict]:
+        """
+        Record the outcome of a shard and reduce its log if it was the last one.
+
+        A completed shard is already marked by its checkpoint; a failed one
+        keeps ``error`` there, so the log is reduced as failed. A shard of a
+        superseded run records nothing.
+
+        Returns:
+            The merged log summary if this call reduced the log, else None
+        """
+        self.run_generation = generation
+        db = SessionLocal()
+        try:
+            if error is not None:
+                db.execute(update(AnalysisCheckpoint).where(
+                    AnalysisCheckpoint.analysis_id == analysis_id,
+                    AnalysisCheckpoint.log_id == log_id,
+                    AnalysisCheckpoint.shard_start == start
+                ).values(error=error))
+                JobProgress(analysis_id, self.run_generation).flush(db)
+                db.commit()
+            return self.reduce_if_done(db, analysis_id, log_id)
+        except AnalysisSuperseded:
+            logger.info("Shard of a superseded run not recorded", analysis_id=analysis_id,
+                        log_id=log_id, start=start, generation=generation)
+            return None
+        finally:
+            db.close()
+
+    def reduce_if_done(self, db: Session, analysis_id: str, log_id: str) -> Optional[Dict]:
+        """
+        Reduce step: merge a log's shards into the log and the job record.
+
+        Runs once every shard has completed or failed. The right to reduce
+        is claimed with a conditional update of the first shard's
+        ``reduced`` flag, so of several shards finishing together exactly
+        one reduces. Shards stopped by a cancel are neither, so a cancelled
+        job's logs are never reduced. The claim commits together with the
+        merged log and job counters, so a reducer that fails or is
+        superseded leaves the log to be reduced again.
+
+        Returns:
+            The merged log summary, or None if shards are outstanding or
+            another call reduced the log
+        """
+        checkpoints = db.query(AnalysisCheckpoint).filter(
+            AnalysisCheckpoint.analysis_id == analysis_id,
+            AnalysisCheckpoint.log_id == log_id
+        ).order_by(AnalysisCheckpoint.shard_start).all()
+        if not checkpoints or any(not c.completed and not c.error for c in checkpoints):
+            return None
+        claimed = db.execute(update(AnalysisCheckpoint).where(
+            AnalysisCheckpoint.id == checkpoints[0].id,
+            AnalysisCheckpoint.reduced.isnot(True)
+        ).values(reduced=True))
+        if not claimed.rowcount:
+            db.rollback()
+            return None
+        # A reducer of a superseded run gives its claim back
+        JobProgress(analysis_id, self.run_generation).flush(db)
+
+        errors = [c.error for c in checkpoints if c.error]
+        log = db.get(SecurityLog, log_id)
+        if errors or not log:
+            JobProgress(analysis_id, self.run_generation).flush(db, logs_failed=1)
+            logger.error("Log analysis failed", log_id=log_id, analysis_id=analysis_id, errors=errors)
+            merged = {"error": "; ".join(errors) or "Log not found"}
+        else:
+            merged = self.merge_summaries([
+                {
+                    "records": c.records,
+                    "threat_distribution": c.threat_distribution,
+                    "severity": c.severity,
+                    "templates": c.templates or []
+                }
+                for c in checkpoints
+            ])
+            self.finish_log(db, log, analysis_id, merged)
+
+        self.complete_job_if_done(db, analysis_id)
+        db.commit()
+        return merged
+
+    @classmethod
+    def complete_job_if_done(cls, db: Session, analysis_id: str) -> None:
+        """Mark the job finished once every log has completed or failed (atomic, idempotent)"""
+        finished = db.execute(
+            update(AnalysisJob)
+            .where(
+                AnalysisJob.id == analysis_id,
+                AnalysisJob.status == "processing",
+                AnalysisJob.logs_completed + AnalysisJob.logs_failed >= AnalysisJob.log_count
+            )
+            .values(
+                status=case((AnalysisJob.logs_completed == 0, "failed"), else_="completed"),
+                completed_at=datetime.utcnow()
+            )
+        )
+        if finished.rowcount:
+            cls.record_latency(db, analysis_id)
+
+    @staticmethod
+    def record_latency(db: Session, analysis_id: str) -> None:
+        """Observe submission-to-completion time of a job that just finished, per lane"""
+        row = db.query(AnalysisJob.priority, AnalysisJob.created_at).filter(AnalysisJob.id == analysis_id).first()
+        if row and row.created_at:
+            record_job_latency(row.priority or "normal", (datetime.utcnow() - row.created_at).total_seconds())
+
+    def result_row(
+        self,
+        log: SecurityLog,
+        analysis_id: str,
+        line_number: int,
+        text: str,
+        result: Dict,
+        level: ThreatLevel
+    ) -> Dict:
+        """AnalysisResult column values for one analyzed record"""
+        return {
+            "id": str(uuid.uuid4()),
+            "log_id": log.id,
+            "user_id": log.user_id,
+            "model_name": result.get("model_name") or settings.BERT_MODEL_NAME,
+            "confidence_score": result.get("confidence", 0.0),
+            "prediction": level,
+            "features": {
+                "line": line_number,
+                "excerpt": text[:EXCERPT_LENGTH],
+                "risk_score": result.get("risk_score"),
+                "indicators": result.get("features", {}),
+                "template": result.get("template")
+            },
+            "processing_time": result.get("processing_time"),
+            "model_version": self.model_version,
+            "analysis_id": analysis_id,
+            "created_at": datetime.utcnow()
+        }
+
+    @staticmethod
+    def owned_content(db: Session, user_id: str, content_hashes: Iterable[str]) -> Set[str]:
+        """The ``content_hashes`` that ``user_id`` already has uploads of"""
+        content_hashes = {h for h in content_hashes if h}
+        if not content_hashes:
+            return set()
+        return {
+            content_hash for (content_hash,) in db.query(SecurityLog.content_hash).filter(
+                SecurityLog.user_id == user_id,
+                SecurityLog.content_hash.in_(content_hashes)
+            ).distinct()
+        }
+
+    @classmethod
+    def scope_duplicates(cls, db: Session, log_rows: List[Dict]) -> None:
+        """
+        Narrow the ``duplicate`` flag of SecurityLog row dicts about to be
+        inserted, in place, to content their user uploaded before (earlier
+        in ``log_rows`` included).
+
+        Blob storage is shared, so commit_blob's flag also says whether
+        anyone else uploaded the content; that must not reach the user.
+        """
+        seen = set()
+        for user_id in {row["user_id"] for row in log_rows}:
+            seen.update((user_id, content_hash) for content_hash in cls.owned_content(
+                db, user_id, [row["content_hash"] for row in log_rows
+                              if row["user_id"] == user_id and row["parsed_data"]["duplicate"]]
+            ))
+        for row in log_rows:
+            key = (row["user_id"], row["content_hash"])
+            row["parsed_data"]["duplicate"] = row["parsed_data"]["duplicate"] and key in seen
+            seen.add(key)
+
+    def find_reusable_results(
+        self,
+        db: Session,
+        user_id: str,
+        content_hashes: Iterable[str]
+    ) -> Dict[str, Tuple[SecurityLog, List[AnalysisResult]]]:
+        """
+        Map each content hash ``user_id`` already had analyzed to the earliest
+        such log and its results.
+
+        Only the user's own logs are considered, so one user never sees
+        results derived from another's upload. A processed log only counts
+        as analyzed if it has AnalysisResult rows or a completed analysis
+        summary, all from the current model version; archives and other logs
+        marked processed without being analyzed have nothing to reuse.
+        """
+        content_hashes = {h for h in content_hashes if h}
+        if not content_hashes:
+            return {}
+
+        candidates = db.query(SecurityLog).filter(
+            SecurityLog.user_id == user_id,
+            SecurityLog.content_hash.in_(content_hashes),
+            SecurityLog.processed == True
+        ).order_by(SecurityLog.created_at).all()
+        if not candidates:
+            return {}
+
+        result_versions = {}
+        for log_id, model_version in db.query(AnalysisResult.log_id, AnalysisResult.model_version).filter(
+            AnalysisResult.log_id.in_([log.id for log in candidates])
+        ).distinct():
+            result_versions.setdefault(log_id, set()).add(model_version)
+        originals = {}
+        for log in candidates:
+            versions = set(result_versions.get(log.id, ()))
+            summary = self.analysis_summary(log)
+            if summary and summary.get("model_version"):
+                versions.add(summary["model_version"])
+            # Summaries from before model versions were recorded only count through their results
+            if versions == {self.model_version}:
+                originals.setdefault(log.content_hash, log)
+
+        if not originals:
+            return {}
+
+        results_by_log = {}
+        for result in db.query(AnalysisResult).filter(
+            AnalysisResult.log_id.in_([log.id for log in originals.values()])
+        ):
+            results_by_log.setdefault(result.log_id, []).append(result)
+
+        return {
+            content_hash: (log, results_by_log.get(log.id, []))
+            for content_hash, log in originals.items()
+        }
+
+    @staticmethod
+    def analysis_summary(log: SecurityLog) -> Optional[Dict]:
+        """The summary ``finish_log`` recorded for a log, None if it was never analyzed"""
+        return (log.parsed_data or {}).get("analysis")
+
+    def reused_summary(self, original: SecurityLog) -> Optional[Dict]:
+        """A copy of ``original``'s analysis summary for a duplicate, naming the log it came from"""
+        summary = self.analysis_summary(original)
+        if not summary:
+            return None
+        return {**summary, "reused_from": original.id}
+
+    @staticmethod
+    def copy_result(result: AnalysisResult, log_id: str, user_id: str) -> Dict:
+        """Column values for a copy of ``result`` attached to another log"""
+        return {
+            "log_id": log_id,
+            "user_id": user_id,
+            "model_name": result.model_name,
+            "confidence_score": result.confidence_score,
+            "prediction": result.prediction,
+            "features": result.features,
+            "processing_time": result.processing_time,
+            "model_version": result.model_version
+        }
+
+    def plan_result_reuse(self, db: Session, log_rows: List[Dict]) -> List[Dict]:
+        """
+        Bulk variant of ``reuse_existing_results`` for SecurityLog row dicts
+        that are about to be inserted.
+
+        Rows whose content_hash was already analyzed are marked processed
+        with the original severity and analysis summary, in place.
+
+        Returns:
+            AnalysisResult row dicts to insert after the logs
+        """
+        reusable = {
+            user_id: self.find_reusable_results(
+                db, user_id, [row.get("content_hash") for row in log_rows if row["user_id"] == user_id]
+            )
+            for user_id in {row["user_id"] for row in log_rows}
+        }
+        result_rows = []
+        for row in log_rows:
+            if row.get("content_hash") in reusable[row["user_id"]]:
+                original, results = reusable[row["user_id"]][row["content_hash"]]
+                row["severity"] = original.severity
+                row["processed"] = True
+                summary = self.reused_summary(original)
+                if summary:
+                    row["parsed_data"] = {**(row.get("parsed_data") or {}), "analysis": summary}
+                result_rows.extend(
+                    self.copy_result(result, row["id"], row["user_id"])
+                    for result in results
+                )
+        return result_rows
+
+    def reuse_existing_results(self, db: Session, log_entry: SecurityLog) -> int:
+        """
+        Attach the analysis of identical, already analyzed content to a new log.
+
+        Looks for an analyzed log of the same user with the same content_hash
+        and copies its AnalysisResult rows and analysis summary onto
+        ``log_entry`` instead of running the models again. The caller commits.
+
+        Returns:
+            Number of results reused (0 if the content has not been analyzed)
+        """
+        reusable = self.find_reusable_results(db, log_entry.user_id, [log_entry.content_hash])
+        if log_entry.content_hash not in reusable:
+            return 0
+
+        original, results = reusable[log_entry.content_hash]
+        for result in results:
+            db.add(AnalysisResult(**self.copy_result(result, log_entry.id, log_entry.user_id)))
+
+        summary = self.reused_summary(original)
+        if summary:
+            log_entry.parsed_data = {**(log_entry.parsed_data or {}), "analysis": summary}
+        log_entry.severity = original.severity
+        log_entry.processed = True
+
+        logger.info("Reused analysis of duplicate upload",
+                    log_id=log_entry.id,
+                    original_log_id=original.id,
+                    result_count=len(results))
+        return len(results)
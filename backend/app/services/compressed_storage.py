@@ -0,0 +1,337 @@
+from typing import BinaryIO, Iterator, Optional
+from array import array
+import structlog
+import bisect
+import zlib
+import io
+import os
+
+from app.core.config import settings
+
+logger = structlog.get_logger()
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip needs only the standard library
+    zstandard = None
+
+# Sidecar next to a compressed file: uint64 pairs of cumulative
+# (uncompressed end, compressed end) offsets, one pair per frame
+FRAME_INDEX_SUFFIX = ".frames"
+
+# Sidecar with line offsets of a text file (see app.services.line_index)
+LINE_INDEX_SUFFIX = ".lines"
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+TEXT_EXTENSIONS = {
+    '.txt', '.log', '.csv', '.json', '.xml', '.html', '.css', '.js',
+    '.py', '.sql', '.md', '.yaml', '.yml'
+}
+
+# Content-Encoding values accepted on uploads, mapped to codec names
+UPLOAD_ENCODINGS = {"gzip": "gzip", "x-gzip": "gzip", "zstd": "zstd", "identity": None}
+ENCODED_EXTENSIONS = {".gz": "gzip", ".zst": "zstd"}
+ENCODED_CONTENT_TYPES = {
+    "application/gzip": "gzip",
+    "application/x-gzip": "gzip",
+    "application/zstd": "zstd"
+}
+
+# zstd decompression objects cannot cap their output, so input is fed in
+# slices this small; a slice of RLE blocks expands to at most ~32MB
+ZSTD_INPUT_SLICE = 1024
+
+
+class UnsupportedEncodingError(ValueError):
+    """Raised for upload encodings that cannot be decoded here"""
+
+
+class InvalidEncodingError(ValueError):
+    """Raised when an encoded upload body is corrupt or truncated"""
+
+
+def is_text_file(filename: Optional[str], content_type: Optional[str]) -> bool:
+    """Whether an upload is line-oriented text, judged by extension or content type"""
+    extension = os.path.splitext((filename or "").lower())[1]
+    if extension:
+        return extension in TEXT_EXTENSIONS
+    return (content_type or "").startswith("text/")
+
+
+def should_compress(filename: Optional[str], content_type: Optional[str]) -> Optional[str]:
+    """Return the codec to store this upload with, or None to store it raw"""
+    codec = settings.COMPRESSED_STORAGE
+    if not codec:
+        return None
+    if codec == "zstd" and zstandard is None:
+        logger.warning("zstandard not installed, storing uploads uncompressed")
+        return None
+    return codec if is_text_file(filename, content_type) else None
+
+
+def upload_encoding(
+    filename: Optional[str],
+    content_type: Optional[str] = None,
+    declared: Optional[str] = None
+) -> Optional[str]:
+    """
+    Work out how an upload body is encoded.
+
+    An explicit Content-Encoding wins; otherwise ``.gz`` / ``.zst`` names and
+    gzip/zstd content types are treated as encoded.
+
+    Returns:
+        "gzip", "zstd" or None for plain uploads
+    """
+    if declared:
+        encoding = declared.strip().lower()
+        if encoding not in UPLOAD_ENCODINGS:
+            raise UnsupportedEncodingError(f"Unsupported Content-Encoding: {declared}")
+        codec = UPLOAD_ENCODINGS[encoding]
+    else:
+        extension = os.path.splitext((filename or "").lower())[1]
+        codec = ENCODED_EXTENSIONS.get(extension) or ENCODED_CONTENT_TYPES.get(content_type or "")
+
+    if codec == "zstd" and zstandard is None:
+        raise UnsupportedEncodingError("zstd-encoded uploads require the zstandard package")
+    return codec
+
+
+def decoded_filename(filename: str, codec: Optional[str]) -> str:
+    """Name of the decoded file, e.g. ``app.log.gz`` -> ``app.log``"""
+    root, extension = os.path.splitext(filename)
+    if codec and ENCODED_EXTENSIONS.get(extension.lower()) == codec:
+        return root
+    return filename
+
+
+class StreamDecoder:
+    """
+    Incremental gzip/zstd decoder for upload bodies.
+
+    ``decode`` yields output in pieces of at most ``max_output`` bytes (for
+    gzip) so a small, highly compressed input never materializes in memory
+    at once; callers enforce size limits on the yielded bytes. Concatenated
+    gzip members and zstd frames are decoded back to back.
+    """
+
+    def __init__(self, codec: str, max_output: Optional[int] = None):
+        self.codec = codec
+        self.max_output = max_output or settings.UPLOAD_BUFFER_SIZE
+        self._decompressor = self._new_decompressor()
+        self._started = False
+
+    def _new_decompressor(self):
+        if self.codec == "zstd":
+            return zstandard.ZstdDecompressor().decompressobj()
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        try:
+            while data:
+                if self._decompressor.eof:
+                    # The previous member/frame ended; the next one starts here
+                    self._decompressor = self._new_decompressor()
+                self._started = True
+                if self.codec == "zstd":
+                    piece, data = data[:ZSTD_INPUT_SLICE], data[ZSTD_INPUT_SLICE:]
+                    output = self._decompressor.decompress(piece)
+                else:
+                    output = self._decompressor.decompress(data, self.max_output)
+                    data = self._decompressor.unconsumed_tail
+                if self._decompressor.eof:
+                    data = self._decompressor.unused_data + data
+                if output:
+                    yield output
+        except (zlib.error, getattr(zstandard, "ZstdError", zlib.error)) as e:
+            raise InvalidEncodingError(f"Invalid {self.codec} data: {e}") from e
+
+    def finish(self) -> Iterator[bytes]:
+        """Yield any remaining output and check the stream was complete"""
+        if self.codec != "zstd":
+            remaining = self._decompressor.flush()
+            if remaining:
+                yield remaining
+        if self._started and not self._decompressor.eof:
+            raise InvalidEncodingError(f"Truncated {self.codec} stream")
+
+
+def compress_frame(data: bytes, codec: str) -> bytes:
+    """Compress one self-contained frame (a gzip member or a zstd frame)"""
+    if codec == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress_frame(data: bytes) -> bytes:
+    """Decompress one frame, detecting the codec from its magic bytes"""
+    if data.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed uploads")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+def load_frame_index(file_path: str) -> array:
+    """Load the frame index of a compressed file as a flat uint64 array"""
+    index = array("Q")
+    with open(file_path + FRAME_INDEX_SUFFIX, "rb") as f:
+        index.frombytes(f.read())
+    return index
+
+
+def is_compressed(file_path: str) -> bool:
+    """Whether a stored file was written by FrameWriter"""
+    return os.path.exists(file_path + FRAME_INDEX_SUFFIX)
+
+
+def stored_size(file_path: str) -> int:
+    """Logical (uncompressed) size of a stored file"""
+    if is_compressed(file_path):
+        index = load_frame_index(file_path)
+        return index[-2] if index else 0
+    return os.path.getsize(file_path)
+
+
+def remove_stored_file(file_path: str) -> None:
+    """Remove a stored file together with its sidecar indexes, if any"""
+    for path in (file_path, file_path + FRAME_INDEX_SUFFIX, file_path + LINE_INDEX_SUFFIX):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class FrameWriter:
+    """
+    Writes a file as a sequence of independently compressed frames.
+
+    Incoming bytes are buffered up to COMPRESSION_FRAME_SIZE, compressed as
+    one frame and appended to the file; the frame's end offsets are then
+    appended to the ``.frames`` sidecar. Concatenated gzip members and zstd
+    frames are valid streams for the standard tools, and the index lets
+    readers seek to any frame without decompressing the ones before it.
+
+    With ``append=True`` an interrupted file is continued after its last
+    indexed frame (anything past it is discarded).
+    """
+
+    def __init__(self, file_path: str, codec: str, append: bool = False, frame_size: Optional[int] = None):
+        self.file_path = file_path
+        self.codec = codec
+        self.frame_size = frame_size or settings.COMPRESSION_FRAME_SIZE
+        self._buffer = bytearray()
+
+        if append and is_compressed(file_path):
+            index = load_frame_index(file_path)
+            self.size = index[-2] if index else 0
+            self.compressed_size = index[-1] if index else 0
+        else:
+            self.size = 0
+            self.compressed_size = 0
+
+        self._file = open(file_path, "r+b" if append and os.path.exists(file_path) else "wb")
+        self._file.truncate(self.compressed_size)
+        self._file.seek(self.compressed_size)
+        self._index = open(file_path + FRAME_INDEX_SUFFIX, "ab" if append else "wb")
+
+    def write(self, data: bytes) -> None:
+        self._buffer += data
+        while len(self._buffer) >= self.frame_size:
+            self._write_frame(bytes(self._buffer[:self.frame_size]))
+            del self._buffer[:self.frame_size]
+
+    def _write_frame(self, data: bytes) -> None:
+        frame = compress_frame(data, self.codec)
+        self._file.write(frame)
+        self._file.flush()
+        self.size += len(data)
+        self.compressed_size += len(frame)
+        # Index entry last, so a crash never indexes a partial frame
+        self._index.write(array("Q", [self.size, self.compressed_size]).tobytes())
+        self._index.flush()
+
+    def close(self) -> None:
+        """Flush buffered bytes as a final frame and close the file"""
+        try:
+            if self._buffer:
+                self._write_frame(bytes(self._buffer))
+                self._buffer.clear()
+        finally:
+            self._file.close()
+            self._index.close()
+
+
+class FramedReader(io.RawIOBase):
+    """
+    Seekable reader over a FrameWriter file.
+
+    Reads decompress only the frame containing the current position, so
+    memory is bounded by one frame and seeking is O(log frames).
+    """
+
+    def __init__(self, file_path: str):
+        super().__init__()
+        index = load_frame_index(file_path)
+        self._ends = index[0::2]
+        self._compressed_ends = index[1::2]
+        self._file = open(file_path, "rb")
+        self._position = 0
+        self._frame_number = None
+        self._frame = b""
+
+    @property
+    def size(self) -> int:
+        return self._ends[-1] if self._ends else 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(offset, 0)
+        return self._position
+
+    def _load_frame(self, frame_number: int) -> None:
+        if frame_number != self._frame_number:
+            start = self._compressed_ends[frame_number - 1] if frame_number else 0
+            self._file.seek(start)
+            self._frame = decompress_frame(self._file.read(self._compressed_ends[frame_number] - start))
+            self._frame_number = frame_number
+
+    def readinto(self, buffer) -> int:
+        if self._position >= self.size:
+            return 0
+        frame_number = bisect.bisect_right(self._ends, self._position)
+        self._load_frame(frame_number)
+        frame_start = self._ends[frame_number - 1] if frame_number else 0
+        data = self._frame[self._position - frame_start:self._position - frame_start + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
+
+def open_stored_file(file_path: str, buffer_size: Optional[int] = None) -> BinaryIO:
+    """
+    Open a stored upload for reading, decompressing on the fly if needed.
+
+    The returned binary file object is seekable and supports readline and
+    iteration regardless of whether the file is stored raw or compressed.
+    """
+    if is_compressed(file_path):
+        return io.BufferedReader(FramedReader(file_path), buffer_size or settings.UPLOAD_BUFFER_SIZE)
+    return open(file_path, "rb")
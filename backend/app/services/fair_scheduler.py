@@ -0,0 +1,181 @@
+from typing import Dict, List, Optional
+import json
+import time
+import structlog
+
+from app.core.config import settings
+from app.core.monitoring import record_tenant_queue_depth, record_tenant_wait
+
+logger = structlog.get_logger()
+
+SHARD_TASK = "app.tasks.analysis_tasks.analyze_log_shard_task"
+
+
+def tenant_of(user) -> str:
+    """Scheduling tenant of a user: its company with FAIR_TENANT_KEY="company", else the user itself"""
+    if settings.FAIR_TENANT_KEY == "company" and getattr(user, "company_name", None):
+        return f"company:{user.company_name}"
+    return f"user:{user.id}"
+
+
+def tenant_weight(tenant: str) -> float:
+    """Weight of a tenant from TENANT_WEIGHTS (keyed with or without the user:/company: prefix)"""
+    weights = settings.TENANT_WEIGHTS
+    weight = weights.get(tenant, weights.get(tenant.split(":", 1)[-1], settings.TENANT_DEFAULT_WEIGHT))
+    return max(float(weight), 1e-6)
+
+
+def shard_item_id(analysis_id: str, log_id: str, start: int, generation: Optional[int] = None) -> str:
+    """Fair queue id of a shard; a resumed run's shards are new items, not deduplicated against the old run's"""
+    item_id = f"{analysis_id}:{log_id}:{start}"
+    return item_id if generation is None else f"{item_id}:{generation}"
+
+
+class FairQueue:
+    """
+    Weighted fair queue of analysis shards, one per lane, in Redis.
+
+    Shards are not handed to Celery when a job is dispatched. They wait
+    here, tagged with a virtual finish time: a tenant's previous tag (or
+    the queue's current virtual time, if the tenant was idle) plus the
+    shard's bytes divided by the tenant's weight. ``pop`` releases the
+    smallest tag, so tenants are served in weighted round-robin by bytes
+    and one tenant's backlog cannot monopolize the workers. At most
+    ``max_in_flight`` shards per lane are released at a time, which keeps
+    the Celery queue short enough for this order to matter.
+
+    Keys per lane: ``fair:<lane>:queue`` (zset of tags), ``:items``
+    (payloads), ``:tags`` (last tag per tenant), ``:vtime``, ``:depth``
+    (queued shards per tenant) and ``:inflight`` (time each shard was
+    released or last started running).
+    """
+
+    ENQUEUE_SCRIPT = """
+        if redis.call('HEXISTS', KEYS[2], ARGV[1]) == 1 then
+            return 0
+        end
+        local last = tonumber(redis.call('HGET', KEYS[3], ARGV[2]) or '0')
+        local vtime = tonumber(redis.call('GET', KEYS[4]) or '0')
+        local tag = math.max(last, vtime) + tonumber(ARGV[3])
+        redis.call('HSET', KEYS[3], ARGV[2], tag)
+        redis.call('ZADD', KEYS[1], tag, ARGV[1])
+        redis.call('HSET', KEYS[2], ARGV[1], ARGV[4])
+        redis.call('HINCRBY', KEYS[5], ARGV[2], 1)
+        return 1
+    """
+
+    POP_SCRIPT = """
+        if redis.call('HLEN', KEYS[6]) >= tonumber(ARGV[2]) then
+            return false
+        end
+        local popped = redis.call('ZPOPMIN', KEYS[1])
+        if #popped == 0 then
+            return false
+        end
+        redis.call('SET', KEYS[4], popped[2])
+        local payload = redis.call('HGET', KEYS[2], popped[1])
+        redis.call('HDEL', KEYS[2], popped[1])
+        redis.call('HSET', KEYS[6], popped[1], ARGV[1])
+        if payload then
+            local tenant = cjson.decode(payload)['tenant']
+            if redis.call('HINCRBY', KEYS[5], tenant, -1) <= 0 then
+                redis.call('HDEL', KEYS[5], tenant)
+            end
+        end
+        return payload
+    """
+
+    def __init__(self, url: Optional[str] = None):
+        import redis
+
+        self.client = redis.Redis.from_url(url or settings.REDIS_URL, decode_responses=True)
+        self._enqueue = self.client.register_script(self.ENQUEUE_SCRIPT)
+        self._pop = self.client.register_script(self.POP_SCRIPT)
+
+    @staticmethod
+    def _keys(lane: str) -> List[str]:
+        return [f"fair:{lane}:{name}" for name in ("queue", "items", "tags", "vtime", "depth", "inflight")]
+
+    def enqueue(self, lane: str, item_id: str, tenant: str, cost: int, task_kwargs: Dict) -> bool:
+        """Queue a shard; re-queueing a shard that is still waiting is a no-op"""
+        payload = json.dumps({
+            "id": item_id,
+            "tenant": tenant,
+            "task": task_kwargs,
+            "enqueued_at": time.time()
+        })
+        keys = self._keys(lane)
+        added = self._enqueue(
+            keys=keys[:5],
+            args=[item_id, tenant, max(cost, 1) / tenant_weight(tenant), payload]
+        )
+        return bool(added)
+
+    def pop(self, lane: str, max_in_flight: int) -> Optional[Dict]:
+        """Release the next shard in fair order, or None if the lane is empty or at capacity"""
+        payload = self._pop(keys=self._keys(lane), args=[time.time(), max_in_flight])
+        return json.loads(payload) if payload else None
+
+    def touch(self, lane: str, item_id: str) -> None:
+        """Restart the in-flight clock of a shard that is still running, so ``reap`` keeps its slot"""
+        self.client.hset(self._keys(lane)[5], item_id, time.time())
+
+    def release(self, lane: str, item_id: str) -> None:
+        """Free the in-flight slot of a finished shard"""
+        self.client.hdel(self._keys(lane)[5], item_id)
+
+    def reap(self, lane: str, timeout: int) -> int:
+        """Free slots of shards released more than ``timeout`` seconds ago and never reported back"""
+        inflight_key = self._keys(lane)[5]
+        cutoff = time.time() - timeout
+        stale = [item_id for item_id, released_at in self.client.hgetall(inflight_key).items()
+                 if float(released_at) < cutoff]
+        if stale:
+            self.client.hdel(inflight_key, *stale)
+            logger.warning("Reclaimed in-flight slots of unreported shards", lane=lane, shards=len(stale))
+        return len(stale)
+
+    def depths(self, lane: str) -> Dict[str, int]:
+        """Queued shards per tenant"""
+        return {tenant: int(depth) for tenant, depth in self.client.hgetall(self._keys(lane)[4]).items()}
+
+
+_fair_queue: Optional[FairQueue] = None
+
+
+def get_fair_queue() -> FairQueue:
+    """Process-wide FairQueue on REDIS_URL"""
+    global _fair_queue
+    if _fair_queue is None:
+        _fair_queue = FairQueue()
+    return _fair_queue
+
+
+def release_shards(lane: str) -> int:
+    """
+    Hand waiting shards of a lane to Celery, in fair order, until the lane
+    is at FAIR_MAX_IN_FLIGHT or empty.
+
+    Called after dispatch, whenever a shard finishes and periodically.
+
+    Returns:
+        Number of shards released
+    """
+    from app.core.celery_app import celery_app
+    from app.services.analysis_service import analysis_queue
+
+    queue = get_fair_queue()
+    max_in_flight = settings.FAIR_MAX_IN_FLIGHT.get(lane, settings.FAIR_MAX_IN_FLIGHT.get("normal", 8))
+    released = 0
+    while True:
+        item = queue.pop(lane, max_in_flight)
+        if item is None:
+            break
+        celery_app.send_task(SHARD_TASK, kwargs={**item["task"], "lane": lane}, queue=analysis_queue(lane))
+        record_tenant_wait(lane, item["tenant"], time.time() - item["enqueued_at"])
+        released += 1
+
+    depths = queue.depths(lane)
+    for tenant, depth in depths.items():
+        record_tenant_queue_depth(lane, tenant, depth)
+    return released
@@ -0,0 +1,164 @@
+from typing import List, Optional, Tuple
+from array import array
+import numpy as np
+import structlog
+import mmap
+import os
+
+from app.core.config import settings
+from app.services.compressed_storage import LINE_INDEX_SUFFIX, open_stored_file
+
+logger = structlog.get_logger()
+
+# Sidecar layout (native uint64): interval, line count, file size, then the
+# byte offset at which every interval-th line starts (line 0, N, 2N, ...)
+HEADER_FIELDS = 3
+
+
+class LineIndexBuilder:
+    """
+    Builds a line-offset index from the bytes of a file as they are written.
+
+    Only every ``interval``-th line start is kept, so the index of a 20GB
+    log with ~100 byte lines is about 1.6MB. Newlines are located with
+    numpy per chunk rather than per line in Python.
+    """
+
+    def __init__(self, interval: Optional[int] = None):
+        self.interval = interval or settings.LINE_INDEX_INTERVAL
+        self.offsets = array("Q", [0])
+        self.newlines = 0
+        self.size = 0
+        self._last_byte = b"\n"
+
+    def feed(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        positions = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 0x0A)
+        # The line after global newline g starts a checkpoint when (g + 1) % interval == 0
+        first = -(self.newlines + 1) % self.interval
+        self.offsets.extend((positions[first::self.interval] + 1 + self.size).tolist())
+        self.newlines += len(positions)
+        self.size += len(chunk)
+        self._last_byte = chunk[-1:]
+
+    @property
+    def line_count(self) -> int:
+        # A final line without a trailing newline still counts
+        return self.newlines + (self._last_byte != b"\n")
+
+    def write(self, file_path: str) -> None:
+        """Write the index next to ``file_path``, replacing any previous one"""
+        offsets = self.offsets
+        if offsets and offsets[-1] >= self.size:
+            # A checkpoint right at EOF points at a line that does not exist
+            offsets = offsets[:-1] if self.size else offsets
+        index_path = file_path + LINE_INDEX_SUFFIX
+        temp_path = index_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            array("Q", [self.interval, self.line_count, self.size]).tofile(f)
+            offsets.tofile(f)
+        os.replace(temp_path, index_path)
+
+
+class LineIndex:
+    """Read-only, memory-mapped view of a line index sidecar"""
+
+    def __init__(self, file_path: str):
+        with open(file_path + LINE_INDEX_SUFFIX, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap).cast("Q")
+        self.interval, self.line_count, self.size = self._view[:HEADER_FIELDS]
+        self.offsets = self._view[HEADER_FIELDS:]
+
+    def checkpoint(self, line: int) -> Tuple[int, int]:
+        """Nearest indexed line at or before ``line`` as (line number, byte offset)"""
+        slot = min(line // self.interval, len(self.offsets) - 1)
+        return slot * self.interval, self.offsets[slot]
+
+    def close(self) -> None:
+        self.offsets.release()
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def has_line_index(file_path: str) -> bool:
+    return os.path.exists(file_path + LINE_INDEX_SUFFIX)
+
+
+def build_line_index(file_path: str, interval: Optional[int] = None) -> None:
+    """Index an already stored file with one sequential pass"""
+    builder = LineIndexBuilder(interval)
+    with open_stored_file(file_path) as f:
+        while True:
+            block = f.read(settings.UPLOAD_BUFFER_SIZE)
+            if not block:
+                break
+            builder.feed(block)
+    builder.write(file_path)
+    logger.info("Line index built", file_path=file_path, lines=builder.line_count)
+
+
+def read_line(f, limit: int) -> Tuple[bytes, bool]:
+    """
+    Read one line of at most ``limit`` bytes and whether it was cut short.
+
+    The rest of a longer line is skipped in ``limit``-sized pieces, so a
+    file without newlines is never read into memory whole.
+    """
+    line = f.readline(limit)
+    if len(line) < limit or line.endswith(b"\n"):
+        return line, False
+    truncated = False
+    while True:
+        rest = f.readline(limit)
+        if rest.rstrip(b"\r\n"):
+            truncated = True
+        if not rest or rest.endswith(b"\n"):
+            return line, truncated
+
+
+def read_lines(
+    file_path: str,
+    start: int,
+    end: int,
+    max_line_length: Optional[int] = None
+) -> Tuple[List[bytes], List[int], int]:
+    """
+    Return lines ``[start, end)`` of a stored file, the numbers of the lines
+    among them that were truncated, and the file's total line count.
+
+    Seeks to the nearest indexed line before ``start`` and reads forward at
+    most LINE_INDEX_INTERVAL lines, so the cost does not depend on where in
+    the file the range lies. Builds the index first if the file has none.
+
+    Lines longer than ``max_line_length`` (UPLOAD_BUFFER_SIZE by default)
+    are cut to that many bytes.
+    """
+    limit = max_line_length or settings.UPLOAD_BUFFER_SIZE
+    if not has_line_index(file_path):
+        build_line_index(file_path)
+
+    with LineIndex(file_path) as index:
+        line_count = index.line_count
+        if start >= line_count:
+            return [], [], line_count
+        line, offset = index.checkpoint(start)
+
+    lines, truncated = [], []
+    with open_stored_file(file_path) as f:
+        f.seek(offset)
+        for _ in range(start - line):
+            read_line(f, limit)
+        for number in range(start, min(end, line_count)):
+            text, cut = read_line(f, limit)
+            lines.append(text)
+            if cut:
+                truncated.append(number)
+    return lines, truncated, line_count
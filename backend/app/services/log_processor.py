@@ -1,5 +1,58 @@
+from typing import Iterator, Optional, Tuple
+import structlog
+
+from app.core.config import settings
+from app.services.compressed_storage import open_stored_file
+
+logger = structlog.get_logger()
+
+
 class LogProcessor:
     def process_log(self, log):
         # Placeholder for log processing logic
         print(f"Processing log {log.id}")
-        return True 
\ No newline at end of file
+        return True
+
+    def iter_records(
+        self,
+        file_path: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        first_line: int = 0,
+        max_length: Optional[int] = None
+    ) -> Iterator[Tuple[int, str, int]]:
+        """
+        Split a stored log file into records, one per non-empty line.
+
+        Only lines starting in the byte range ``[start, end)`` are read;
+        ``start`` must be a line start and ``first_line`` its 0-based line
+        number (see ``AnalysisService.plan_shards``). The file is read
+        through a bounded buffer and lines longer than ``max_length`` bytes
+        are truncated (the rest of the line is skipped without being held in
+        memory), so memory does not grow with file or line size.
+
+        Yields:
+            (0-based line number, decoded record text, byte offset just
+            past the line, i.e. where the next line starts)
+        """
+        max_length = max_length or settings.ANALYSIS_MAX_RECORD_LENGTH
+        with open_stored_file(file_path) as f:
+            f.seek(start)
+            position = start
+            line_number = first_line
+            while end is None or position < end:
+                line = f.readline(max_length)
+                if not line:
+                    break
+                position += len(line)
+                if not line.endswith(b"\n"):
+                    # Truncated: discard the remainder of this line
+                    while True:
+                        rest = f.readline(settings.UPLOAD_BUFFER_SIZE)
+                        position += len(rest)
+                        if not rest or rest.endswith(b"\n"):
+                            break
+                text = line.decode("utf-8", errors="replace").strip()
+                if text:
+                    yield line_number, text, position
+                line_number += 1
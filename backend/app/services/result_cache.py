@@ -0,0 +1,279 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional
+import threading
+import hashlib
+import sqlite3
+import json
+import time
+import os
+import structlog
+
+from app.core.config import settings
+from app.core.monitoring import record_cache_lookup
+
+logger = structlog.get_logger()
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different copies of a line share a cache entry"""
+    return " ".join(text.split())
+
+
+def text_digest(text: str) -> str:
+    """SHA-256 hex digest of a normalized text"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8", "surrogateescape")).hexdigest()
+
+
+def file_digest(file_path: str) -> str:
+    """SHA-256 hex digest of a file's bytes, read in UPLOAD_BUFFER_SIZE blocks"""
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(settings.UPLOAD_BUFFER_SIZE)
+            if not block:
+                break
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _json_default(value):
+    # numpy scalars and arrays in analyzer output
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+class ResultCacheStore(ABC):
+    """
+    Shared tier of the result cache.
+
+    Entries are JSON-encoded analyzer results stored under
+    ``(kind, model_name, model_version, digest)`` and expire after ``ttl``
+    seconds. ``retain_version`` drops a model's entries of every other
+    version.
+    """
+
+    def __init__(self, ttl: Optional[int] = None):
+        self.ttl = ttl or settings.RESULT_CACHE_TTL
+
+    @abstractmethod
+    def get(self, kind: str, model_name: str, model_version: str, digest: str) -> Optional[str]:
+        """The cached JSON for a key, None on a miss"""
+
+    @abstractmethod
+    def set(self, kind: str, model_name: str, model_version: str, digest: str, value: str) -> None:
+        """Store ``value`` under a key for ``ttl`` seconds"""
+
+    @abstractmethod
+    def retain_version(self, kind: str, model_name: str, model_version: str) -> int:
+        """Delete entries of ``model_name`` with another version; returns how many"""
+
+
+class SQLiteResultCacheStore(ResultCacheStore):
+    """SQLite-backed shared tier, for worker processes on one host"""
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[int] = None):
+        super().__init__(ttl)
+        self.path = path or settings.RESULT_CACHE_SQLITE_PATH
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS result_cache (
+                kind TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                model_version TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (kind, model_name, model_version, digest)
+            )
+        """)
+
+    def get(self, kind, model_name, model_version, digest):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM result_cache WHERE kind = ? AND model_name = ? AND model_version = ? "
+                "AND digest = ? AND expires_at > ?",
+                (kind, model_name, model_version, digest, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, kind, model_name, model_version, digest, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO result_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, model_name, model_version, digest, value, time.time() + self.ttl)
+            )
+
+    def retain_version(self, kind, model_name, model_version):
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM result_cache WHERE kind = ? AND model_name = ? "
+                "AND (model_version != ? OR expires_at <= ?)",
+                (kind, model_name, model_version, time.time())
+            )
+        return deleted.rowcount
+
+
+class RedisResultCacheStore(ResultCacheStore):
+    """
+    Redis-backed shared tier for every worker and host.
+
+    Entries live at ``result_cache:<kind>:<model>:<version>:<digest>`` with
+    a TTL; the version currently in use per model is kept at
+    ``result_cache_version:<kind>:<model>``.
+    """
+
+    def __init__(self, url: Optional[str] = None, ttl: Optional[int] = None):
+        super().__init__(ttl)
+        import redis
+
+        self.client = redis.Redis.from_url(url or settings.REDIS_URL, decode_responses=True)
+
+    @staticmethod
+    def _key(kind, model_name, model_version, digest) -> str:
+        return f"result_cache:{kind}:{model_name}:{model_version}:{digest}"
+
+    def get(self, kind, model_name, model_version, digest):
+        return self.client.get(self._key(kind, model_name, model_version, digest))
+
+    def set(self, kind, model_name, model_version, digest, value):
+        self.client.set(self._key(kind, model_name, model_version, digest), value, ex=self.ttl)
+
+    def retain_version(self, kind, model_name, model_version):
+        previous = self.client.getset(f"result_cache_version:{kind}:{model_name}", model_version)
+        if previous is None or previous == model_version:
+            return 0
+        # First process to see the new version clears the old one
+        deleted = 0
+        for key in self.client.scan_iter(match=f"result_cache:{kind}:{model_name}:*", count=1000):
+            if not key.startswith(f"result_cache:{kind}:{model_name}:{model_version}:"):
+                deleted += self.client.delete(key)
+        return deleted
+
+
+class ResultCache:
+    """
+    Two-tier cache of analyzer results for one ``kind`` ("text" or "image").
+
+    Lookups try an in-process LRU of RESULT_CACHE_LRU_SIZE entries, then the
+    shared store; shared hits are promoted into the LRU. Keys include the
+    model name and version, so a new model never sees the old model's
+    verdicts, and the first lookup under a new version purges the old
+    entries. Hits and misses are counted per tier.
+    """
+
+    def __init__(self, kind: str, store: Optional[ResultCacheStore] = None, lru_size: Optional[int] = None):
+        self.kind = kind
+        self.store = store
+        self.lru_size = lru_size if lru_size is not None else settings.RESULT_CACHE_LRU_SIZE
+        self._lru: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._versions: Dict[str, str] = {}
+
+    def _check_version(self, model_name: str, model_version: str) -> None:
+        if self._versions.get(model_name) == model_version:
+            return
+        with self._lock:
+            for key in [key for key in self._lru if key[0] == model_name and key[1] != model_version]:
+                del self._lru[key]
+        if self.store is not None:
+            try:
+                deleted = self.store.retain_version(self.kind, model_name, model_version)
+                if deleted:
+                    logger.info("Result cache invalidated for new model version",
+                                kind=self.kind, model_name=model_name,
+                                model_version=model_version, entries=deleted)
+            except Exception as e:
+                logger.warning("Result cache invalidation failed", kind=self.kind, error=str(e))
+        self._versions[model_name] = model_version
+
+    def get(self, model_name: str, model_version: str, digest: str) -> Optional[Dict]:
+        """Cached result for ``digest`` under this model and version, or None"""
+        self._check_version(model_name, model_version)
+        key = (model_name, model_version, digest)
+        with self._lock:
+            value = self._lru.get(key)
+            if value is not None:
+                self._lru.move_to_end(key)
+        record_cache_lookup(self.kind, "memory", value is not None)
+
+        if value is None and self.store is not None:
+            try:
+                value = self.store.get(self.kind, model_name, model_version, digest)
+            except Exception as e:
+                # A shared tier outage degrades to recomputing, never to failing analysis
+                logger.warning("Result cache read failed", kind=self.kind, error=str(e))
+            record_cache_lookup(self.kind, "shared", value is not None)
+            if value is not None:
+                self._remember(key, value)
+
+        return json.loads(value) if value is not None else None
+
+    def set(self, model_name: str, model_version: str, digest: str, result: Dict) -> None:
+        """Store a result in both tiers"""
+        value = json.dumps(result, default=_json_default)
+        self._remember((model_name, model_version, digest), value)
+        if self.store is not None:
+            try:
+                self.store.set(self.kind, model_name, model_version, digest, value)
+            except Exception as e:
+                logger.warning("Result cache write failed", kind=self.kind, error=str(e))
+
+    def _remember(self, key: tuple, value: str) -> None:
+        if not self.lru_size:
+            return
+        with self._lock:
+            self._lru[key] = value
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop the in-process tier"""
+        with self._lock:
+            self._lru.clear()
+
+
+_store: Optional[ResultCacheStore] = None
+_caches: Dict[str, ResultCache] = {}
+
+
+def get_result_cache_store() -> Optional[ResultCacheStore]:
+    """Process-wide shared tier selected by RESULT_CACHE_BACKEND, or None"""
+    global _store
+    if _store is None and settings.RESULT_CACHE_BACKEND:
+        if settings.RESULT_CACHE_BACKEND == "redis":
+            _store = RedisResultCacheStore()
+        elif settings.RESULT_CACHE_BACKEND == "sqlite":
+            _store = SQLiteResultCacheStore()
+        else:
+            raise ValueError(f"Unknown result cache backend: {settings.RESULT_CACHE_BACKEND}")
+        logger.info("Result cache store initialized", backend=settings.RESULT_CACHE_BACKEND)
+    return _store
+
+
+def get_result_cache(kind: str) -> Optional[ResultCache]:
+    """Process-wide ResultCache for ``kind``, or None when RESULT_CACHE_ENABLED is off"""
+    if not settings.RESULT_CACHE_ENABLED:
+        return None
+    if kind not in _caches:
+        _caches[kind] = ResultCache(kind, get_result_cache_store())
+    return _caches[kind]
+
+
+def reset_after_fork() -> None:
+    """
+    Give a forked process its own shared-tier connection.
+
+    A SQLite connection must not be used on both sides of a fork; caches
+    inherited from the parent are pointed at a store opened in this process.
+    """
+    global _store
+    _store = None
+    for cache in _caches.values():
+        cache.store = get_result_cache_store()
@@ -0,0 +1,167 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import structlog
+import re
+
+from app.core.config import settings
+
+logger = structlog.get_logger()
+
+WILDCARD = "<*>"
+
+# Variable fields replaced before tokenizing, most specific first
+MASKS = [
+    (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), "<UUID>"),
+    (re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?\b'), "<IP>"),
+    (re.compile(r'\b0x[0-9a-fA-F]+\b'), "<HEX>"),
+    (re.compile(r'\b[0-9a-fA-F]{16,}\b'), "<HEX>"),
+    (re.compile(r'(?<![A-Za-z])[-+]?\d+(?:\.\d+)?(?![A-Za-z])'), "<NUM>"),
+]
+
+MASK_NAMES = {mask for _, mask in MASKS}
+
+SEVERITY_ORDER = ["normal", "low", "medium", "high", "critical"]
+
+
+class LogTemplate:
+    """One cluster of log lines sharing a message shape"""
+
+    __slots__ = ("template_id", "tokens", "count", "examples", "result")
+
+    def __init__(self, template_id: int, tokens: List[str]):
+        self.template_id = template_id
+        self.tokens = tokens
+        self.count = 0
+        self.examples: List[List[str]] = []
+        self.result: Optional[Dict] = None  # Verdict of the representative line
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.tokens)
+
+
+class TemplateMiner:
+    """
+    Online log template miner after Drain (He et al., ICWS 2017).
+
+    Lines are masked (IPs, numbers, UUIDs, hex), split on whitespace and
+    routed through a fixed-depth tree: first by token count, then by their
+    first ``depth - 2`` tokens. The leaf holds candidate templates; the line
+    joins the most similar one if at least ``similarity`` of its tokens
+    match, turning differing positions into wildcards, or starts a new
+    template. Cost per line is independent of how many lines came before.
+
+    At most ``max_templates`` templates are kept; once full, lines that
+    match no existing template are not clustered (``add`` returns None).
+    """
+
+    def __init__(
+        self,
+        depth: Optional[int] = None,
+        similarity: Optional[float] = None,
+        max_children: Optional[int] = None,
+        max_templates: Optional[int] = None,
+        max_examples: Optional[int] = None
+    ):
+        self.depth = max(depth or settings.TEMPLATE_DEPTH, 3)
+        self.similarity = similarity if similarity is not None else settings.TEMPLATE_SIMILARITY
+        self.max_children = max_children or settings.TEMPLATE_MAX_CHILDREN
+        self.max_templates = max_templates or settings.TEMPLATE_MAX_TEMPLATES
+        self.max_examples = max_examples if max_examples is not None else settings.TEMPLATE_EXAMPLES
+        self.templates: List[LogTemplate] = []
+        self._root: Dict = {}
+
+    @staticmethod
+    def tokenize(line: str) -> Tuple[List[str], List[str]]:
+        """Masked tokens of a line plus the values the masks replaced"""
+        values: List[str] = []
+
+        def replace(match, mask):
+            values.append(match.group(0))
+            return mask
+
+        for pattern, mask in MASKS:
+            line = pattern.sub(lambda match, mask=mask: replace(match, mask), line)
+        return line.split(), values
+
+    def _leaf(self, tokens: List[str]) -> List[LogTemplate]:
+        node = self._root.setdefault(len(tokens), {})
+        for token in tokens[:self.depth - 2]:
+            if any(char.isdigit() for char in token):
+                token = WILDCARD
+            if token not in node:
+                # A full node sends unseen tokens down the shared wildcard branch
+                token = token if len(node) < self.max_children else WILDCARD
+            node = node.setdefault(token, {})
+        return node.setdefault(None, [])
+
+    @staticmethod
+    def _similarity(template: List[str], tokens: List[str]) -> Tuple[float, int]:
+        same = wildcards = 0
+        for expected, token in zip(template, tokens):
+            if expected == WILDCARD:
+                wildcards += 1
+            elif expected == token:
+                same += 1
+        return same / max(len(tokens), 1), wildcards
+
+    def add(self, line: str) -> Optional[LogTemplate]:
+        """Assign a line to its template, creating or generalizing one as needed"""
+        tokens, values = self.tokenize(line)
+        leaf = self._leaf(tokens)
+
+        best, best_score = None, (-1.0, -1)
+        for template in leaf:
+            score = self._similarity(template.tokens, tokens)
+            if score > best_score:
+                best, best_score = template, score
+
+        if best is not None and best_score[0] >= self.similarity:
+            best.tokens = [
+                expected if expected == token else WILDCARD
+                for expected, token in zip(best.tokens, tokens)
+            ]
+        elif len(self.templates) < self.max_templates:
+            best = LogTemplate(len(self.templates), tokens)
+            leaf.append(best)
+            self.templates.append(best)
+        else:
+            return None
+
+        best.count += 1
+        if len(best.examples) < self.max_examples:
+            variables = [
+                token for expected, token in zip(best.tokens, tokens)
+                if expected == WILDCARD and token not in MASK_NAMES
+            ]
+            best.examples.append(values + variables)
+        return best
+
+    def summary(self, limit: Optional[int] = None) -> List[Dict]:
+        """Templates by descending count, with examples and their verdict"""
+        templates = sorted(self.templates, key=lambda template: template.count, reverse=True)
+        return [
+            {
+                "template": template.text,
+                "count": template.count,
+                "examples": template.examples,
+                "severity": (template.result or {}).get("threat_level")
+            }
+            for template in templates[:limit or settings.TEMPLATE_SUMMARY_LIMIT]
+        ]
+
+
+def merge_template_summaries(summaries: Iterable[List[Dict]], limit: Optional[int] = None) -> List[Dict]:
+    """Combine template summaries (of shards or resumed runs) by template text"""
+    merged: Dict[str, Dict] = {}
+    for summary in summaries:
+        for entry in summary or []:
+            current = merged.get(entry["template"])
+            if current is None:
+                merged[entry["template"]] = {**entry, "examples": list(entry["examples"])}
+                continue
+            current["count"] += entry["count"]
+            current["examples"] = (current["examples"] + entry["examples"])[:settings.TEMPLATE_EXAMPLES]
+            severities = [s for s in (current["severity"], entry["severity"]) if s]
+            current["severity"] = max(severities, key=SEVERITY_ORDER.index) if severities else None
+    ordered = sorted(merged.values(), key=lambda entry: entry["count"], reverse=True)
+    return ordered[:limit or settings.TEMPLATE_SUMMARY_LIMIT]
@@ -0,0 +1,295 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+import threading
+import sqlite3
+import time
+import os
+import structlog
+
+from app.core.config import settings
+
+logger = structlog.get_logger()
+
+
+class UploadSessionStore(ABC):
+    """
+    Shared state of in-progress chunked uploads.
+
+    Chunks of one upload may land on different API workers, so the set of
+    received chunks lives outside the process. Implementations keep a
+    received-chunk bitmap plus byte counts and the owning user per
+    ``file_id``, register chunks atomically and expire idle sessions after
+    ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl: Optional[int] = None):
+        self.ttl = ttl or settings.UPLOAD_SESSION_TTL
+
+    @abstractmethod
+    def get(self, file_id: str) -> Optional[Dict]:
+        """Return the session for ``file_id`` or None if unknown or expired"""
+
+    @abstractmethod
+    def register_chunk(
+        self,
+        file_id: str,
+        chunk_number: int,
+        chunk_bytes: int,
+        filename: str,
+        total_chunks: int,
+        upload_type: Optional[str],
+        user_id: str
+    ) -> Tuple[Dict, bool]:
+        """
+        Mark chunk ``chunk_number`` (1-based) as received.
+
+        Creates the session on first use. Re-sent chunks are counted once.
+
+        Returns:
+            (session, completed) where ``completed`` is True for exactly one
+            caller: the one whose chunk made the upload complete and which
+            must therefore finalize it.
+
+        Raises:
+            PermissionError: if the session belongs to another user
+        """
+
+    @abstractmethod
+    def release(self, file_id: str) -> None:
+        """
+        Hand finalization back after the completing caller failed.
+
+        The next ``register_chunk`` for the upload, typically a re-sent
+        last chunk, is then reported as completing it.
+        """
+
+    @abstractmethod
+    def delete(self, file_id: str) -> None:
+        """Forget a session"""
+
+
+class SQLiteUploadSessionStore(UploadSessionStore):
+    """
+    SQLite-backed session store.
+
+    Shared between worker processes on one host through a database file;
+    with ``path=":memory:"`` it is a private in-process store for tests.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[int] = None):
+        super().__init__(ttl)
+        self.path = path or settings.UPLOAD_SESSION_SQLITE_PATH
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS upload_sessions (
+                file_id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                total_chunks INTEGER NOT NULL,
+                upload_type TEXT,
+                user_id TEXT NOT NULL,
+                chunks_received INTEGER NOT NULL DEFAULT 0,
+                bytes_received INTEGER NOT NULL DEFAULT 0,
+                bitmap BLOB NOT NULL,
+                finalizing INTEGER NOT NULL DEFAULT 0,
+                expires_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_upload_sessions_expires_at ON upload_sessions (expires_at)"
+        )
+
+    @staticmethod
+    def _to_session(file_id: str, row) -> Dict:
+        return {
+            "file_id": file_id,
+            "filename": row["filename"],
+            "total_chunks": row["total_chunks"],
+            "upload_type": row["upload_type"],
+            "user_id": row["user_id"],
+            "chunks_received": row["chunks_received"],
+            "bytes_received": row["bytes_received"]
+        }
+
+    def get(self, file_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM upload_sessions WHERE file_id = ? AND expires_at > ?",
+                (file_id, time.time())
+            ).fetchone()
+        return self._to_session(file_id, row) if row else None
+
+    def register_chunk(self, file_id, chunk_number, chunk_bytes, filename,
+                       total_chunks, upload_type, user_id):
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, serializing workers
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM upload_sessions WHERE expires_at <= ?", (now,))
+                row = self._conn.execute(
+                    "SELECT * FROM upload_sessions WHERE file_id = ?", (file_id,)
+                ).fetchone()
+
+                if row is None:
+                    bitmap = bytearray((total_chunks + 7) // 8)
+                    chunks_received, bytes_received, finalizing = 0, 0, 0
+                else:
+                    if row["user_id"] != user_id:
+                        raise PermissionError("Upload belongs to another user")
+                    bitmap = bytearray(row["bitmap"])
+                    chunks_received = row["chunks_received"]
+                    bytes_received = row["bytes_received"]
+                    finalizing = row["finalizing"]
+
+                index = chunk_number - 1
+                if not bitmap[index // 8] & (1 << (index % 8)):
+                    bitmap[index // 8] |= 1 << (index % 8)
+                    chunks_received += 1
+                    bytes_received += chunk_bytes
+
+                completed = chunks_received == total_chunks and not finalizing
+
+                self._conn.execute("""
+                    INSERT OR REPLACE INTO upload_sessions (
+                        file_id, filename, total_chunks, upload_type, user_id,
+                        chunks_received, bytes_received, bitmap, finalizing, expires_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    file_id, filename, total_chunks, upload_type, user_id,
+                    chunks_received, bytes_received, bytes(bitmap),
+                    int(finalizing or completed), now + self.ttl
+                ))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return {
+            "file_id": file_id,
+            "filename": filename,
+            "total_chunks": total_chunks,
+            "upload_type": upload_type,
+            "user_id": user_id,
+            "chunks_received": chunks_received,
+            "bytes_received": bytes_received
+        }, completed
+
+    def release(self, file_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE upload_sessions SET finalizing = 0, expires_at = ? WHERE file_id = ?",
+                (time.time() + self.ttl, file_id)
+            )
+
+    def delete(self, file_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM upload_sessions WHERE file_id = ?", (file_id,))
+
+
+class RedisUploadSessionStore(UploadSessionStore):
+    """
+    Redis-backed session store shared by every API worker and host.
+
+    Session fields live in the hash ``upload_session:<file_id>`` and the
+    received-chunk bitmap in ``upload_session:<file_id>:chunks``; a Lua
+    script registers chunks atomically and refreshes the TTL of both keys.
+    """
+
+    REGISTER_CHUNK_SCRIPT = """
+        if redis.call('EXISTS', KEYS[1]) == 0 then
+            redis.call('HSET', KEYS[1],
+                'filename', ARGV[4], 'total_chunks', ARGV[5], 'upload_type', ARGV[6],
+                'user_id', ARGV[7], 'chunks_received', 0, 'bytes_received', 0)
+        elseif redis.call('HGET', KEYS[1], 'user_id') ~= ARGV[7] then
+            return {-1, 0, 0}
+        end
+        if redis.call('SETBIT', KEYS[2], ARGV[1], 1) == 0 then
+            redis.call('HINCRBY', KEYS[1], 'chunks_received', 1)
+            redis.call('HINCRBY', KEYS[1], 'bytes_received', ARGV[2])
+        end
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+        redis.call('EXPIRE', KEYS[2], ARGV[3])
+        local received = tonumber(redis.call('HGET', KEYS[1], 'chunks_received'))
+        local completed = 0
+        if received == tonumber(redis.call('HGET', KEYS[1], 'total_chunks')) then
+            completed = redis.call('HSETNX', KEYS[1], 'finalizing', 1)
+        end
+        return {received, tonumber(redis.call('HGET', KEYS[1], 'bytes_received')), completed}
+    """
+
+    def __init__(self, url: Optional[str] = None, ttl: Optional[int] = None):
+        super().__init__(ttl)
+        import redis
+
+        self.client = redis.Redis.from_url(url or settings.REDIS_URL, decode_responses=True)
+        self._register_chunk = self.client.register_script(self.REGISTER_CHUNK_SCRIPT)
+
+    @staticmethod
+    def _keys(file_id: str) -> Tuple[str, str]:
+        return f"upload_session:{file_id}", f"upload_session:{file_id}:chunks"
+
+    def get(self, file_id: str) -> Optional[Dict]:
+        data = self.client.hgetall(self._keys(file_id)[0])
+        if not data:
+            return None
+        return {
+            "file_id": file_id,
+            "filename": data["filename"],
+            "total_chunks": int(data["total_chunks"]),
+            "upload_type": data.get("upload_type") or None,
+            "user_id": data["user_id"],
+            "chunks_received": int(data["chunks_received"]),
+            "bytes_received": int(data["bytes_received"])
+        }
+
+    def register_chunk(self, file_id, chunk_number, chunk_bytes, filename,
+                       total_chunks, upload_type, user_id):
+        chunks_received, bytes_received, completed = self._register_chunk(
+            keys=list(self._keys(file_id)),
+            args=[chunk_number - 1, chunk_bytes, self.ttl, filename,
+                  total_chunks, upload_type or "", user_id]
+        )
+        if chunks_received == -1:
+            raise PermissionError("Upload belongs to another user")
+
+        return {
+            "file_id": file_id,
+            "filename": filename,
+            "total_chunks": total_chunks,
+            "upload_type": upload_type,
+            "user_id": user_id,
+            "chunks_received": chunks_received,
+            "bytes_received": bytes_received
+        }, bool(completed)
+
+    def release(self, file_id: str) -> None:
+        self.client.hdel(self._keys(file_id)[0], "finalizing")
+
+    def delete(self, file_id: str) -> None:
+        self.client.delete(*self._keys(file_id))
+
+
+_store: Optional[UploadSessionStore] = None
+
+
+def get_upload_session_store() -> UploadSessionStore:
+    """Return the process-wide store selected by UPLOAD_SESSION_BACKEND"""
+    global _store
+    if _store is None:
+        if settings.UPLOAD_SESSION_BACKEND == "redis":
+            _store = RedisUploadSessionStore()
+        elif settings.UPLOAD_SESSION_BACKEND == "sqlite":
+            _store = SQLiteUploadSessionStore()
+        else:
+            raise ValueError(f"Unknown upload session backend: {settings.UPLOAD_SESSION_BACKEND}")
+        logger.info("Upload session store initialized", backend=settings.UPLOAD_SESSION_BACKEND)
+    return _store
@@ -0,0 +1,444 @@
+from fastapi import UploadFile
+from typing import AsyncIterator, Dict, Optional, Tuple
+import structlog
+import aiofiles
+import asyncio
+import hashlib
+import time
+import uuid
+import os
+
+from app.core.config import settings
+from app.services.compressed_storage import (
+    FRAME_INDEX_SUFFIX,
+    LINE_INDEX_SUFFIX,
+    FrameWriter,
+    StreamDecoder,
+    decoded_filename,
+    is_compressed,
+    is_text_file,
+    open_stored_file,
+    remove_stored_file,
+    should_compress,
+    stored_size,
+    upload_encoding
+)
+from app.services.line_index import LineIndexBuilder
+
+logger = structlog.get_logger()
+
+# In-progress uploads (staging files, chunked uploads, raw-body ingests)
+PARTIAL_SUFFIX = ".part"
+
+# Sidecar naming the user a resumable partial upload belongs to
+OWNER_SUFFIX = ".owner"
+
+
+class UploadTooLargeError(Exception):
+    """Raised when a streamed upload crosses the configured size limit"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        super().__init__(
+            f"File size exceeds maximum allowed size of {max_size / (1024**3):.1f}GB"
+        )
+
+
+async def iter_upload_file(
+    upload: UploadFile,
+    buffer_size: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """Yield the body of an UploadFile in chunks of at most buffer_size bytes"""
+    buffer_size = buffer_size or settings.UPLOAD_BUFFER_SIZE
+    while True:
+        chunk = await upload.read(buffer_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def iter_file(file_path: str, buffer_size: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Yield the contents of a file on disk in chunks of at most buffer_size bytes"""
+    buffer_size = buffer_size or settings.UPLOAD_BUFFER_SIZE
+    async with aiofiles.open(file_path, "rb") as f:
+        while True:
+            chunk = await f.read(buffer_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def decode_stream(chunks: AsyncIterator[bytes], codec: Optional[str]) -> AsyncIterator[bytes]:
+    """
+    Decompress a gzip/zstd-encoded byte stream on the fly.
+
+    Output comes in bounded pieces, so passing the result to ``write_stream``
+    enforces ``max_size`` on the decompressed bytes as they are produced.
+    Raises ``InvalidEncodingError`` for corrupt or truncated input.
+    """
+    if not codec:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    decoder = StreamDecoder(codec)
+    async for chunk in chunks:
+        for piece in decoder.decode(chunk):
+            yield piece
+    for piece in decoder.finish():
+        yield piece
+
+
+def _replay_stored_file(file_path: str, hasher, line_index) -> None:
+    with open_stored_file(file_path) as f:
+        while True:
+            block = f.read(settings.UPLOAD_BUFFER_SIZE)
+            if not block:
+                break
+            if hasher is not None:
+                hasher.update(block)
+            if line_index is not None:
+                line_index.feed(block)
+
+
+async def write_stream(
+    chunks: AsyncIterator[bytes],
+    file_path: str,
+    max_size: Optional[int] = None,
+    append: bool = False,
+    keep_partial: bool = False,
+    hasher=None,
+    codec: Optional[str] = None,
+    line_index: bool = False
+) -> int:
+    """
+    Write an async stream of byte chunks to disk.
+
+    Only one chunk is held in memory at a time. ``UploadTooLargeError`` is
+    raised as soon as the file size crosses ``max_size``; the file is then
+    always removed. On any other failure the partial file is removed unless
+    ``keep_partial`` is set (used by resumable uploads).
+
+    If ``hasher`` (a hashlib object) is given it is updated with every byte
+    of the resulting file, including an existing prefix when appending.
+
+    With a ``codec`` the file is stored compressed in seekable frames (see
+    ``FrameWriter``); sizes and hashes always refer to the uncompressed bytes.
+
+    With ``line_index`` a line-offset sidecar is built from the same bytes
+    (see ``LineIndexBuilder``) and written once the stream is complete.
+
+    Returns:
+        Uncompressed size of the file after writing
+    """
+    max_size = max_size or settings.MAX_FILE_SIZE
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+
+    total_size = 0
+    if append and os.path.exists(file_path):
+        # Continue in whatever format the interrupted upload was started in
+        codec = (codec or "gzip") if is_compressed(file_path) else None
+        total_size = stored_size(file_path)
+
+    line_index = LineIndexBuilder() if line_index else None
+    if (hasher is not None or line_index is not None) and total_size:
+        # Resumed upload: the digest and index have to cover what is already on disk
+        await asyncio.to_thread(_replay_stored_file, file_path, hasher, line_index)
+
+    try:
+        if codec:
+            writer = FrameWriter(file_path, codec, append=append)
+            try:
+                async for chunk in chunks:
+                    total_size += len(chunk)
+                    if total_size > max_size:
+                        raise UploadTooLargeError(max_size)
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    if line_index is not None:
+                        line_index.feed(chunk)
+                    # Compression is CPU-bound; keep it off the event loop
+                    await asyncio.to_thread(writer.write, chunk)
+            finally:
+                await asyncio.to_thread(writer.close)
+        else:
+            async with aiofiles.open(file_path, "ab" if append else "wb") as f:
+                async for chunk in chunks:
+                    total_size += len(chunk)
+                    if total_size > max_size:
+                        raise UploadTooLargeError(max_size)
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    if line_index is not None:
+                        line_index.feed(chunk)
+                    await f.write(chunk)
+    except UploadTooLargeError:
+        remove_stored_file(file_path)
+        raise
+    except BaseException:
+        # Never leave a truncated file behind unless the caller can resume it
+        if not keep_partial:
+            remove_stored_file(file_path)
+        raise
+
+    if line_index is not None:
+        line_index.write(file_path)
+    return total_size
+
+
+async def save_upload_file(
+    upload: UploadFile,
+    file_path: str,
+    max_size: Optional[int] = None,
+    buffer_size: Optional[int] = None,
+    hasher=None,
+    codec: Optional[str] = None
+) -> int:
+    """
+    Stream an uploaded file to disk in bounded chunks.
+
+    At most ``buffer_size`` bytes of the body are held in memory at a time.
+
+    Returns:
+        Number of bytes written
+    """
+    return await write_stream(
+        iter_upload_file(upload, buffer_size),
+        file_path,
+        max_size,
+        hasher=hasher,
+        codec=codec
+    )
+
+
+def staging_path() -> str:
+    """Fresh path in UPLOAD_DIR to stream an upload into before it is hashed"""
+    return os.path.join(settings.UPLOAD_DIR, f"{uuid.uuid4()}{PARTIAL_SUFFIX}")
+
+
+def blob_path(digest: str) -> str:
+    """Content-addressed location of a blob with the given SHA-256 hex digest"""
+    return os.path.join(settings.UPLOAD_DIR, "blobs", digest[:2], digest)
+
+
+def commit_blob(file_path: str, digest: str) -> Tuple[str, bool]:
+    """
+    Move a fully written upload into content-addressed storage.
+
+    If a blob with the same digest already exists the new copy is dropped,
+    so disk usage scales with unique content rather than upload count.
+    ``file_path`` must be on the same filesystem as UPLOAD_DIR, which makes
+    this a rename rather than a copy.
+
+    Returns:
+        (blob path, True if the content was already stored)
+    """
+    path = blob_path(digest)
+    if os.path.exists(path):
+        # Keep a line index the stored copy may have been written without
+        if os.path.exists(file_path + LINE_INDEX_SUFFIX) and not os.path.exists(path + LINE_INDEX_SUFFIX):
+            os.replace(file_path + LINE_INDEX_SUFFIX, path + LINE_INDEX_SUFFIX)
+        remove_stored_file(file_path)
+        return path, True
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Indexes first: a blob without its frame index would be read as raw bytes
+    for suffix in (FRAME_INDEX_SUFFIX, LINE_INDEX_SUFFIX):
+        if os.path.exists(file_path + suffix):
+            os.replace(file_path + suffix, path + suffix)
+    os.replace(file_path, path)
+    return path, False
+
+
+def preallocate_file(file_path: str, size: Optional[int] = None) -> None:
+    """
+    Create ``file_path`` if missing and reserve ``size`` bytes for it.
+
+    Never truncates, so it is safe to call from every concurrent chunk
+    request of the same upload.
+    """
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    fd = os.open(file_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if size and os.fstat(fd).st_size < size:
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(fd, 0, size)
+            else:
+                os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+
+def sweep_abandoned_uploads(max_age: Optional[int] = None) -> int:
+    """
+    Remove partial uploads in UPLOAD_DIR nobody has written to for ``max_age`` seconds.
+
+    Covers staging files, chunked uploads with the space preallocated for
+    them and interrupted ingests, along with their sidecars. Defaults to
+    UPLOAD_SESSION_TTL, after which a chunked upload's session has expired
+    and its remaining chunks could never complete it.
+
+    Returns:
+        Number of partial uploads removed
+    """
+    cutoff = time.time() - (max_age or settings.UPLOAD_SESSION_TTL)
+    try:
+        entries = list(os.scandir(settings.UPLOAD_DIR))
+    except FileNotFoundError:
+        return 0
+
+    removed = 0
+    for entry in entries:
+        if entry.name.endswith(PARTIAL_SUFFIX):
+            partial_path = entry.path
+        elif entry.name.endswith(PARTIAL_SUFFIX + OWNER_SUFFIX):
+            partial_path = entry.path[:-len(OWNER_SUFFIX)]
+            if os.path.exists(partial_path):
+                # Goes with its partial file and is swept with it
+                continue
+        else:
+            continue
+        try:
+            if entry.stat().st_mtime >= cutoff:
+                continue
+            remove_stored_file(partial_path)
+            if os.path.exists(partial_path + OWNER_SUFFIX):
+                os.remove(partial_path + OWNER_SUFFIX)
+        except FileNotFoundError:
+            # Finished or swept by another worker meanwhile
+            continue
+        removed += 1
+
+    if removed:
+        logger.info("Abandoned partial uploads removed", count=removed)
+    return removed
+
+
+async def write_stream_at(
+    chunks: AsyncIterator[bytes],
+    file_path: str,
+    offset: int,
+    max_length: int
+) -> int:
+    """
+    Write an async stream of byte chunks into an existing file at ``offset``.
+
+    Used for offset-addressed chunk uploads, where each request owns the
+    byte range ``[offset, offset + max_length)`` of a preallocated file and
+    requests may arrive in any order or in parallel.
+
+    Returns:
+        Number of bytes written
+    """
+    written = 0
+    async with aiofiles.open(file_path, "r+b") as f:
+        await f.seek(offset)
+        async for chunk in chunks:
+            written += len(chunk)
+            if written > max_length:
+                raise UploadTooLargeError(max_length)
+            await f.write(chunk)
+    return written
+
+
+async def store_stream(
+    chunks: AsyncIterator[bytes],
+    filename: Optional[str],
+    content_type: Optional[str] = None,
+    encoding: Optional[str] = None,
+    max_size: Optional[int] = None
+) -> Dict:
+    """
+    Stream bytes into content-addressed storage.
+
+    The SHA-256 is computed while the bytes are written to a staging file,
+    which is then committed under its digest. Bodies with an ``encoding``
+    (gzip/zstd) are decompressed as they are written, and ``max_size``
+    applies to the decompressed size. Text is compressed at rest when
+    COMPRESSED_STORAGE is set and gets a line-offset index.
+
+    Returns:
+        Dict with file_path, file_size, content_hash, duplicate, compression
+        and content_encoding
+    """
+    if encoding:
+        chunks = decode_stream(chunks, encoding)
+        filename = decoded_filename(filename or "", encoding)
+        content_type = None  # describes the encoded body, not the content
+
+    staging_file = staging_path()
+    hasher = hashlib.sha256()
+    codec = should_compress(filename, content_type)
+    file_size = await write_stream(
+        chunks,
+        staging_file,
+        max_size,
+        hasher=hasher,
+        codec=codec,
+        line_index=is_text_file(filename, content_type)
+    )
+    content_hash = hasher.hexdigest()
+    file_path, duplicate = commit_blob(staging_file, content_hash)
+    return {
+        "file_path": file_path,
+        "file_size": file_size,
+        "content_hash": content_hash,
+        "duplicate": duplicate,
+        "compression": codec,
+        "content_encoding": encoding
+    }
+
+
+async def store_assembled_file(
+    file_path: str,
+    filename: Optional[str],
+    encoding: Optional[str] = None,
+    max_size: Optional[int] = None
+) -> Dict:
+    """
+    Move a file assembled in place (offset-addressed chunks) into content-addressed storage.
+
+    Files that are encoded or stored compressed have to be rewritten, so
+    they go through ``store_stream`` and ``file_path`` is left for the
+    caller to remove. Anything else is hashed and line-indexed in one read
+    pass and renamed into place by ``commit_blob``, consuming ``file_path``.
+
+    Returns:
+        Same as ``store_stream``
+    """
+    if encoding or should_compress(filename, None):
+        return await store_stream(iter_file(file_path), filename, encoding=encoding, max_size=max_size)
+
+    hasher = hashlib.sha256()
+    line_index = LineIndexBuilder() if is_text_file(filename, None) else None
+    await asyncio.to_thread(_replay_stored_file, file_path, hasher, line_index)
+    if line_index is not None:
+        line_index.write(file_path)
+    file_size = os.path.getsize(file_path)
+    content_hash = hasher.hexdigest()
+    blob, duplicate = commit_blob(file_path, content_hash)
+    return {
+        "file_path": blob,
+        "file_size": file_size,
+        "content_hash": content_hash,
+        "duplicate": duplicate,
+        "compression": None,
+        "content_encoding": None
+    }
+
+
+async def store_upload_file(upload: UploadFile, max_size: Optional[int] = None) -> Dict:
+    """
+    Stream an UploadFile into content-addressed storage.
+
+    gzip/zstd files (by part Content-Encoding, extension or content type)
+    are stored decompressed; see ``store_stream``.
+    """
+    encoding = upload_encoding(upload.filename, upload.content_type, upload.headers.get("content-encoding"))
+    return await store_stream(
+        iter_upload_file(upload),
+        upload.filename,
+        upload.content_type,
+        encoding=encoding,
+        max_size=max_size
+    )
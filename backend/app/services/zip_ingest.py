@@ -0,0 +1,238 @@
+from sqlalchemy import insert
+from typing import Dict, List, Optional
+from datetime import datetime
+import structlog
+import hashlib
+import zipfile
+import uuid
+import zlib
+import os
+
+try:
+    import lzma
+except ImportError:  # Python built without lzma; zipfile then rejects LZMA members itself
+    lzma = None
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.database import SecurityLog, AnalysisResult, ThreatLevel
+from app.services.analysis_service import AnalysisService
+from app.services.compressed_storage import (
+    FrameWriter,
+    is_text_file,
+    open_stored_file,
+    remove_stored_file,
+    should_compress
+)
+from app.services.line_index import LineIndexBuilder
+from app.services.upload_storage import staging_path, commit_blob
+
+logger = structlog.get_logger()
+
+
+class ArchiveLimitError(Exception):
+    """Raised when an archive member breaks one of the zip-bomb limits"""
+
+
+# Errors that condemn a single member rather than the whole archive:
+# RuntimeError / NotImplementedError for encrypted members or unsupported
+# compression, zlib.error / lzma.LZMAError for corrupt compressed data,
+# EOFError for a member cut short and OSError for unreadable data
+MEMBER_ERRORS = (
+    ArchiveLimitError, zipfile.BadZipFile, RuntimeError, NotImplementedError,
+    zlib.error, EOFError, OSError
+) + ((lzma.LZMAError,) if lzma else ())
+
+
+def is_zip_upload(filename: Optional[str], content_type: Optional[str]) -> bool:
+    """Whether an upload should go through zip expansion"""
+    return (
+        (filename or "").lower().endswith(".zip")
+        or content_type in ("application/zip", "application/x-zip-compressed")
+    )
+
+
+class ZipIngestService:
+    """
+    Expands uploaded ZIP archives into one SecurityLog per member.
+
+    Archives are read from disk and members are decompressed in
+    UPLOAD_BUFFER_SIZE pieces straight into content-addressed storage, so
+    memory stays bounded regardless of member size. The actual number of
+    decompressed bytes is checked against ZIP_MAX_MEMBER_SIZE,
+    ZIP_MAX_TOTAL_SIZE and ZIP_MAX_COMPRESSION_RATIO while streaming, rather
+    than trusting the sizes declared in the archive headers.
+    """
+
+    def expand_archive(self, archive_log_id: str) -> Dict:
+        """
+        Expand the archive behind ``archive_log_id``.
+
+        Runs outside the request (background task) with its own session.
+
+        Returns:
+            Summary with extracted and skipped member counts
+        """
+        db = SessionLocal()
+        try:
+            archive_log = db.query(SecurityLog).filter(SecurityLog.id == archive_log_id).first()
+            if not archive_log or not archive_log.file_path:
+                logger.error("Archive log not found", log_id=archive_log_id)
+                return {"extracted": 0, "skipped": []}
+
+            summary = self._expand(db, archive_log)
+
+            parsed_data = dict(archive_log.parsed_data or {})
+            parsed_data["archive_members"] = summary["extracted"]
+            parsed_data["archive_skipped"] = summary["skipped"]
+            archive_log.parsed_data = parsed_data
+            # The archive itself is not analyzed; its members are
+            archive_log.processed = True
+            db.commit()
+
+            logger.info("Archive expanded",
+                        log_id=archive_log_id,
+                        extracted=summary["extracted"],
+                        skipped=len(summary["skipped"]))
+            return summary
+
+        except Exception as e:
+            db.rollback()
+            logger.error("Archive expansion failed", error=str(e), log_id=archive_log_id)
+            raise
+        finally:
+            db.close()
+
+    def _expand(self, db, archive_log: SecurityLog) -> Dict:
+        archive_name = (archive_log.parsed_data or {}).get("filename") or os.path.basename(archive_log.file_path)
+        extracted = 0
+        skipped = []
+        total_size = 0
+        pending_rows: List[Dict] = []
+
+        # Archives may themselves be stored compressed; read them through the
+        # seekable frame reader zipfile needs for its central directory
+        with open_stored_file(archive_log.file_path) as archive_file:
+            if not zipfile.is_zipfile(archive_file):
+                return {"extracted": 0, "skipped": [{"member": archive_name, "error": "Not a ZIP archive"}]}
+
+            with zipfile.ZipFile(archive_file) as archive:
+                members = [info for info in archive.infolist() if not info.is_dir()]
+                if len(members) > settings.ZIP_MAX_MEMBERS:
+                    return {"extracted": 0, "skipped": [{
+                        "member": archive_name,
+                        "error": f"Archive has {len(members)} members, limit is {settings.ZIP_MAX_MEMBERS}"
+                    }]}
+
+                for info in members:
+                    try:
+                        stored = self._extract_member(archive, info, settings.ZIP_MAX_TOTAL_SIZE - total_size)
+                    except MEMBER_ERRORS as e:
+                        # A member cut short raises a bare EOFError
+                        skipped.append({"member": info.filename, "error": str(e) or type(e).__name__})
+                        continue
+
+                    total_size += stored["file_size"]
+                    pending_rows.append(self._member_row(archive_log, archive_name, info, stored))
+                    extracted += 1
+
+                    if len(pending_rows) >= settings.ZIP_INSERT_BATCH_SIZE:
+                        self._insert_rows(db, pending_rows)
+                        pending_rows = []
+
+        self._insert_rows(db, pending_rows)
+        return {"extracted": extracted, "skipped": skipped}
+
+    def _extract_member(self, archive: zipfile.ZipFile, info: zipfile.ZipInfo, remaining_total: int) -> Dict:
+        """Stream one member into content-addressed storage, enforcing the limits"""
+        max_size = min(settings.ZIP_MAX_MEMBER_SIZE, remaining_total)
+        if info.file_size > max_size:
+            raise ArchiveLimitError(f"Member declares {info.file_size} bytes, limit is {max_size}")
+
+        # Highly compressible text can legitimately exceed the ratio; only
+        # apply it once a member is past the first buffer
+        max_ratio_size = max(info.compress_size * settings.ZIP_MAX_COMPRESSION_RATIO, settings.UPLOAD_BUFFER_SIZE)
+
+        file_path = staging_path()
+        hasher = hashlib.sha256()
+        codec = should_compress(info.filename, None)
+        line_index = LineIndexBuilder() if is_text_file(info.filename, None) else None
+        written = 0
+        try:
+            with archive.open(info) as source:
+                target = FrameWriter(file_path, codec) if codec else open(file_path, "wb")
+                try:
+                    while True:
+                        block = source.read(settings.UPLOAD_BUFFER_SIZE)
+                        if not block:
+                            break
+                        written += len(block)
+                        if written > max_size:
+                            raise ArchiveLimitError(f"Member exceeds size limit of {max_size} bytes")
+                        if written > max_ratio_size:
+                            raise ArchiveLimitError(
+                                f"Member exceeds compression ratio limit of {settings.ZIP_MAX_COMPRESSION_RATIO}"
+                            )
+                        hasher.update(block)
+                        if line_index is not None:
+                            line_index.feed(block)
+                        target.write(block)
+                finally:
+                    target.close()
+            if line_index is not None:
+                line_index.write(file_path)
+        except BaseException:
+            remove_stored_file(file_path)
+            raise
+
+        content_hash = hasher.hexdigest()
+        blob, duplicate = commit_blob(file_path, content_hash)
+        return {
+            "file_path": blob,
+            "file_size": written,
+            "content_hash": content_hash,
+            "duplicate": duplicate,
+            "compression": codec
+        }
+
+    @staticmethod
+    def _member_row(archive_log: SecurityLog, archive_name: str, info: zipfile.ZipInfo, stored: Dict) -> Dict:
+        return {
+            "id": str(uuid.uuid4()),
+            "timestamp": datetime.utcnow(),
+            "source": "zip_member",
+            "log_type": archive_log.log_type,
+            "raw_message": f"Extracted from archive {archive_name}: {info.filename}",
+            "parsed_data": {
+                "filename": info.filename,
+                "archive_filename": archive_name,
+                "archive_log_id": archive_log.id,
+                "file_path": stored["file_path"],
+                "file_size": stored["file_size"],
+                "compressed_size": info.compress_size,
+                "upload_type": (archive_log.parsed_data or {}).get("upload_type"),
+                "content_hash": stored["content_hash"],
+                "duplicate": stored["duplicate"],
+                "compression": stored["compression"]
+            },
+            "severity": ThreatLevel.NORMAL,
+            "processed": False,
+            "file_path": stored["file_path"],
+            "file_size": stored["file_size"],
+            "content_hash": stored["content_hash"],
+            "user_id": archive_log.user_id
+        }
+
+    @staticmethod
+    def _insert_rows(db, log_rows: List[Dict]) -> None:
+        """Bulk insert a batch of member logs, reusing analysis of duplicates"""
+        if not log_rows:
+            return
+        AnalysisService.scope_duplicates(db, log_rows)
+        result_rows = AnalysisService().plan_result_reuse(
+            db, [row for row in log_rows if row["parsed_data"]["duplicate"]]
+        )
+        db.execute(insert(SecurityLog), log_rows)
+        if result_rows:
+            db.execute(insert(AnalysisResult), result_rows)
+        db.commit()
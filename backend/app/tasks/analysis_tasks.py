@@ -1,13 +1,18 @@
 from celery import current_task
+from celery.exceptions import SoftTimeLimitExceeded
 from typing import Dict, List, Any
 import structlog
 import time
 
 from app.core.celery_app import celery_app
+from app.core.config import settings
 from app.ml.models.ensemble_analyzer import EnsembleAnalyzer
-from app.ml.models.text_analyzer import TextAnalyzer
-from app.ml.models.visual_analyzer import VisualAnalyzer
+from app.ml.models.text_analyzer import SecurityTextAnalyzer as TextAnalyzer
+from app.ml.models.visual_analyzer import SecurityVisualAnalyzer as VisualAnalyzer
+from app.ml.registry import model_registry
 from app.core.monitoring import record_analysis_request, record_threat_detection
+from app.services.analysis_service import AnalysisService, AnalysisCancelled
+from app.services.fair_scheduler import get_fair_queue, release_shards, shard_item_id
 
 logger = structlog.get_logger()
 
@@ -20,18 +25,20 @@ def analyze_text_task(self, text_data: str, user_id: int = None) -> Dict[str, An
         # Update task state
         self.update_state(state='PROGRESS', meta={'status': 'Analyzing text...'})
         
-        # Initialize analyzer
-        analyzer = TextAnalyzer()
+        # Borrow the worker's shared analyzer
+        analyzer = model_registry.get('text')
         
-        # Perform analysis
-        result = analyzer.predict(text_data)
+        # Perform analysis; the analyzer reports failures in the result
+        result = analyzer.analyze(text_data)
+        if 'error' in result:
+            raise RuntimeError(result['error'])
         
         # Record metrics
         duration = time.time() - start_time
         record_analysis_request('text', 'success', duration)
         
-        if result['prediction'] == 'malicious':
-            record_threat_detection(result['severity'], 'text')
+        if result['threat_level'] != 'normal':
+            record_threat_detection(result['threat_level'], 'text')
         
         return {
             'status': 'success',
@@ -61,18 +68,20 @@ def analyze_image_task(self, image_data: bytes, user_id: int = None) -> Dict[str
         # Update task state
         self.update_state(state='PROGRESS', meta={'status': 'Analyzing image...'})
         
-        # Initialize analyzer
-        analyzer = VisualAnalyzer()
+        # Borrow the worker's shared analyzer
+        analyzer = model_registry.get('visual')
         
-        # Perform analysis
-        result = analyzer.predict(image_data)
+        # Perform analysis; the analyzer reports failures in the result
+        result = analyzer.analyze_image_bytes(image_data)
+        if 'error' in result:
+            raise RuntimeError(result['error'])
         
         # Record metrics
         duration = time.time() - start_time
         record_analysis_request('image', 'success', duration)
         
-        if result['prediction'] == 'malicious':
-            record_threat_detection(result['severity'], 'image')
+        if result['threat_level'] != 'normal':
+            record_threat_detection(result['threat_level'], 'image')
         
         return {
             'status': 'success',
@@ -103,8 +112,8 @@ def analyze_ensemble_task(self, text_data: str = None, image_data: bytes = None,
         # Update task state
         self.update_state(state='PROGRESS', meta={'status': 'Running ensemble analysis...'})
         
-        # Initialize analyzer
-        analyzer = EnsembleAnalyzer()
+        # Borrow the worker's shared analyzer
+        analyzer = model_registry.get('ensemble')
         
         # Perform analysis
         result = analyzer.predict(text_data, image_data)
@@ -151,8 +160,8 @@ def batch_analysis_task(self, data_list: List[Dict[str, Any]],
             meta={'status': f'Processing batch of {total_items} items...', 'processed': 0}
         )
         
-        # Initialize analyzer
-        analyzer = EnsembleAnalyzer()
+        # Borrow the worker's shared analyzer
+        analyzer = model_registry.get('ensemble')
         
         results = []
         
@@ -229,6 +238,7 @@ def train_model_task(self, training_data: List[Dict[str, Any]],
         # Update task state
         self.update_state(state='PROGRESS', meta={'status': 'Training model...'})
         
+        # Trained on a private instance; the registry's shared ones keep serving
         if model_type == 'ensemble':
             analyzer = EnsembleAnalyzer()
         elif model_type == 'text':
@@ -260,4 +270,71 @@ def train_model_task(self, training_data: List[Dict[str, Any]],
             'error': str(e),
             'model_type': model_type,
             'duration': duration
-        } 
\ No newline at end of file
+        } 
+
+@celery_app.task(bind=True)
+def dispatch_analysis_task(self, log_ids: List[str], user_id: str, analysis_id: str) -> Dict[str, Any]:
+    """Plan shards for every log of a job and queue them in the tenant fair queue"""
+    shards = AnalysisService().dispatch_job(log_ids, user_id, analysis_id)
+    return {'status': 'dispatched', 'analysis_id': analysis_id, 'shards': shards}
+
+# acks_late + reject_on_worker_lost: a shard whose worker dies is redelivered
+# and resumes from its checkpoint instead of being lost or starting over
+@celery_app.task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=None)
+def analyze_log_shard_task(self, analysis_id: str, log_id: str, start: int,
+                           end: int = None, first_line: int = 0, lane: str = 'normal',
+                           generation: int = None) -> Dict[str, Any]:
+    """Map step: analyze the line-aligned byte range [start, end) of a log for run ``generation`` of its job"""
+    start_time = time.time()
+    service = AnalysisService()
+    fair_queue = get_fair_queue()
+    item_id = shard_item_id(analysis_id, log_id, start, generation)
+    error = None
+    
+    # Each run (first delivery, redelivery or time-limit retry) restarts the
+    # slot's clock, so reap only frees shards that stopped reporting
+    fair_queue.touch(lane, item_id)
+    
+    try:
+        summary = service.analyze_shard(analysis_id, log_id, start, end, first_line, generation)
+        record_analysis_request('log_shard', 'success', time.time() - start_time)
+        
+    except SoftTimeLimitExceeded:
+        # Progress up to the last batch is checkpointed; continue in a fresh run
+        # that keeps this shard's fair queue slot
+        record_analysis_request('log_shard', 'timeout', time.time() - start_time)
+        logger.info("Log shard hit time limit, continuing from checkpoint", log_id=log_id,
+                    analysis_id=analysis_id, start=start, end=end)
+        fair_queue.touch(lane, item_id)
+        raise self.retry(countdown=0)
+        
+    except AnalysisCancelled:
+        record_analysis_request('log_shard', 'cancelled', time.time() - start_time)
+        summary = {'cancelled': True, 'start': start, 'end': end}
+        
+    except Exception as e:
+        record_analysis_request('log_shard', 'error', time.time() - start_time)
+        logger.error("Log shard analysis failed", error=str(e), log_id=log_id,
+                     analysis_id=analysis_id, start=start, end=end)
+        error = str(e)
+        summary = {'error': error, 'start': start, 'end': end}
+    
+    try:
+        # Kept in the checkpoint so the log is still reduced, as failed
+        if not summary.get('cancelled'):
+            service.finish_shard(analysis_id, log_id, start, error, generation)
+    finally:
+        # Free this shard's slot and let the next tenant's shard in
+        fair_queue.release(lane, item_id)
+        release_shards(lane)
+    return summary
+
+@celery_app.task(bind=True)
+def pump_fair_queues_task(self) -> Dict[str, Any]:
+    """Reclaim slots of lost shards and release waiting shards in every lane"""
+    fair_queue = get_fair_queue()
+    released = {}
+    for lane in settings.ANALYSIS_QUEUES:
+        fair_queue.reap(lane, settings.FAIR_IN_FLIGHT_TIMEOUT)
+        released[lane] = release_shards(lane)
+    return {'status': 'success', 'released': released}
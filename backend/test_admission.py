@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Admission control checks for the analysis lanes
+
+Seeds the interactive lane with a job that finished inside the throughput
+window and twenty still running with checkpointed progress, then checks:
+
+1. lane_throughput and lane_backlog against the numbers worked out by
+   hand, with lane_throughput issuing one query however many running jobs
+   and checkpoints there are,
+2. admit accepts a job whose wait fits ADMISSION_MAX_WAIT and gives it an
+   ETA, and refuses one that does not with the seconds until it would fit,
+3. /analysis/trigger answers an overloaded lane with a 429 and that
+   Retry-After, and starts the job once the lane's limit allows the wait.
+
+Usage: python test_admission.py
+"""
+
+import shutil
+import tempfile
+import math
+import sys
+import os
+
+workdir = tempfile.mkdtemp()
+os.environ.update({
+    "ENVIRONMENT": "test",
+    "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+    "TEMP_UPLOAD_DIR": os.path.join(workdir, "uploads", "temp"),
+    "MODEL_CACHE_DIR": os.path.join(workdir, "models"),
+    "ADMISSION_THROUGHPUT_WINDOW": "900",
+})
+
+MB = 1024 * 1024
+
+def seed(db, running_jobs=1, shards=4):
+    """
+    A job of 17 MB that ran from 2000 s to 300 s ago, and ``running_jobs``
+    jobs of 10 MB started 100 s ago with 4 MB checkpointed over ``shards``
+    shards each
+    """
+    from datetime import datetime, timedelta
+
+    from app.models.database import SecurityLog, AnalysisJob, AnalysisCheckpoint
+
+    now = datetime.utcnow()
+    log = SecurityLog(timestamp=now, source="api", log_type="security_log", raw_message="seed",
+                      parsed_data={}, user_id="user-a")
+    db.add(log)
+    db.flush()
+    db.add(AnalysisJob(user_id="user-a", priority="interactive", status="completed", total_bytes=17 * MB,
+                       started_at=now - timedelta(seconds=2000), completed_at=now - timedelta(seconds=300)))
+    for _ in range(running_jobs):
+        job = AnalysisJob(user_id="user-a", priority="interactive", status="processing", total_bytes=10 * MB,
+                          started_at=now - timedelta(seconds=100))
+        db.add(job)
+        db.flush()
+        for shard in range(shards):
+            db.add(AnalysisCheckpoint(analysis_id=job.id, log_id=log.id, shard_start=shard * 5 * MB,
+                                      offset=shard * 5 * MB + 4 * MB // shards))
+    db.commit()
+
+def test_throughput(db):
+    from sqlalchemy import event
+
+    from app.core.database import engine
+    from app.services.admission import lane_backlog, lane_throughput
+
+    statements = []
+    counter = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", counter)
+    try:
+        throughput = lane_throughput(db, "interactive")
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+    backlog = lane_backlog(db, "interactive")
+
+    # Window of 900 s: the finished job contributes 600 of its 1700 s, the
+    # running ones all they checkpointed, over the 900 s the lane was busy
+    expected = (17 * MB * 600 / 1700 + 20 * 4 * MB) / 900
+    print(f"📊 throughput {throughput:.0f} B/s (expected {expected:.0f}) in {len(statements)} query, "
+          f"backlog {backlog / MB:.0f} MB")
+    return math.isclose(throughput, expected, rel_tol=0.01) and len(statements) == 1 and backlog == 20 * 6 * MB
+
+def test_admit(db):
+    from app.core.config import settings
+    from app.services.admission import admit
+
+    settings.ADMISSION_MAX_WAIT = {**settings.ADMISSION_MAX_WAIT, "interactive": 24 * 3600}
+    accepted = admit(db, "interactive", MB)
+    settings.ADMISSION_MAX_WAIT = {**settings.ADMISSION_MAX_WAIT, "interactive": 300}
+    refused = admit(db, "interactive", MB)
+    unenforced = admit(db, "interactive", MB, enforce=False)
+
+    wait = 20 * 6 * MB / accepted["throughput"]
+    print(f"📊 admit: wait {accepted['wait']:.0f} s, eta {accepted['eta']:.0f} s; limit 300 s: "
+          f"admitted {refused['admitted']}, retry after {refused['retry_after']} s; unenforced {unenforced['admitted']}")
+    return (accepted["admitted"] and math.isclose(accepted["wait"], wait, rel_tol=0.01)
+            and math.isclose(accepted["eta"], wait + MB / accepted["throughput"], rel_tol=0.01)
+            and accepted["retry_after"] is None
+            and not refused["admitted"] and abs(refused["retry_after"] - math.ceil(wait - 300)) <= 1
+            and unenforced["admitted"])
+
+def test_trigger():
+    from datetime import datetime
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from types import SimpleNamespace
+
+    from app.api.v1.endpoints import analysis
+    from app.api.v1.endpoints.auth import get_current_user
+    from app.core.config import settings
+    from app.core.database import SessionLocal
+    from app.models.database import SecurityLog
+
+    analysis.schedule_analysis = lambda *args, **kwargs: None
+    app = FastAPI()
+    app.include_router(analysis.router, prefix="/api/v1/analysis")
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="user-a")
+    client = TestClient(app)
+
+    db = SessionLocal()
+    log = SecurityLog(timestamp=datetime.utcnow(), source="api", log_type="security_log",
+                      raw_message="2024-01-15 10:30:15 WARNING Failed login from 10.0.0.1",
+                      parsed_data={}, user_id="user-a")
+    db.add(log)
+    db.commit()
+    log_id = log.id
+    db.close()
+
+    settings.ADMISSION_MAX_WAIT = {**settings.ADMISSION_MAX_WAIT, "interactive": 300}
+    refused = client.post("/api/v1/analysis/trigger", json={"log_ids": [log_id]})
+    settings.ADMISSION_MAX_WAIT = {**settings.ADMISSION_MAX_WAIT, "interactive": 24 * 3600}
+    accepted = client.post("/api/v1/analysis/trigger", json={"log_ids": [log_id]})
+
+    retry_after = refused.headers.get("Retry-After")
+    print(f"📊 trigger over the limit: {refused.status_code}, Retry-After {retry_after}, "
+          f"\"{refused.json().get('detail')}\"")
+    print(f"📊 trigger within the limit: {accepted.status_code}, priority {accepted.json().get('priority')}, "
+          f"estimated {accepted.json().get('estimated_time')}")
+    return (refused.status_code == 429 and retry_after is not None and int(retry_after) >= 1
+            and accepted.status_code == 200 and accepted.json()["priority"] == "interactive"
+            and accepted.json()["estimated_time"])
+
+def test_admission():
+    print("🚀 Starting admission control checks")
+    from app.core.database import Base, SessionLocal, engine
+    from app.models import database  # noqa: F401
+
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        seed(db, running_jobs=20, shards=8)
+        ok = test_throughput(db)
+        ok = test_admit(db) and ok
+    finally:
+        db.close()
+    ok = test_trigger() and ok
+
+    print("\n✅ Lanes admit, refuse and advise retries as measured" if ok else "\n❌ Admission control check failed")
+    return ok
+
+if __name__ == "__main__":
+    try:
+        ok = test_admission()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Idempotency-Key and coalescing checks for /analysis/trigger
+
+Against a file-backed SQLite database, with scheduling stubbed out:
+
+1. repeating a request with the same Idempotency-Key returns the same job,
+2. reusing that key for other logs is a 422,
+3. a request for the logs of a pending job attaches to it,
+4. two requests for the same logs that both pass the duplicate check
+   before either inserts (held at a barrier) end with one job, which both
+   responses name,
+5. a conflicting insert with no job to attach to is a 409, not a 500,
+6. resuming a cancelled job while another job covers its logs is a 409.
+
+Usage: python test_analysis_coalescing.py
+"""
+
+import threading
+import tempfile
+import shutil
+import sys
+import os
+
+workdir = tempfile.mkdtemp()
+os.environ.update({
+    "ENVIRONMENT": "test",
+    "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+    "TEMP_UPLOAD_DIR": os.path.join(workdir, "uploads", "temp"),
+    "MODEL_CACHE_DIR": os.path.join(workdir, "models"),
+})
+
+def test_analysis_coalescing():
+    print("🚀 Starting analysis coalescing checks")
+    from datetime import datetime
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine, update
+    from sqlalchemy.exc import IntegrityError
+    from sqlalchemy.orm import sessionmaker
+    from types import SimpleNamespace
+
+    from app.api.v1.endpoints import analysis
+    from app.api.v1.endpoints.auth import get_current_user
+    from app.core.database import Base, get_db
+    from app.models.database import SecurityLog, AnalysisJob
+    from app.services.analysis_service import AnalysisService
+
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'coalescing.db')}",
+                           connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    def get_test_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    scheduled = []
+    analysis.schedule_analysis = lambda background_tasks, service, log_ids, user_id, analysis_id, priority="normal": \
+        scheduled.append(analysis_id)
+
+    app = FastAPI()
+    app.include_router(analysis.router, prefix="/api/v1/analysis")
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="user-a")
+    app.dependency_overrides[get_db] = get_test_db
+    client = TestClient(app)
+
+    db = Session()
+    log_ids = []
+    for i in range(6):
+        log = SecurityLog(timestamp=datetime.utcnow(), source="api", log_type="security_log",
+                          raw_message=f"2024-01-15 10:30:15 WARNING Failed login from 10.0.0.{i}",
+                          parsed_data={}, user_id="user-a")
+        db.add(log)
+        db.flush()
+        log_ids.append(log.id)
+    db.commit()
+    db.close()
+
+    def trigger(ids, key=None):
+        headers = {"Idempotency-Key": key} if key else {}
+        return client.post("/api/v1/analysis/trigger", json={"log_ids": ids}, headers=headers)
+
+    def job_count(ids):
+        db = Session()
+        try:
+            return db.query(AnalysisJob).filter(
+                AnalysisJob.log_set_hash == AnalysisService.log_set_hash(ids)).count()
+        finally:
+            db.close()
+
+    first = trigger(log_ids[:2], "key-1").json()
+    retry = trigger(log_ids[:2], "key-1").json()
+    other_logs = trigger(log_ids[2:4], "key-1")
+    print(f"📊 same key: same job {retry['analysis_id'] == first['analysis_id']}, "
+          f"key reused for other logs: {other_logs.status_code}")
+    ok = retry["analysis_id"] == first["analysis_id"] and retry["deduplicated"] and other_logs.status_code == 422
+
+    coalesced = trigger(list(reversed(log_ids[:2]))).json()
+    print(f"📊 same logs without a key: attached {coalesced['analysis_id'] == first['analysis_id']}")
+    ok = ok and coalesced["analysis_id"] == first["analysis_id"] and coalesced["deduplicated"]
+
+    # Both racers see no duplicate before either inserts
+    barrier = threading.Barrier(2)
+    racing = threading.local()
+    find_duplicate_job = AnalysisService.find_duplicate_job.__func__
+
+    def held_find_duplicate_job(cls, db, user_id, ids):
+        job = find_duplicate_job(cls, db, user_id, ids)
+        if not getattr(racing, "waited", False):
+            racing.waited = True
+            barrier.wait(timeout=10)
+        return job
+
+    AnalysisService.find_duplicate_job = classmethod(held_find_duplicate_job)
+    responses = []
+
+    def racer():
+        responses.append(trigger(log_ids[4:6]))
+
+    threads = [threading.Thread(target=racer) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    AnalysisService.find_duplicate_job = classmethod(find_duplicate_job)
+
+    ids = {r.json().get("analysis_id") for r in responses}
+    print(f"📊 race: statuses {[r.status_code for r in responses]}, jobs created {job_count(log_ids[4:6])}, "
+          f"distinct ids returned {len(ids)}")
+    ok = ok and [r.status_code for r in responses] == [200, 200] and len(ids) == 1 and job_count(log_ids[4:6]) == 1
+
+    # A constraint failure with nothing to attach to
+    create_job = AnalysisService.create_job
+
+    def failing_create_job(*args, **kwargs):
+        raise IntegrityError("INSERT INTO analysis_jobs", {}, Exception("constraint failed"))
+
+    AnalysisService.create_job = staticmethod(failing_create_job)
+    try:
+        conflicted = trigger(log_ids[2:4], "key-2")
+    finally:
+        AnalysisService.create_job = staticmethod(create_job)
+    print(f"📊 conflicting insert with no winner: {conflicted.status_code}")
+    ok = ok and conflicted.status_code == 409
+
+    # Cancel the first job; a new one takes its logs, so the old one cannot come back
+    client.post(f"/api/v1/analysis/cancel/{first['analysis_id']}")
+    db = Session()
+    db.execute(update(AnalysisJob).where(AnalysisJob.id == first["analysis_id"]).values(lease_expires_at=None))
+    db.commit()
+    db.close()
+    replacement = trigger(log_ids[:2]).json()
+    resumed = client.post(f"/api/v1/analysis/resume/{first['analysis_id']}")
+    print(f"📊 resume while a new job covers the logs: {resumed.status_code}, "
+          f"new job {replacement['analysis_id'] != first['analysis_id']}")
+    ok = ok and replacement["analysis_id"] != first["analysis_id"] and resumed.status_code == 409
+
+    print("\n✅ Repeated and concurrent requests coalesce on one job" if ok else "\n❌ Analysis coalescing check failed")
+    return ok
+
+if __name__ == "__main__":
+    try:
+        ok = test_analysis_coalescing()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Ordering and capacity checks for the tenant fair queue
+
+Runs FairQueue's Lua scripts against fakeredis: two tenants with weights
+1 and 2 get shards released in a 1:2 ratio, a tenant that arrives late
+starts at the queue's current virtual time instead of jumping ahead, a
+lane never has more than max_in_flight shards out, and reap frees only
+the slots of shards that stopped reporting.
+
+When the Celery tasks can be imported (the ML dependencies are
+installed), also runs analyze_log_shard_task eagerly through a soft time
+limit and checks that the retry restarts the shard's in-flight clock
+instead of leaving it for reap.
+
+Skipped when fakeredis is not installed.
+
+Usage: python test_fair_queue.py
+"""
+
+import time
+import sys
+import os
+
+os.environ.setdefault("ENVIRONMENT", "test")
+
+from app.core.config import settings
+from app.services import fair_scheduler
+from app.services.fair_scheduler import FairQueue, shard_item_id
+
+def make_queue():
+    import fakeredis
+
+    queue = FairQueue.__new__(FairQueue)
+    queue.client = fakeredis.FakeRedis(decode_responses=True)
+    queue._enqueue = queue.client.register_script(queue.ENQUEUE_SCRIPT)
+    queue._pop = queue.client.register_script(queue.POP_SCRIPT)
+    return queue
+
+def drain(queue, lane, limit=None):
+    order = []
+    while limit is None or len(order) < limit:
+        item = queue.pop(lane, 1000)
+        if item is None:
+            break
+        order.append(item["id"])
+    return order
+
+def test_fair_order(queue):
+    settings.TENANT_WEIGHTS = {"big": 2}
+    for i in range(6):
+        queue.enqueue("normal", f"small-{i}", "company:small", 100, {})
+        queue.enqueue("normal", f"big-{i}", "company:big", 100, {})
+    requeued = queue.enqueue("normal", "small-0", "company:small", 100, {})
+
+    first = drain(queue, "normal", 6)
+    big_share = sum(item.startswith("big") for item in first)
+    print(f"📊 first six releases: {first}")
+
+    queue.enqueue("normal", "late-0", "company:late", 100, {})
+    rest = drain(queue, "normal")
+    print(f"📊 after a late tenant arrives: {rest}")
+
+    ok = big_share == 4 and not requeued
+    ok = ok and rest.index("late-0") < rest.index("small-3") and len(first + rest) == 13
+    ok = ok and queue.depths("normal") == {}
+    if not ok:
+        print("❌ shards were not released in weighted fair order")
+    return ok
+
+def test_in_flight_cap(queue):
+    for i in range(4):
+        queue.enqueue("bulk", f"shard-{i}", "user:a", 100, {})
+    released = [queue.pop("bulk", 2) for _ in range(3)]
+    at_capacity = released[2] is None
+    queue.release("bulk", released[0]["id"])
+    after_release = queue.pop("bulk", 2)
+    in_flight = queue.client.hlen("fair:bulk:inflight")
+    print(f"📊 cap 2: third pop blocked {at_capacity}, pop after a release {after_release and after_release['id']}, "
+          f"in flight {in_flight}")
+    return at_capacity and after_release is not None and in_flight == 2
+
+def test_reap(queue):
+    queue.enqueue("interactive", "lost", "user:a", 100, {})
+    queue.enqueue("interactive", "running", "user:a", 100, {})
+    drain(queue, "interactive")
+    stale = time.time() - 3600
+    queue.client.hset("fair:interactive:inflight", mapping={"lost": stale, "running": stale})
+    queue.touch("interactive", "running")
+    reaped = queue.reap("interactive", 60)
+    left = sorted(queue.client.hkeys("fair:interactive:inflight"))
+    print(f"📊 reap: freed {reaped} slot(s), still in flight {left}")
+    return reaped == 1 and left == ["running"]
+
+def test_time_limit_retry(queue):
+    """A shard that hits the soft time limit keeps its slot with a fresh timestamp"""
+    from celery.exceptions import SoftTimeLimitExceeded
+
+    from app.core.celery_app import celery_app
+    from app.tasks import analysis_tasks
+
+    celery_app.conf.result_backend = "cache+memory://"
+    item_id = shard_item_id("job", "log", 0)
+    queue.client.hset("fair:normal:inflight", item_id, time.time() - 3600)
+    seen = []
+
+    class Service:
+        def analyze_shard(self, analysis_id, log_id, start, end, first_line, generation=None):
+            seen.append(float(queue.client.hget("fair:normal:inflight", item_id)))
+            if len(seen) == 1:
+                raise SoftTimeLimitExceeded()
+            return {"records": 1, "start": start, "end": end}
+
+        def finish_shard(self, analysis_id, log_id, start, error, generation=None):
+            pass
+
+    service, analysis_tasks.AnalysisService = analysis_tasks.AnalysisService, Service
+    try:
+        summary = analysis_tasks.analyze_log_shard_task.apply(
+            kwargs={"analysis_id": "job", "log_id": "log", "start": 0, "end": 100, "lane": "normal"}
+        ).get()
+    finally:
+        analysis_tasks.AnalysisService = service
+
+    fresh = len(seen) == 2 and all(time.time() - ts < 60 for ts in seen)
+    released = not queue.client.hexists("fair:normal:inflight", item_id)
+    print(f"📊 time limit retry: {len(seen)} runs, in-flight clock restarted {fresh}, "
+          f"slot freed at the end {released}")
+    return fresh and released and summary.get("records") == 1
+
+def test_fair_queue():
+    print("🚀 Starting fair queue checks")
+    try:
+        import fakeredis  # noqa: F401
+    except ImportError:
+        print("⚠️  fakeredis not installed, skipping")
+        return True
+
+    ok = test_fair_order(make_queue())
+    ok = test_in_flight_cap(make_queue()) and ok
+    ok = test_reap(make_queue()) and ok
+
+    fair_scheduler._fair_queue = queue = make_queue()
+    try:
+        from app.tasks import analysis_tasks  # noqa: F401
+    except ImportError as e:
+        print(f"⚠️  Celery tasks not importable ({e}), skipping the time limit retry")
+    else:
+        ok = test_time_limit_retry(queue) and ok
+
+    print("\n✅ Fair order, in-flight cap and slot reaping hold" if ok else "\n❌ Fair queue check failed")
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if test_fair_queue() else 1)
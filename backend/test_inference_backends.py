@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Parity and speed check for the torchscript and onnx inference backends
+
+Exports the text and visual models to a temporary directory, runs the same
+fixed corpus (generated log lines, seeded random images) through eager
+PyTorch and every exported backend with the result cache off, and checks
+that each backend gives the same labels as eager with prediction
+probabilities within TOLERANCE. Reports per-item latency and batched
+throughput of each backend against eager.
+
+The onnx backend is skipped when onnxruntime is not installed.
+
+Usage: python test_inference_backends.py [lines] [model_name_or_path]
+"""
+
+import tempfile
+import time
+import sys
+import os
+
+import numpy as np
+import torch
+from PIL import Image
+
+from app.core.config import settings
+from app.ml import inference
+from app.ml.export import export_model
+from app.ml.inference import InferenceBackend
+from test_batch_inference import generate_lines
+
+TOLERANCE = 1e-3
+LATENCY_SAMPLES = 32
+
+def exported_backends():
+    backends = ["torchscript"]
+    if inference.onnxruntime is not None:
+        backends.append("onnx")
+    else:
+        print("⚠️  onnxruntime not installed, skipping the onnx backend")
+    return backends
+
+def compare(label, eager, results, speed):
+    """Print a backend's speed and parity against eager, True if it matches"""
+    errors = sum('error' in result for result in results)
+    same_labels = all(a['threat_level'] == b['threat_level'] for a, b in zip(eager, results))
+    max_delta = max(
+        abs(p - q)
+        for a, b in zip(eager, results)
+        for p, q in zip(a.get('prediction_probabilities', []), b.get('prediction_probabilities', []))
+    )
+    print(f"📊 {label:12} {speed}, same labels: {same_labels}, "
+          f"max probability difference {max_delta:.2e}, errors: {errors}")
+    return not errors and same_labels and max_delta <= TOLERANCE and len(results) == len(eager)
+
+def test_text_backends(count, model_name, directory):
+    print(f"\n📝 Text model, {count} lines")
+    from app.ml.models.text_analyzer import SecurityTextAnalyzer
+
+    analyzer = SecurityTextAnalyzer(model_name=model_name or settings.BERT_MODEL_NAME)
+    analyzer.result_cache = None
+    lines = generate_lines(count)
+    ok = True
+    eager = None
+
+    for backend in ["eager"] + exported_backends():
+        if backend != "eager":
+            export_model("text", analyzer, backend, directory)
+        analyzer.inference = InferenceBackend("text", backend, directory)
+        if backend != "eager" and analyzer.inference.get(analyzer.model_name, analyzer.model_version, analyzer.device) is None:
+            print(f"❌ {backend}: exported model did not load")
+            ok = False
+            continue
+        analyzer.warm_up()
+
+        start_time = time.time()
+        for line in lines[:LATENCY_SAMPLES]:
+            analyzer.analyze_uncached_batch([line])
+        latency = (time.time() - start_time) / LATENCY_SAMPLES
+
+        start_time = time.time()
+        results = analyzer.analyze_uncached_batch(lines)
+        throughput = count / (time.time() - start_time)
+
+        speed = f"{latency * 1000:7.1f} ms/line, {throughput:7.1f} lines/s batched"
+        if eager is None:
+            eager, eager_speed = results, (latency, throughput)
+            print(f"📊 {'eager':12} {speed}")
+            continue
+        ok = compare(backend, eager, results, speed) and ok
+        print(f"   {'':12} {eager_speed[0] / latency:.2f}x latency, {throughput / eager_speed[1]:.2f}x throughput vs eager")
+    return ok
+
+def test_visual_backends(count, directory):
+    print(f"\n🖼️  Visual model, {count} images")
+    from app.ml.models.visual_analyzer import SecurityVisualAnalyzer
+
+    analyzer = SecurityVisualAnalyzer(model_path=settings.RESNET_MODEL_PATH)
+    analyzer.result_cache = None
+    rng = np.random.default_rng(42)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"image_{i}.png")
+        Image.fromarray(rng.integers(0, 256, (rng.integers(64, 400), rng.integers(64, 400), 3), dtype=np.uint8)).save(path)
+        paths.append(path)
+    batch = torch.from_numpy(rng.standard_normal((16, 3, 224, 224), dtype=np.float32)).to(analyzer.device)
+    ok = True
+    eager = None
+
+    for backend in ["eager"] + exported_backends():
+        if backend != "eager":
+            export_model("visual", analyzer, backend, directory)
+        analyzer.inference = InferenceBackend("visual", backend, directory)
+        if backend != "eager" and analyzer.inference.get(analyzer.model_name, analyzer.model_version, analyzer.device) is None:
+            print(f"❌ {backend}: exported model did not load")
+            ok = False
+            continue
+        analyzer.warm_up()
+
+        start_time = time.time()
+        results = [analyzer.analyze_image_uncached(path) for path in paths]
+        latency = (time.time() - start_time) / count
+
+        with torch.no_grad():
+            start_time = time.time()
+            analyzer.forward(batch)
+            throughput = len(batch) / (time.time() - start_time)
+
+        speed = f"{latency * 1000:7.1f} ms/image, {throughput:7.1f} images/s batched (network only)"
+        if eager is None:
+            eager, eager_speed = results, (latency, throughput)
+            print(f"📊 {'eager':12} {speed}")
+            continue
+        ok = compare(backend, eager, results, speed) and ok
+        print(f"   {'':12} {eager_speed[0] / latency:.2f}x latency, {throughput / eager_speed[1]:.2f}x throughput vs eager")
+    return ok
+
+def test_inference_backends(count=256, model_name=None):
+    print("🚀 Starting inference backend comparison")
+    with tempfile.TemporaryDirectory() as directory:
+        text_ok = test_text_backends(count, model_name, directory)
+        visual_ok = test_visual_backends(max(count // 8, 8), directory)
+
+    ok = text_ok and visual_ok
+    print(f"\n✅ Exported backends match eager within {TOLERANCE}" if ok else "\n❌ Inference backend check failed")
+    return ok
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    model_name = sys.argv[2] if len(sys.argv) > 2 else None
+    sys.exit(0 if test_inference_backends(count, model_name) else 1)
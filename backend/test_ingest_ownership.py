@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Ownership checks for resumable raw-body ingests
+
+Leaves an interrupted /logs/ingest partial file for one user, then checks
+that another user who sends the same X-Upload-Id is refused by /ingest,
+/upload-resume and /upload-cancel without the partial changing, and that
+the owner can still resume it into the complete file. A malformed
+Content-Length must be a 400.
+
+Usage: python test_ingest_ownership.py
+"""
+
+import tempfile
+import shutil
+import uuid
+import sys
+import os
+
+workdir = tempfile.mkdtemp()
+os.environ.update({
+    "ENVIRONMENT": "test",
+    "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+    "TEMP_UPLOAD_DIR": os.path.join(workdir, "uploads", "temp"),
+    "MODEL_CACHE_DIR": os.path.join(workdir, "models"),
+    "UPLOAD_SESSION_SQLITE_PATH": os.path.join(workdir, "upload_sessions.db"),
+})
+
+def test_ingest_ownership():
+    print("🚀 Starting ingest ownership checks")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from types import SimpleNamespace
+
+    from app.api.v1.endpoints import logs
+    from app.api.v1.endpoints.auth import get_current_user
+    from app.core.database import Base, SessionLocal, engine
+    from app.models.database import SecurityLog
+
+    Base.metadata.create_all(engine)
+    user = {"id": "user-a"}
+    app = FastAPI()
+    app.include_router(logs.router, prefix="/api/v1/logs")
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=user["id"])
+    client = TestClient(app)
+
+    body = b"".join(f"2024-01-15 10:30:15 WARNING Failed login from 10.0.0.{i % 255}\n".encode() for i in range(1000))
+    upload_id = str(uuid.uuid4())
+    headers = {"X-Filename": "owned.log", "X-Upload-Id": upload_id, "Content-Type": "text/plain"}
+
+    # user-a's ingest was interrupted half way
+    logs.claim_ingest(upload_id, "user-a")
+    partial_path = logs.ingest_partial_path(upload_id)
+    with open(partial_path, "wb") as f:
+        f.write(body[:len(body) // 2])
+
+    user["id"] = "user-b"
+    refused = [
+        client.post("/api/v1/logs/ingest", content=b"stolen\n", headers=headers).status_code,
+        client.post("/api/v1/logs/upload-resume", data={"upload_id": upload_id}).status_code,
+        client.delete(f"/api/v1/logs/upload-cancel/{upload_id}").status_code
+    ]
+    with open(partial_path, "rb") as f:
+        untouched = f.read() == body[:len(body) // 2]
+    print(f"📊 another user's ingest, resume, cancel: {refused}, partial untouched: {untouched}")
+
+    user["id"] = "user-a"
+    resumed = client.post("/api/v1/logs/ingest", content=body[len(body) // 2:], headers=headers)
+    complete = False
+    if resumed.status_code == 200:
+        db = SessionLocal()
+        try:
+            with open(db.get(SecurityLog, resumed.json()["log_id"]).file_path, "rb") as f:
+                complete = f.read() == body
+        finally:
+            db.close()
+    owner_left = os.path.exists(logs.ingest_owner_path(upload_id))
+    print(f"📊 owner resume: {resumed.status_code}, complete file: {complete}, owner sidecar left: {owner_left}")
+
+    bad_length = client.post("/api/v1/logs/ingest", content=b"x\n",
+                             headers={"X-Filename": "bad.log", "Content-Type": "text/plain", "Content-Length": "abc"})
+    print(f"📊 malformed Content-Length: {bad_length.status_code} {bad_length.json().get('detail')}")
+
+    ok = refused == [403, 403, 403] and untouched and complete and not owner_left and bad_length.status_code == 400
+    print("\n✅ Ingests are only resumable by their owner" if ok else "\n❌ Ingest ownership check failed")
+    return ok
+
+if __name__ == "__main__":
+    try:
+        ok = test_ingest_ownership()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
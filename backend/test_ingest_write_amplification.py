@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Disk write amplification check for /logs/ingest vs /logs/upload-streaming
+
+Uploads the same generated body through both routes of a throwaway server
+and compares the bytes the server process wrote (/proc/<pid>/io) with the
+payload size. The raw-body ingest route should come in at about 1.0x; the
+multipart route pays for spooling on top. Linux only.
+
+Usage: python test_ingest_write_amplification.py [size_gb]
+"""
+
+import requests
+import tempfile
+import uuid
+import time
+import sys
+
+from test_upload_memory import API_BASE_URL, BOUNDARY, start_server, get_token, multipart_body
+
+def read_io_counters(pid):
+    """Read /proc/<pid>/io into a dict"""
+    counters = {}
+    with open(f"/proc/{pid}/io") as f:
+        for line in f:
+            key, value = line.split(":")
+            counters[key] = int(value)
+    return counters
+
+def raw_body(size_bytes, chunk_size=1024 * 1024):
+    """Yield a synthetic log body of size_bytes"""
+    line = b"2024-01-15 10:30:15 WARNING Failed login attempt from IP 192.168.1.100\n"
+    block = line * (chunk_size // len(line))
+    sent = 0
+    while sent < size_bytes:
+        part = block[:size_bytes - sent]
+        sent += len(part)
+        yield part
+
+def measure(pid, send):
+    """Run an upload and return (response, bytes written by the server)"""
+    before = read_io_counters(pid)
+    start_time = time.time()
+    response = send()
+    elapsed = time.time() - start_time
+    after = read_io_counters(pid)
+    return response, after["wchar"] - before["wchar"], elapsed
+
+def test_write_amplification(size_gb=1.0):
+    print("🚀 Starting write amplification comparison")
+    size_bytes = int(size_gb * 1024 ** 3)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server = start_server(workdir)
+        try:
+            token = get_token()
+            auth = {"Authorization": f"Bearer {token}"}
+
+            ingest_response, ingest_written, ingest_time = measure(server.pid, lambda: requests.post(
+                f"{API_BASE_URL}/logs/ingest",
+                data=raw_body(size_bytes),
+                headers={
+                    **auth,
+                    "Content-Type": "text/plain",
+                    "X-Filename": "synthetic.log",
+                    "X-Upload-Type": "text",
+                    "X-Upload-Id": str(uuid.uuid4())
+                }
+            ))
+            multipart_response, multipart_written, multipart_time = measure(server.pid, lambda: requests.post(
+                f"{API_BASE_URL}/logs/upload-streaming",
+                data=multipart_body(size_bytes),
+                headers={**auth, "Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+            ))
+        finally:
+            server.terminate()
+            server.wait()
+
+    ingest_ratio = ingest_written / size_bytes
+    multipart_ratio = multipart_written / size_bytes
+
+    print(f"📊 /logs/ingest:           {ingest_response.status_code}, {ingest_ratio:.2f}x written, {ingest_time:.2f}s")
+    print(f"📊 /logs/upload-streaming: {multipart_response.status_code}, {multipart_ratio:.2f}x written, {multipart_time:.2f}s")
+
+    ok = ingest_response.status_code == 200 and ingest_ratio < 1.05
+    print("\n✅ Ingest write amplification ~1.0x" if ok else "\n❌ Ingest wrote more than expected")
+    return ok
+
+if __name__ == "__main__":
+    size = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    sys.exit(0 if test_write_amplification(size) else 1)
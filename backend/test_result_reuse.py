@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Scoping checks for reusing the analysis of duplicate uploads
+
+User A uploads a log and has it analyzed. Then:
+
+1. user B uploads the same bytes: it is not reported as a duplicate and
+   gets none of A's results, only a pending analysis of its own,
+2. user A uploads it again: a duplicate, analyzed from A's results,
+3. user B uploads a folder with the bytes twice: only the second file is
+   a duplicate, and neither reuses A's results,
+4. the model version changes and A uploads it again: still a duplicate,
+   but the results of the old model are not reused.
+
+Usage: python test_result_reuse.py
+"""
+
+import tempfile
+import shutil
+import sys
+import os
+
+workdir = tempfile.mkdtemp()
+os.environ.update({
+    "ENVIRONMENT": "test",
+    "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+    "TEMP_UPLOAD_DIR": os.path.join(workdir, "uploads", "temp"),
+    "MODEL_CACHE_DIR": os.path.join(workdir, "models"),
+    "ANALYSIS_TRIAGE": "false",
+})
+
+BODY = b"".join(f"2024-01-15 10:30:{i % 60:02d} sshd[{i}]: {'attack' if i % 5 == 0 else 'accepted'} "
+                f"connection from 10.0.0.{i % 255}\n".encode() for i in range(500))
+
+class FakeAnalyzer:
+    """Deterministic verdicts by keyword, recorded under the configured model version"""
+
+    def __init__(self, model_version):
+        self.model_version = model_version
+
+    def batch_analyze(self, texts):
+        return [{"threat_level": "high" if "attack" in text else "normal", "confidence": 0.9,
+                 "model_name": "fake"} for text in texts]
+
+def test_result_reuse():
+    print("🚀 Starting duplicate reuse scoping checks")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from types import SimpleNamespace
+
+    from app.api.v1.endpoints import logs
+    from app.api.v1.endpoints.auth import get_current_user
+    from app.core.config import settings
+    from app.core.database import Base, SessionLocal, engine
+    from app.models.database import AnalysisResult
+    from app.services.analysis_service import AnalysisService
+
+    Base.metadata.create_all(engine)
+    user = {"id": "user-a"}
+    app = FastAPI()
+    app.include_router(logs.router, prefix="/api/v1/logs")
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=user["id"])
+    client = TestClient(app)
+
+    def upload(user_id):
+        user["id"] = user_id
+        response = client.post("/api/v1/logs/upload", files={"file": ("auth.log", BODY, "text/plain")})
+        return response.json()
+
+    def result_count(log_id):
+        db = SessionLocal()
+        try:
+            return db.query(AnalysisResult).filter(AnalysisResult.log_id == log_id).count()
+        finally:
+            db.close()
+
+    first = upload("user-a")
+    db = SessionLocal()
+    try:
+        analysis_id = AnalysisService.create_job(db, "user-a", [first["log_id"]]).id
+        db.commit()
+    finally:
+        db.close()
+    AnalysisService(FakeAnalyzer(settings.MODEL_VERSION)).analyze_logs([first["log_id"]], "user-a", analysis_id)
+    analyzed = result_count(first["log_id"])
+    print(f"📊 user A's upload analyzed into {analyzed} results")
+
+    other = upload("user-b")
+    print(f"📊 user B, same bytes: duplicate {other['duplicate']}, status {other['status']}, "
+          f"{result_count(other['log_id'])} results")
+    ok = analyzed > 0 and not first["duplicate"]
+    ok = ok and not other["duplicate"] and other["status"] == "pending_analysis" and result_count(other["log_id"]) == 0
+
+    again = upload("user-a")
+    print(f"📊 user A again: duplicate {again['duplicate']}, status {again['status']}, "
+          f"{result_count(again['log_id'])} results")
+    ok = ok and again["duplicate"] and again["status"] == "analyzed" and result_count(again["log_id"]) == analyzed
+
+    user["id"] = "user-c"
+    folder = client.post("/api/v1/logs/upload-folder", files=[
+        ("files", ("one.log", BODY, "text/plain")),
+        ("files", ("two.log", BODY, "text/plain")),
+    ]).json()["uploaded_files"]
+    print(f"📊 user C folder with the bytes twice: duplicates {[f['duplicate'] for f in folder]}, "
+          f"statuses {[f['status'] for f in folder]}")
+    ok = ok and [f["duplicate"] for f in folder] == [False, True]
+    ok = ok and all(f["status"] == "pending_analysis" and result_count(f["log_id"]) == 0 for f in folder)
+
+    settings.MODEL_VERSION = "2.0.0"
+    upgraded = upload("user-a")
+    print(f"📊 user A after a model upgrade: duplicate {upgraded['duplicate']}, status {upgraded['status']}, "
+          f"{result_count(upgraded['log_id'])} results")
+    ok = ok and upgraded["duplicate"] and upgraded["status"] == "pending_analysis" and result_count(upgraded["log_id"]) == 0
+
+    print("\n✅ Duplicate reuse stays within the user and model version" if ok else "\n❌ Duplicate reuse check failed")
+    return ok
+
+if __name__ == "__main__":
+    try:
+        ok = test_result_reuse()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Concurrency check for the reduce step of sharded log analysis
+
+Every shard of a log that finishes calls reduce_if_done, so when the last
+shards of a log finish together several calls see all of them done. The
+right to reduce is claimed by flipping the first checkpoint's ``reduced``
+flag with a conditional update. This starts many reducers per log at once,
+each with its own session and connection to a file-backed SQLite database
+(like separate workers), and checks that exactly one of them reduces each
+log, that the log is counted once on the job, and that the job completes.
+
+Usage: python test_shard_reduce.py [reducers] [logs]
+"""
+
+import threading
+import tempfile
+import shutil
+import uuid
+import sys
+import os
+
+workdir = tempfile.mkdtemp()
+os.environ.update({
+    "ENVIRONMENT": "test",
+    "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+    "TEMP_UPLOAD_DIR": os.path.join(workdir, "uploads", "temp"),
+    "MODEL_CACHE_DIR": os.path.join(workdir, "models"),
+    "ANALYSIS_TRIAGE": "false",
+})
+
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base
+from app.models.database import SecurityLog, AnalysisJob, AnalysisCheckpoint
+from app.services.analysis_service import AnalysisService
+
+SHARDS = 4
+RECORDS_PER_SHARD = 250
+
+def make_sessions():
+    engine = create_engine(
+        f"sqlite:///{os.path.join(workdir, 'reduce.db')}",
+        connect_args={"check_same_thread": False, "timeout": 30}
+    )
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+def seed(Session, logs):
+    """A processing job over ``logs`` logs whose shards have all completed"""
+    db = Session()
+    user_id = str(uuid.uuid4())
+    log_ids = []
+    for i in range(logs):
+        log = SecurityLog(timestamp=datetime.utcnow(), source="file_upload", log_type="security_log",
+                          raw_message=f"log {i}", parsed_data={}, user_id=user_id)
+        db.add(log)
+        db.flush()
+        log_ids.append(log.id)
+    job = AnalysisService.create_job(db, user_id, log_ids)
+    job.status = "processing"
+    for log_id in log_ids:
+        for shard in range(SHARDS):
+            db.add(AnalysisCheckpoint(
+                analysis_id=job.id, log_id=log_id,
+                shard_start=shard * 1000, shard_end=(shard + 1) * 1000,
+                offset=(shard + 1) * 1000, records=RECORDS_PER_SHARD,
+                threat_distribution={"normal": RECORDS_PER_SHARD - 1, "high": 1},
+                severity="high", templates=[], completed=True
+            ))
+    db.commit()
+    analysis_id = job.id
+    db.close()
+    return analysis_id, log_ids
+
+def race(Session, analysis_id, log_id, reducers):
+    """Call reduce_if_done from ``reducers`` threads at once; returns the summaries of those that reduced"""
+    barrier = threading.Barrier(reducers)
+    merged = []
+    errors = []
+
+    def reducer():
+        db = Session()
+        service = AnalysisService(analyzer=object())
+        barrier.wait()
+        try:
+            summary = service.reduce_if_done(db, analysis_id, log_id)
+            if summary is not None:
+                merged.append(summary)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=reducer) for _ in range(reducers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        print(f"   errors: {errors}")
+    return merged
+
+def test_shard_reduce(reducers=8, logs=10):
+    print("🚀 Starting shard reduce race")
+    Session = make_sessions()
+    analysis_id, log_ids = seed(Session, logs)
+
+    winners = [len(race(Session, analysis_id, log_id, reducers)) for log_id in log_ids]
+    print(f"📊 {reducers} concurrent reducers per log, reductions per log: {winners}")
+
+    db = Session()
+    try:
+        job = db.get(AnalysisJob, analysis_id)
+        records = [db.get(SecurityLog, log_id).parsed_data.get("analysis", {}).get("records") for log_id in log_ids]
+        late = AnalysisService(analyzer=object()).reduce_if_done(db, analysis_id, log_ids[0])
+        print(f"📊 job {job.status}: {job.logs_completed} logs completed, {job.logs_failed} failed of {job.log_count}")
+        ok = (winners == [1] * logs
+              and job.status == "completed"
+              and job.logs_completed == logs and job.logs_failed == 0
+              and records == [SHARDS * RECORDS_PER_SHARD] * logs
+              and late is None)
+    finally:
+        db.close()
+
+    print("\n✅ Exactly one reducer per log" if ok else "\n❌ Shard reduce check failed")
+    return ok
+
+if __name__ == "__main__":
+    reducers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    logs = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    try:
+        ok = test_shard_reduce(reducers, logs)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Peak-RSS regression test for /logs/upload
+
+Starts its own API server, uploads a multi-GB synthetic body that is
+generated on the fly (never materialized on the client either), and checks
+that the server's peak resident memory stays bounded. Linux only: memory is
+read from /proc/<pid>/status.
+
+Usage: python test_upload_memory.py [size_gb] [max_rss_growth_mb]
+"""
+
+import requests
+import subprocess
+import tempfile
+import time
+import sys
+import os
+
+PORT = 8765
+BASE_URL = f"http://127.0.0.1:{PORT}"
+API_BASE_URL = f"{BASE_URL}/api/v1"
+BOUNDARY = "vistaRssRegressionBoundary"
+
+def read_memory_kb(pid, field):
+    """Read a memory field (VmRSS / VmHWM) for a process in kB"""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+def start_server(workdir):
+    """Start a throwaway API server with isolated storage"""
+    env = dict(os.environ)
+    env.update({
+        "ENVIRONMENT": "test",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "TEMP_UPLOAD_DIR": os.path.join(workdir, "uploads", "temp"),
+        "TMPDIR": workdir,  # multipart spool files land here
+    })
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app",
+         "--host", "127.0.0.1", "--port", str(PORT), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env
+    )
+    for _ in range(60):
+        try:
+            if requests.get(f"{BASE_URL}/health").status_code == 200:
+                return server
+        except requests.exceptions.ConnectionError:
+            pass
+        time.sleep(1)
+    server.kill()
+    raise RuntimeError("API server did not start")
+
+def get_token():
+    """Register and login a throwaway user"""
+    user_data = {
+        "email": f"rss_test{int(time.time())}@example.com",
+        "password": "testpass123",
+        "full_name": "RSS Regression Test User",
+        "company_name": "Test Company"
+    }
+    requests.post(f"{API_BASE_URL}/auth/register", json=user_data).raise_for_status()
+    response = requests.post(f"{API_BASE_URL}/auth/login", data={
+        "username": user_data["email"],
+        "password": user_data["password"]
+    })
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+def multipart_body(size_bytes, chunk_size=1024 * 1024):
+    """Yield a multipart/form-data body with a synthetic log file of size_bytes"""
+    yield (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="upload_type"\r\n\r\n'
+        f"text\r\n"
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="synthetic.log"\r\n'
+        f"Content-Type: text/plain\r\n\r\n"
+    ).encode()
+
+    line = b"2024-01-15 10:30:15 WARNING Failed login attempt from IP 192.168.1.100\n"
+    block = line * (chunk_size // len(line))
+    sent = 0
+    while sent < size_bytes:
+        part = block[:size_bytes - sent]
+        sent += len(part)
+        yield part
+
+    yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+def test_upload_memory(size_gb=3.0, max_rss_growth_mb=128):
+    print("🚀 Starting /logs/upload peak-RSS regression test")
+    size_bytes = int(size_gb * 1024 ** 3)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server = start_server(workdir)
+        try:
+            token = get_token()
+            baseline_kb = read_memory_kb(server.pid, "VmRSS")
+            print(f"📊 Server RSS before upload: {baseline_kb / 1024:.1f}MB")
+
+            print(f"\n⬆️  Uploading {size_gb}GB synthetic log...")
+            start_time = time.time()
+            response = requests.post(
+                f"{API_BASE_URL}/logs/upload",
+                data=multipart_body(size_bytes),
+                headers={
+                    "Authorization": f"Bearer {token}",
+                    "Content-Type": f"multipart/form-data; boundary={BOUNDARY}"
+                }
+            )
+            upload_time = time.time() - start_time
+
+            peak_kb = read_memory_kb(server.pid, "VmHWM")
+            growth_mb = (peak_kb - baseline_kb) / 1024
+
+            print(f"📊 Status: {response.status_code}")
+            print(f"📊 Upload time: {upload_time:.2f} seconds")
+            print(f"📊 Server peak RSS: {peak_kb / 1024:.1f}MB (+{growth_mb:.1f}MB)")
+
+            ok = (
+                response.status_code == 200
+                and response.json()["file_size"] == size_bytes
+                and growth_mb <= max_rss_growth_mb
+            )
+            if ok:
+                print(f"\n✅ Peak RSS growth within {max_rss_growth_mb}MB budget")
+            else:
+                print(f"\n❌ Upload failed or peak RSS growth exceeded {max_rss_growth_mb}MB: {response.text[:200]}")
+            return ok
+        finally:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    size = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    budget = int(sys.argv[2]) if len(sys.argv) > 2 else 128
+    sys.exit(0 if test_upload_memory(size, budget) else 1)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Concurrency and failure checks for chunked-upload sessions
+
+Registers the chunks of one upload from many threads at once, each thread
+with its own store instance (its own SQLite connection or Redis client,
+like separate API workers), and checks that exactly one caller is told it
+completed the upload, also when every chunk is sent twice. A released
+session must hand completion to exactly one later caller.
+
+Then fails the database commit of a real /logs/upload-chunk finalization
+and checks that re-sending the last chunk completes the upload with the
+original bytes, and that an upload whose chunks fall short of its declared
+total_size is rejected instead of stored with NUL padding. A completed
+upload must end up in content-addressed storage under its SHA-256, raw or
+compressed at rest, with a second upload of the same bytes a duplicate;
+a file_id that is not a UUID is refused.
+
+Last, the sweep of abandoned partial uploads must remove partial files
+(and owner sidecars) idle for longer than its cutoff and keep fresh ones.
+
+The Redis store is checked against fakeredis and skipped when it is not
+installed.
+
+Usage: python test_upload_sessions.py [threads]
+"""
+
+import threading
+import tempfile
+import shutil
+import uuid
+import sys
+import os
+
+workdir = tempfile.mkdtemp()
+os.environ.update({
+    "ENVIRONMENT": "test",
+    "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+    "TEMP_UPLOAD_DIR": os.path.join(workdir, "uploads", "temp"),
+    "MODEL_CACHE_DIR": os.path.join(workdir, "models"),
+    "UPLOAD_SESSION_BACKEND": "sqlite",
+    "UPLOAD_SESSION_SQLITE_PATH": os.path.join(workdir, "upload_sessions.db"),
+})
+
+from app.services.upload_sessions import SQLiteUploadSessionStore, RedisUploadSessionStore
+
+def sqlite_stores():
+    path = os.path.join(workdir, f"race_{uuid.uuid4().hex}.db")
+    return lambda: SQLiteUploadSessionStore(path)
+
+def redis_stores():
+    import fakeredis
+
+    server = fakeredis.FakeServer()
+
+    def make():
+        store = RedisUploadSessionStore.__new__(RedisUploadSessionStore)
+        store.ttl = 60
+        store.client = fakeredis.FakeRedis(server=server, decode_responses=True)
+        store._register_chunk = store.client.register_script(store.REGISTER_CHUNK_SCRIPT)
+        return store
+    return make
+
+def race(make_store, threads, total_chunks=64):
+    """Register every chunk twice from ``threads`` workers at once; returns how many were told they completed"""
+    file_id = str(uuid.uuid4())
+    chunks = list(range(1, total_chunks + 1)) * 2
+    barrier = threading.Barrier(threads)
+    completions = []
+    errors = []
+
+    def worker(index):
+        store = make_store()
+        barrier.wait()
+        try:
+            for chunk_number in chunks[index::threads]:
+                _, completed = store.register_chunk(file_id, chunk_number, 100, "race.log",
+                                                    total_chunks, "text", "user-a")
+                if completed:
+                    completions.append(chunk_number)
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+    session = make_store().get(file_id)
+    if errors or session["chunks_received"] != total_chunks or session["bytes_received"] != total_chunks * 100:
+        print(f"   errors: {errors}, session: {session}")
+        return -1, file_id
+    return len(completions), file_id
+
+def test_store(name, make_store, threads):
+    completions, file_id = race(make_store, threads)
+    print(f"📊 {name}: {completions} of {threads} concurrent workers completed the upload")
+    ok = completions == 1
+
+    # A failed finalization hands completion to exactly one retry
+    store = make_store()
+    _, again = store.register_chunk(file_id, 64, 100, "race.log", 64, "text", "user-a")
+    store.release(file_id)
+    retries = [store.register_chunk(file_id, 64, 100, "race.log", 64, "text", "user-a")[1] for _ in range(3)]
+    print(f"📊 {name}: completed before release {again}, retries after release {retries}")
+    ok = ok and not again and retries == [True, False, False]
+
+    try:
+        store.register_chunk(file_id, 1, 100, "race.log", 64, "text", "user-b")
+        ok = False
+        print(f"❌ {name}: another user could register a chunk")
+    except PermissionError:
+        pass
+    return ok
+
+def make_client(failures):
+    """Test client for the logs router whose database commit fails ``failures["commit"]`` times"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from types import SimpleNamespace
+
+    from app.api.v1.endpoints import logs
+    from app.api.v1.endpoints.auth import get_current_user
+    from app.core.database import Base, SessionLocal, engine, get_db
+
+    Base.metadata.create_all(engine)
+
+    def failing_db():
+        db = SessionLocal()
+        commit = db.commit
+
+        def flaky_commit():
+            if failures["commit"]:
+                failures["commit"] -= 1
+                raise RuntimeError("database went away")
+            commit()
+        db.commit = flaky_commit
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(logs.router, prefix="/api/v1/logs")
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="user-a")
+    app.dependency_overrides[get_db] = failing_db
+    return TestClient(app)
+
+def chunk_sender(client, body, chunk_size=16 * 1024, total_size=None, file_id=None):
+    """Split ``body`` into chunks; returns (number of chunks, send(chunk_number))"""
+    parts = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    file_id = file_id or str(uuid.uuid4())
+
+    def send(number):
+        return client.post("/api/v1/logs/upload-chunk", data={
+            "chunk_number": number,
+            "total_chunks": len(parts),
+            "file_id": file_id,
+            "filename": "retry.log",
+            "chunk_size": chunk_size,
+            "total_size": total_size or len(body)
+        }, files={"chunk": ("retry.log", parts[number - 1], "text/plain")})
+    return len(parts), send
+
+def log_body(lines=1000):
+    return b"".join(f"2024-01-15 10:30:{i % 60:02d} WARNING Failed login from 10.0.0.{i % 255}\n".encode()
+                    for i in range(lines))
+
+def test_finalize_retry():
+    """Fail the commit that finalizes an upload, then re-send the last chunk"""
+    from app.core.database import SessionLocal
+    from app.models.database import SecurityLog
+
+    body = log_body()
+    chunks, send = chunk_sender(make_client({"commit": 1}), body)
+    for number in range(1, chunks):
+        send(number).raise_for_status()
+    failed = send(chunks)
+    retried = send(chunks)
+    print(f"📊 finalize with failing commit: {failed.status_code} {failed.json().get('detail')}")
+    print(f"📊 last chunk re-sent: {retried.status_code} {retried.json().get('status')}")
+
+    if retried.status_code != 200:
+        return False
+    db = SessionLocal()
+    try:
+        log = db.get(SecurityLog, retried.json()["log_id"])
+        with open(log.file_path, "rb") as f:
+            same_bytes = f.read() == body
+    finally:
+        db.close()
+    print(f"📊 stored file matches the uploaded bytes: {same_bytes}")
+    return failed.status_code == 503 and retried.json()["status"] == "completed" and same_bytes
+
+def test_total_size_mismatch():
+    """An overstated total_size must not leave NUL padding in a completed upload"""
+    body = log_body()
+    chunks, send = chunk_sender(make_client({"commit": 0}), body, total_size=len(body) + 4096)
+    responses = [send(number) for number in range(1, chunks + 1)]
+    last = responses[-1]
+    print(f"📊 overstated total_size: {last.status_code} {last.json().get('detail')}")
+    return last.status_code == 400 and all(r.status_code == 200 for r in responses[:-1])
+
+def upload(client, body):
+    chunks, send = chunk_sender(client, body)
+    for number in range(1, chunks):
+        send(number).raise_for_status()
+    return send(chunks).json()
+
+def test_content_addressed():
+    """Completed uploads are hashed into blobs, raw or compressed at rest"""
+    import hashlib
+
+    from app.core.config import settings
+    from app.core.database import SessionLocal
+    from app.models.database import SecurityLog
+    from app.services.compressed_storage import open_stored_file
+
+    client = make_client({"commit": 0})
+    ok = True
+    for codec in (None, "gzip"):
+        settings.COMPRESSED_STORAGE = codec
+        body = log_body(1500 if codec else 1200)
+        first, second = upload(client, body), upload(client, body)
+        db = SessionLocal()
+        try:
+            log = db.get(SecurityLog, first["log_id"])
+            with open_stored_file(log.file_path) as f:
+                same_bytes = f.read() == body
+            same = (log.content_hash == hashlib.sha256(body).hexdigest()
+                    and os.path.basename(log.file_path) == log.content_hash
+                    and log.parsed_data["compression"] == codec
+                    and db.get(SecurityLog, second["log_id"]).file_path == log.file_path)
+        finally:
+            db.close()
+        print(f"📊 completed upload, compression {codec}: stored under its SHA-256 {same}, bytes intact {same_bytes}, "
+              f"duplicates {first['duplicate']} then {second['duplicate']}")
+        ok = ok and same and same_bytes and not first["duplicate"] and second["duplicate"]
+    settings.COMPRESSED_STORAGE = None
+
+    leftovers = [name for name in os.listdir(settings.UPLOAD_DIR) if name.endswith(".part")]
+    _, send = chunk_sender(client, log_body(10), file_id="../../escape")
+    refused = send(1)
+    print(f"📊 partial files left {leftovers}, file_id '../../escape': {refused.status_code}")
+    return ok and not leftovers and refused.status_code == 400
+
+def test_sweep():
+    """Partial uploads idle past the cutoff are removed with their sidecars"""
+    import time
+
+    from app.core.config import settings
+    from app.services.upload_storage import sweep_abandoned_uploads
+
+    def touch(name, age):
+        path = os.path.join(settings.UPLOAD_DIR, name)
+        with open(path, "wb") as f:
+            f.write(b"partial")
+        os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    stale = [touch(f"{uuid.uuid4()}_big.log.part", 7200), touch(f"{uuid.uuid4()}.part", 7200)]
+    stale.append(touch(os.path.basename(stale[1]) + ".owner", 7200))
+    stale.append(touch(f"{uuid.uuid4()}.part.owner", 7200))  # claimed, but no bytes ever arrived
+    fresh = [touch(f"{uuid.uuid4()}_live.log.part", 10)]
+    fresh.append(touch(os.path.basename(fresh[0]) + ".owner", 7200))  # an old claim still being written to
+
+    removed = sweep_abandoned_uploads(max_age=3600)
+    print(f"📊 sweep: removed {removed}, stale left {sum(map(os.path.exists, stale))}, "
+          f"fresh kept {sum(map(os.path.exists, fresh))}/{len(fresh)}")
+    return removed == 3 and not any(map(os.path.exists, stale)) and all(map(os.path.exists, fresh))
+
+def test_upload_sessions(threads=8):
+    print("🚀 Starting upload session checks")
+    ok = test_store("sqlite", sqlite_stores(), threads)
+    try:
+        make_redis = redis_stores()
+    except ImportError:
+        print("⚠️  fakeredis not installed, skipping the Redis store")
+    else:
+        ok = test_store("redis", make_redis, threads) and ok
+    ok = test_finalize_retry() and ok
+    ok = test_total_size_mismatch() and ok
+    ok = test_content_addressed() and ok
+    ok = test_sweep() and ok
+    print("\n✅ Exactly one completer, and failed finalizations can be retried" if ok else "\n❌ Upload session check failed")
+    return ok
+
+if __name__ == "__main__":
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    try:
+        ok = test_upload_sessions(threads)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Damaged member check for ZIP archive expansion
+
+Builds an archive with a good member, a member whose deflate data is
+corrupt, a member whose LZMA data is corrupt and a stored member cut short
+(the archive was truncated inside it), then expands it. The damaged
+members must be listed as skipped with their error while the good member
+is still extracted into its own SecurityLog.
+
+Usage: python test_zip_ingest.py
+"""
+
+import tempfile
+import zipfile
+import struct
+import shutil
+import sys
+import io
+import os
+
+workdir = tempfile.mkdtemp()
+os.environ.update({
+    "ENVIRONMENT": "test",
+    "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+    "TEMP_UPLOAD_DIR": os.path.join(workdir, "uploads", "temp"),
+    "MODEL_CACHE_DIR": os.path.join(workdir, "models"),
+})
+
+LINES = b"".join(f"2024-01-15 10:30:{i % 60:02d} sshd[{i}]: accepted connection from 10.0.0.{i % 255}\n".encode()
+                 for i in range(2000))
+
+def member_data_offset(data, info):
+    """Where a member's compressed bytes start, after its local header"""
+    name_length, extra_length = struct.unpack("<HH", data[info.header_offset + 26:info.header_offset + 30])
+    return info.header_offset + 30 + name_length + extra_length
+
+def make_archive():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("good.log", LINES, zipfile.ZIP_DEFLATED)
+        archive.writestr("corrupt.log", LINES, zipfile.ZIP_DEFLATED)
+        archive.writestr("corrupt-lzma.log", LINES, zipfile.ZIP_LZMA)
+        archive.writestr("truncated.log", LINES, zipfile.ZIP_STORED)
+    data = bytearray(buffer.getvalue())
+    infos = {info.filename: info for info in zipfile.ZipFile(io.BytesIO(bytes(data))).infolist()}
+
+    # A deflate block of the reserved type 3: "invalid block type"
+    data[member_data_offset(data, infos["corrupt.log"])] = 0xFF
+    # Garbage in the middle of the LZMA stream
+    start = member_data_offset(data, infos["corrupt-lzma.log"]) + 64
+    data[start:start + 256] = b"\xff" * 256
+
+    # Drop the second half of the last member; the central directory that
+    # follows still declares its full size
+    start = member_data_offset(data, infos["truncated.log"])
+    cut = len(LINES) // 2
+    del data[start + cut:start + len(LINES)]
+    end = data.rfind(b"PK\x05\x06")
+    directory_offset = struct.unpack("<I", data[end + 16:end + 20])[0]
+    data[end + 16:end + 20] = struct.pack("<I", directory_offset - (len(LINES) - cut))
+    return bytes(data)
+
+def test_zip_ingest():
+    print("🚀 Starting damaged archive expansion check")
+    from datetime import datetime
+
+    from app.core.database import Base, SessionLocal, engine
+    from app.models.database import SecurityLog
+    from app.services.zip_ingest import ZipIngestService
+
+    Base.metadata.create_all(engine)
+    os.makedirs(os.environ["UPLOAD_DIR"], exist_ok=True)
+    archive_path = os.path.join(workdir, "uploads", "damaged.zip")
+    with open(archive_path, "wb") as f:
+        f.write(make_archive())
+
+    db = SessionLocal()
+    archive_log = SecurityLog(timestamp=datetime.utcnow(), source="file_upload", log_type="security_log",
+                              raw_message="Uploaded file: damaged.zip", file_path=archive_path,
+                              file_size=os.path.getsize(archive_path),
+                              parsed_data={"filename": "damaged.zip"}, user_id="user-a")
+    db.add(archive_log)
+    db.commit()
+    archive_log_id = archive_log.id
+    db.close()
+
+    summary = ZipIngestService().expand_archive(archive_log_id)
+    skipped = {entry["member"]: entry["error"] for entry in summary["skipped"]}
+    for member, error in sorted(skipped.items()):
+        print(f"📊 skipped {member}: {error}")
+
+    db = SessionLocal()
+    try:
+        members = db.query(SecurityLog).filter(SecurityLog.source == "zip_member").all()
+        names = [m.parsed_data["filename"] for m in members]
+        sizes = [m.file_size for m in members]
+        archive_log = db.get(SecurityLog, archive_log_id)
+        print(f"📊 extracted {summary['extracted']}: {names}, archive processed {archive_log.processed}")
+        ok = (summary["extracted"] == 1 and names == ["good.log"] and sizes == [len(LINES)]
+              and sorted(skipped) == ["corrupt-lzma.log", "corrupt.log", "truncated.log"] and all(skipped.values())
+              and archive_log.processed
+              and not [name for name in os.listdir(os.environ["UPLOAD_DIR"]) if name.endswith(".part")])
+    finally:
+        db.close()
+
+    print("\n✅ Damaged members are skipped and the rest extracted" if ok else "\n❌ Damaged archive check failed")
+    return ok
+
+if __name__ == "__main__":
+    try:
+        ok = test_zip_ingest()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,29 @@
+"""
+Shared setup for the focused unit tests
+
+Points settings at throwaway directories in test mode before anything
+under ``app`` is imported, and puts the backend on the import path.
+
+Usage (from backend/): python -m pytest tests
+"""
+
+import tempfile
+import shutil
+import sys
+import os
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+workdir = tempfile.mkdtemp()
+os.environ.update({
+    "ENVIRONMENT": "test",
+    "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+    "TEMP_UPLOAD_DIR": os.path.join(workdir, "uploads", "temp"),
+    "MODEL_CACHE_DIR": os.path.join(workdir, "models"),
+    "RESULT_CACHE_SQLITE_PATH": os.path.join(workdir, "models", "result_cache.db"),
+})
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,43 @@
+"""
+Priority lanes: the size boundaries of classify_priority and the queue of
+each lane
+"""
+
+import pytest
+
+from app.core.config import settings
+from app.services.analysis_service import analysis_queue, classify_priority
+
+INTERACTIVE_MAX = settings.ANALYSIS_INTERACTIVE_MAX_BYTES
+BULK_MIN = settings.ANALYSIS_BULK_MIN_BYTES
+
+
+@pytest.mark.parametrize("total_bytes, origin, lane", [
+    (0, "trigger", "interactive"),
+    (INTERACTIVE_MAX, "trigger", "interactive"),
+    (INTERACTIVE_MAX + 1, "trigger", "normal"),
+    (BULK_MIN - 1, "trigger", "normal"),
+    (BULK_MIN, "trigger", "bulk"),
+    (0, "upload", "normal"),
+    (INTERACTIVE_MAX, "upload", "normal"),
+    (BULK_MIN - 1, "upload", "normal"),
+    (BULK_MIN, "upload", "bulk"),
+    (BULK_MIN * 10, "resume", "bulk"),
+])
+def test_boundaries(total_bytes, origin, lane):
+    assert classify_priority(total_bytes, origin) == lane
+
+
+def test_bulk_wins_over_interactive(monkeypatch):
+    # With overlapping limits a large trigger is still bulk
+    monkeypatch.setattr(settings, "ANALYSIS_INTERACTIVE_MAX_BYTES", 10)
+    monkeypatch.setattr(settings, "ANALYSIS_BULK_MIN_BYTES", 5)
+    assert classify_priority(7, "trigger") == "bulk"
+    assert classify_priority(4, "trigger") == "interactive"
+
+
+def test_queues():
+    assert analysis_queue("interactive") == settings.ANALYSIS_QUEUES["interactive"]
+    assert analysis_queue("bulk") == settings.ANALYSIS_QUEUES["bulk"]
+    assert analysis_queue(None) == settings.ANALYSIS_QUEUES["normal"]
+    assert analysis_queue("unknown") == settings.ANALYSIS_QUEUES["normal"]
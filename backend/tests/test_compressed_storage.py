@@ -0,0 +1,158 @@
+"""
+Framed compressed storage: seeking and reading across frame boundaries,
+and continuing an interrupted upload in the format it was started in
+"""
+
+import asyncio
+import io
+import os
+
+import pytest
+
+from app.services.compressed_storage import (
+    FRAME_INDEX_SUFFIX, FrameWriter, FramedReader, is_compressed, load_frame_index,
+    open_stored_file, stored_size
+)
+from app.services.upload_storage import write_stream
+
+DATA = b"".join(f"2024-01-15 10:30:{i % 60:02d} sshd[{i}]: accepted connection\n".encode() for i in range(400))
+FRAME = 1000
+
+
+def write_framed(path, data, codec="gzip", frame_size=FRAME, append=False):
+    writer = FrameWriter(path, codec, append=append, frame_size=frame_size)
+    writer.write(data)
+    writer.close()
+
+
+def read_fully(reader, length):
+    """Raw reads stop at the end of the current frame; collect until ``length`` or EOF"""
+    data = b""
+    while len(data) < length:
+        block = reader.read(length - len(data))
+        if not block:
+            break
+        data += block
+    return data
+
+
+def chunks_of(data, size=777):
+    async def chunks():
+        for i in range(0, len(data), size):
+            yield data[i:i + size]
+    return chunks()
+
+
+@pytest.fixture
+def framed(tmp_path):
+    path = str(tmp_path / "framed.log")
+    write_framed(path, DATA)
+    return path
+
+
+def test_frames_are_indexed(framed):
+    index = load_frame_index(framed)
+    ends = list(index[0::2])
+    assert ends == list(range(FRAME, len(DATA), FRAME)) + [len(DATA)]
+    assert index[-1] == os.path.getsize(framed)
+    assert stored_size(framed) == len(DATA)
+
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_reads_straddle_frames(tmp_path, codec):
+    path = str(tmp_path / f"framed.{codec}")
+    write_framed(path, DATA, codec)
+    reader = FramedReader(path)
+    try:
+        for start, length in [(0, 10), (FRAME - 5, 10), (2 * FRAME - 1, 2), (3 * FRAME + 17, 2500)]:
+            reader.seek(start)
+            assert read_fully(reader, length) == DATA[start:start + length]
+            assert reader.tell() == min(start + length, len(DATA))
+    finally:
+        reader.close()
+
+
+def test_seek_whence(framed):
+    reader = FramedReader(framed)
+    try:
+        assert reader.seek(-25, io.SEEK_END) == len(DATA) - 25
+        assert reader.read() == DATA[-25:]
+        assert reader.read(10) == b""
+
+        reader.seek(FRAME + 10)
+        assert reader.seek(-20, io.SEEK_CUR) == FRAME - 10
+        # One raw read ends at the frame boundary, the next continues in the following frame
+        assert reader.read(20) == DATA[FRAME - 10:FRAME]
+        assert reader.read(10) == DATA[FRAME:FRAME + 10]
+
+        assert reader.seek(-5) == 0
+        assert reader.seek(len(DATA) + 100) == len(DATA) + 100
+        assert reader.read(1) == b""
+    finally:
+        reader.close()
+
+
+def test_buffered_readline_across_frames(framed):
+    with open_stored_file(framed, buffer_size=64) as f:
+        f.seek(FRAME - 3)
+        line = f.readline()
+        assert line == DATA[FRAME - 3:DATA.index(b"\n", FRAME - 3) + 1]
+        assert f.read() == DATA[FRAME - 3 + len(line):]
+
+
+def test_append_discards_unindexed_tail(tmp_path):
+    path = str(tmp_path / "interrupted.log")
+    write_framed(path, DATA[:2500])
+    # A crash after the last frame was written but before it was indexed
+    index = load_frame_index(path)
+    with open(path + FRAME_INDEX_SUFFIX, "wb") as f:
+        index[:4].tofile(f)
+    with open(path, "ab") as f:
+        f.write(b"\x1f\x8b half a frame")
+
+    write_framed(path, DATA[2000:], append=True)
+    index = load_frame_index(path)
+    assert index[2] == 2000 and index[-2] == len(DATA)
+    assert os.path.getsize(path) == index[-1]
+    with open_stored_file(path) as f:
+        assert f.read() == DATA
+
+
+def test_resume_compressed_upload_without_codec(tmp_path):
+    """A compressed upload resumed without a codec stays framed"""
+    path = str(tmp_path / "resumed.log")
+    write_framed(path, DATA[:3000], frame_size=None)
+    size = asyncio.run(write_stream(chunks_of(DATA[3000:]), path, append=True))
+
+    assert size == len(DATA) and is_compressed(path)
+    with open(path, "rb") as f:
+        assert f.read(2) == b"\x1f\x8b"
+    with open_stored_file(path) as f:
+        assert f.read() == DATA
+
+
+def test_resume_raw_upload_with_codec(tmp_path):
+    """A raw upload resumed with a codec stays raw"""
+    path = str(tmp_path / "resumed.log")
+    with open(path, "wb") as f:
+        f.write(DATA[:3000])
+    size = asyncio.run(write_stream(chunks_of(DATA[3000:]), path, append=True, codec="gzip"))
+
+    assert size == len(DATA) and not is_compressed(path)
+    assert not os.path.exists(path + FRAME_INDEX_SUFFIX)
+    with open(path, "rb") as f:
+        assert f.read() == DATA
+
+
+def test_resume_mixes_codecs(tmp_path):
+    """Frames of different codecs in one file each decode by their magic"""
+    path = str(tmp_path / "mixed.log")
+    write_framed(path, DATA[:2500], "gzip")
+    size = asyncio.run(write_stream(chunks_of(DATA[2500:]), path, append=True, codec="zstd"))
+
+    assert size == len(DATA)
+    with open_stored_file(path) as f:
+        f.seek(2400)
+        assert f.read(200) == DATA[2400:2600]
+        f.seek(0)
+        assert f.read() == DATA
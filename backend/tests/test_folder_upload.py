@@ -0,0 +1,117 @@
+"""
+Folder upload measurement: concurrent storage and one bulk insert against
+the per-file commit loop it replaced
+
+Both run against a file-backed SQLite database, where every commit is a
+synced write. The baseline route is the old ``upload_folder`` body: read
+each file whole, write it synchronously, then add, commit and refresh its
+row. Run with ``-s`` to see the timings.
+"""
+
+import time
+import uuid
+import os
+
+import pytest
+
+FILES = 300
+
+
+@pytest.fixture
+def client(tmp_path):
+    from datetime import datetime
+    from types import SimpleNamespace
+    from typing import List
+    from fastapi import Depends, FastAPI, File, UploadFile
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import Session, sessionmaker
+
+    from app.api.v1.endpoints import logs
+    from app.api.v1.endpoints.auth import get_current_user
+    from app.core.config import settings
+    from app.core.database import Base, get_db
+    from app.models.database import SecurityLog, ThreatLevel
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'folder.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    TestSession = sessionmaker(bind=engine)
+    commits = []
+    event.listen(engine, "commit", lambda connection: commits.append(1))
+
+    def get_test_db():
+        db = TestSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(logs.router, prefix="/api/v1/logs")
+
+    @app.post("/baseline/upload-folder")
+    async def upload_folder_per_file(files: List[UploadFile] = File(...), db: Session = Depends(get_db)):
+        uploaded = []
+        for file in files:
+            content = await file.read()
+            file_path = os.path.join(settings.UPLOAD_DIR, f"{uuid.uuid4()}.log")
+            with open(file_path, "wb") as buffer:
+                buffer.write(content)
+            log_entry = SecurityLog(timestamp=datetime.utcnow(), source="folder_upload", log_type="text",
+                                    raw_message=f"Uploaded file from folder: {file.filename}",
+                                    parsed_data={"filename": file.filename, "file_path": file_path},
+                                    severity=ThreatLevel.NORMAL, processed=False, file_path=file_path,
+                                    file_size=len(content), user_id="user-a")
+            db.add(log_entry)
+            db.commit()
+            db.refresh(log_entry)
+            uploaded.append(log_entry.id)
+        return {"total_uploaded": len(uploaded)}
+
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="user-a")
+    app.dependency_overrides[get_db] = get_test_db
+    client = TestClient(app)
+    client.commits = commits
+    client.session = TestSession
+    return client
+
+
+def folder(tag):
+    return [
+        ("files", (f"host-{i}.log", "".join(
+            f"2024-01-15 10:{j % 60:02d}:00 {tag} sshd[{i}]: accepted connection from 10.0.{i % 255}.{j % 255}\n"
+            for j in range(50)).encode(), "text/plain"))
+        for i in range(FILES)
+    ]
+
+
+def timed_upload(client, url, files):
+    client.commits.clear()
+    started = time.perf_counter()
+    response = client.post(url, files=files)
+    return response, time.perf_counter() - started, len(client.commits)
+
+
+def test_folder_upload_commits_once(client):
+    from app.models.database import SecurityLog
+
+    files = folder("bulk") + [("files", ("tool.exe", b"MZ\x90\x00", "application/x-msdownload"))]
+    response, elapsed, commits = timed_upload(client, "/api/v1/logs/upload-folder", files)
+    body = response.json()
+
+    assert response.status_code == 200
+    assert body["total_uploaded"] == FILES and body["total_failed"] == 1
+    assert body["failed_files"][0]["filename"] == "tool.exe"
+    assert commits == 1
+    db = client.session()
+    try:
+        assert db.query(SecurityLog).filter(SecurityLog.source == "folder_upload").count() == FILES
+    finally:
+        db.close()
+
+    baseline, baseline_elapsed, baseline_commits = timed_upload(client, "/baseline/upload-folder", folder("seq"))
+    assert baseline.json()["total_uploaded"] == FILES and baseline_commits == FILES
+
+    print(f"\n📊 {FILES} files: bulk {elapsed:.2f} s in {commits} commit, "
+          f"per-file {baseline_elapsed:.2f} s in {baseline_commits} commits "
+          f"({baseline_elapsed / elapsed:.1f}x)")
@@ -0,0 +1,168 @@
+"""
+Line offset index: checkpoint offsets for CRLF files and files without a
+trailing newline, fed in arbitrary chunks, and read_lines over them,
+including lines too long to return whole
+"""
+
+import pytest
+
+from app.services.compressed_storage import FrameWriter
+from app.services.line_index import LineIndex, LineIndexBuilder, build_line_index, read_lines
+
+LINES = [f"2024-01-15 10:30:{i:02d} sshd[{i}]: event {'x' * (i % 7)}".encode() for i in range(23)]
+
+
+def line_starts(data):
+    starts = [0]
+    for i, byte in enumerate(data):
+        if byte == 0x0A and i + 1 < len(data):
+            starts.append(i + 1)
+    return starts
+
+
+def build(data, interval, chunk_size):
+    builder = LineIndexBuilder(interval)
+    for i in range(0, len(data), chunk_size):
+        builder.feed(data[i:i + chunk_size])
+    return builder
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 64, 10_000])
+def test_crlf_offsets(chunk_size):
+    data = b"".join(line + b"\r\n" for line in LINES)
+    builder = build(data, 4, chunk_size)
+
+    assert builder.line_count == len(LINES)
+    assert builder.size == len(data)
+    assert list(builder.offsets) == line_starts(data)[::4]
+    # Offsets land just past "\r\n", at the first byte of the line
+    assert all(data[offset - 2:offset] == b"\r\n" for offset in builder.offsets[1:])
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 10_000])
+def test_no_trailing_newline(chunk_size):
+    data = b"\n".join(LINES)
+    builder = build(data, 5, chunk_size)
+
+    assert builder.newlines == len(LINES) - 1
+    assert builder.line_count == len(LINES)
+    assert list(builder.offsets) == line_starts(data)[::5]
+
+
+def test_edge_counts():
+    assert LineIndexBuilder(3).line_count == 0
+    assert build(b"\n", 3, 1).line_count == 1
+    assert build(b"only line", 3, 4).line_count == 1
+    assert build(b"a\n\nb", 3, 1).line_count == 3
+
+
+def test_checkpoint_at_eof_is_dropped(tmp_path):
+    """Every interval-th line ending the file exactly would index a line that does not exist"""
+    path = str(tmp_path / "exact.log")
+    data = b"".join(line + b"\n" for line in LINES[:8])
+    with open(path, "wb") as f:
+        f.write(data)
+    build_line_index(path, interval=4)
+
+    with LineIndex(path) as index:
+        assert (index.interval, index.line_count, index.size) == (4, 8, len(data))
+        assert list(index.offsets) == line_starts(data)[::4]
+        assert index.checkpoint(7) == (4, line_starts(data)[4])
+        assert index.checkpoint(100) == (4, line_starts(data)[4])
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+@pytest.mark.parametrize("separator", [b"\n", b"\r\n"])
+def test_read_lines(tmp_path, compressed, separator):
+    path = str(tmp_path / "app.log")
+    data = separator.join(LINES)
+    if compressed:
+        writer = FrameWriter(path, "gzip", frame_size=100)
+        writer.write(data)
+        writer.close()
+    else:
+        with open(path, "wb") as f:
+            f.write(data)
+    build_line_index(path, interval=4)
+
+    lines, truncated, line_count = read_lines(path, 6, 11)
+    assert line_count == len(LINES) and truncated == []
+    assert [line.rstrip(b"\r\n") for line in lines] == LINES[6:11]
+
+    lines, _, _ = read_lines(path, 20, 100)
+    assert lines[-1] == LINES[-1]
+    assert [line.rstrip(b"\r\n") for line in lines] == LINES[20:]
+    assert read_lines(path, len(LINES), len(LINES) + 5) == ([], [], len(LINES))
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_long_lines_are_truncated(tmp_path, compressed):
+    path = str(tmp_path / "long.log")
+    long_line = b"GET /" + b"A" * 5000
+    rows = [b"short one", long_line, b"short two", b"x" * 100, long_line + b" end", b"last"]
+    data = b"\r\n".join(rows)
+    if compressed:
+        writer = FrameWriter(path, "gzip", frame_size=700)
+        writer.write(data)
+        writer.close()
+    else:
+        with open(path, "wb") as f:
+            f.write(data)
+    build_line_index(path, interval=4)
+
+    lines, truncated, line_count = read_lines(path, 0, 10, max_line_length=100)
+    assert line_count == len(rows)
+    assert truncated == [1, 4]
+    assert lines[1] == long_line[:100] and lines[4] == long_line[:100]
+    # A line of exactly the limit before its newline is whole
+    assert [line.rstrip(b"\r\n") for line in lines[2:4]] == [b"short two", b"x" * 100]
+    assert lines[5] == b"last"
+
+    # Skipping a long line on the way to ``start`` is bounded the same way
+    lines, truncated, _ = read_lines(path, 2, 4, max_line_length=100)
+    assert [line.rstrip(b"\r\n") for line in lines] == rows[2:4] and truncated == []
+
+
+def test_file_without_newlines(tmp_path):
+    path = str(tmp_path / "blob.log")
+    with open(path, "wb") as f:
+        f.write(b"z" * 10_000)
+
+    lines, truncated, line_count = read_lines(path, 0, 5, max_line_length=64)
+    assert (line_count, truncated, lines) == (1, [0], [b"z" * 64])
+
+
+def test_lines_endpoint_marks_truncated_lines(tmp_path, monkeypatch):
+    from datetime import datetime
+    from types import SimpleNamespace
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.api.v1.endpoints import logs
+    from app.api.v1.endpoints.auth import get_current_user
+    from app.core.config import settings
+    from app.core.database import Base, SessionLocal, engine
+    from app.models.database import SecurityLog
+
+    path = str(tmp_path / "endpoint.log")
+    with open(path, "wb") as f:
+        f.write(b"first\r\n" + b"B" * 1000 + b"\r\nthird\r\n")
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    log = SecurityLog(timestamp=datetime.utcnow(), source="file_upload", log_type="security_log",
+                      raw_message="Uploaded file: endpoint.log", file_path=path, parsed_data={},
+                      user_id="user-a")
+    db.add(log)
+    db.commit()
+    log_id = log.id
+    db.close()
+
+    monkeypatch.setattr(settings, "UPLOAD_BUFFER_SIZE", 256)
+    app = FastAPI()
+    app.include_router(logs.router, prefix="/api/v1/logs")
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="user-a")
+    body = TestClient(app).get(f"/api/v1/logs/{log_id}/lines", params={"start": 0, "end": 3}).json()
+
+    assert body["lines"] == ["first", "B" * 256, "third"]
+    assert body["truncated_lines"] == [1]
+    assert body["total_lines"] == 3 and body["end"] == 3
@@ -0,0 +1,82 @@
+"""
+Result cache versioning: the first lookup under a new model version drops
+that model's entries of every other version from both tiers
+"""
+
+import pytest
+
+from app.services.result_cache import RedisResultCacheStore, ResultCache, SQLiteResultCacheStore, text_digest
+
+HIGH = {"threat_level": "high", "confidence": 0.9}
+LOW = {"threat_level": "low", "confidence": 0.6}
+
+
+def sqlite_store():
+    return SQLiteResultCacheStore(":memory:")
+
+
+def redis_store():
+    fakeredis = pytest.importorskip("fakeredis")
+    store = RedisResultCacheStore.__new__(RedisResultCacheStore)
+    store.ttl = 3600
+    store.client = fakeredis.FakeRedis(decode_responses=True)
+    return store
+
+
+@pytest.fixture(params=[sqlite_store, redis_store], ids=["sqlite", "redis"])
+def store(request):
+    return request.param()
+
+
+def test_hits_within_a_version(store):
+    cache = ResultCache("text", store)
+    digest = text_digest("Failed   password for root")
+    cache.set("distilbert", "1.0.0", digest, HIGH)
+
+    assert cache.get("distilbert", "1.0.0", digest) == HIGH
+    assert cache.get("distilbert", "1.0.0", text_digest("Failed password for root")) == HIGH
+    # A second process shares only the store
+    assert ResultCache("text", store).get("distilbert", "1.0.0", digest) == HIGH
+
+
+def test_new_version_purges_old_entries(store):
+    cache = ResultCache("text", store)
+    old, kept = text_digest("old line"), text_digest("other model")
+    cache.get("distilbert", "1.0.0", old)
+    cache.set("distilbert", "1.0.0", old, HIGH)
+    cache.set("roberta", "1.0.0", kept, LOW)
+
+    assert cache.get("distilbert", "2.0.0", old) is None
+    assert not [key for key in cache._lru if key[:2] == ("distilbert", "1.0.0")]
+    assert store.get("text", "distilbert", "1.0.0", old) is None
+    # Other models keep their entries
+    assert store.get("text", "roberta", "1.0.0", kept) is not None
+    assert cache.get("roberta", "1.0.0", kept) == LOW
+
+    cache.set("distilbert", "2.0.0", old, LOW)
+    assert ResultCache("text", store).get("distilbert", "2.0.0", old) == LOW
+
+
+def test_version_change_seen_by_another_process(store):
+    first, second = ResultCache("text", store), ResultCache("text", store)
+    digest = text_digest("shared line")
+    first.get("distilbert", "1.0.0", digest)
+    first.set("distilbert", "1.0.0", digest, HIGH)
+
+    assert second.get("distilbert", "2.0.0", digest) is None
+    assert store.get("text", "distilbert", "1.0.0", digest) is None
+    # The stale process only has the entry in its own LRU until it sees the new version
+    assert first.get("distilbert", "2.0.0", digest) is None
+    assert not first._lru
+
+
+def test_store_outage_degrades_to_misses():
+    class BrokenStore(SQLiteResultCacheStore):
+        def get(self, *args):
+            raise ConnectionError("store down")
+
+        def retain_version(self, *args):
+            raise ConnectionError("store down")
+
+    cache = ResultCache("text", BrokenStore(":memory:"), lru_size=0)
+    assert cache.get("distilbert", "1.0.0", text_digest("line")) is None
@@ -0,0 +1,91 @@
+"""
+Log template mining: masking and wildcarding, the template cap, and
+merging the summaries of shards
+"""
+
+from app.core.config import settings
+from app.services.template_miner import WILDCARD, TemplateMiner, merge_template_summaries
+
+
+def test_masks_variable_fields():
+    tokens, values = TemplateMiner.tokenize(
+        "job 550e8400-e29b-41d4-a716-446655440000 from 10.0.0.7:8080 took 1.5 ms at 0x7ffe")
+    assert tokens == ["job", "<UUID>", "from", "<IP>", "took", "<NUM>", "ms", "at", "<HEX>"]
+    assert values == ["550e8400-e29b-41d4-a716-446655440000", "10.0.0.7:8080", "0x7ffe", "1.5"]
+
+
+def test_differing_tokens_become_wildcards():
+    miner = TemplateMiner(depth=4, similarity=0.5)
+    first = miner.add("Connection closed by alice port 22")
+    second = miner.add("Connection closed by bob port 2222")
+
+    assert second is first and len(miner.templates) == 1
+    assert first.text == f"Connection closed by {WILDCARD} port <NUM>"
+    assert first.count == 2
+    # Masked values first, then the tokens under wildcards
+    assert first.examples == [["22"], ["2222", "bob"]]
+
+
+def test_dissimilar_lines_start_new_templates():
+    miner = TemplateMiner(depth=4, similarity=0.5)
+    miner.add("Connection closed by alice port 22")
+    other = miner.add("Connection closed: too many authentication failures")
+    different_prefix = miner.add("Session opened by alice port 22")
+
+    assert len(miner.templates) == 3
+    assert other.text == "Connection closed: too many authentication failures"
+    assert different_prefix.text == "Session opened by alice port <NUM>"
+
+
+def test_max_templates_cap():
+    miner = TemplateMiner(depth=4, similarity=0.5, max_templates=2)
+    first = miner.add("disk sda1 is full")
+    miner.add("user root logged out now")
+
+    assert miner.add("kernel panic") is None
+    assert len(miner.templates) == 2
+    # Lines matching a kept template are still clustered once the cap is hit
+    assert miner.add("disk sdb2 is full") is first
+    assert first.count == 2 and first.text == f"disk {WILDCARD} is full"
+
+
+def test_examples_are_bounded():
+    miner = TemplateMiner(max_examples=2)
+    for port in range(10):
+        template = miner.add(f"Accepted password for root port {port}")
+    assert template.count == 10 and len(template.examples) == 2
+
+
+def test_summary_orders_by_count():
+    miner = TemplateMiner()
+    for i in range(3):
+        miner.add(f"Accepted password for root port {i}")
+    miner.add("kernel panic")
+    miner.templates[0].result = {"threat_level": "high"}
+
+    summary = miner.summary()
+    assert [entry["count"] for entry in summary] == [3, 1]
+    assert summary[0]["severity"] == "high" and summary[1]["severity"] is None
+    assert len(miner.summary(limit=1)) == 1
+
+
+def test_merge_template_summaries():
+    shard_a = [
+        {"template": "login failed for <*>", "count": 5, "examples": [["a"], ["b"]], "severity": "medium"},
+        {"template": "disk <*> is full", "count": 1, "examples": [["sda"]], "severity": None},
+    ]
+    shard_b = [
+        {"template": "login failed for <*>", "count": 2, "examples": [["c"], ["d"]], "severity": "critical"},
+        {"template": "kernel panic", "count": 4, "examples": [[]], "severity": "low"},
+    ]
+    merged = merge_template_summaries([shard_a, None, shard_b])
+
+    assert [entry["template"] for entry in merged] == ["login failed for <*>", "kernel panic", "disk <*> is full"]
+    login = merged[0]
+    assert login["count"] == 7
+    assert login["examples"] == [["a"], ["b"], ["c"], ["d"]][:settings.TEMPLATE_EXAMPLES]
+    assert login["severity"] == "critical"
+    assert merged[2]["severity"] is None
+    # The inputs are left untouched
+    assert shard_a[0]["count"] == 5 and shard_a[0]["examples"] == [["a"], ["b"]]
+    assert len(merge_template_summaries([shard_a, shard_b], limit=2)) == 2
@@ -152,6 +152,8 @@ export const logsAPI = {
       formData.append('file_id', fileId);
       formData.append('filename', file.name);
       formData.append('upload_type', uploadType);
+      formData.append('chunk_size', chunkSize);
+      formData.append('total_size', file.size);
 
       uploadPromises.push(
         apiRequest("/logs/upload-chunk", {
@@ -177,11 +179,8 @@ export const logsAPI = {
       return logsAPI.uploadChunked(file, uploadType);
     }
 
+    // Raw body with metadata in headers, so the server writes each byte once
     const uploadId = crypto.randomUUID();
-    const formData = new FormData();
-    formData.append('file', file);
-    formData.append('upload_type', uploadType);
-    formData.append('upload_id', uploadId);
 
     // Create a custom XMLHttpRequest for progress tracking
     return new Promise((resolve, reject) => {
@@ -219,9 +218,13 @@ export const logsAPI = {
       });
 
       // Send the request
-      xhr.open('POST', `${API_BASE_URL}/logs/upload-streaming`);
+      xhr.open('POST', `${API_BASE_URL}/logs/ingest`);
       xhr.setRequestHeader('Authorization', `Bearer ${getAuthToken()}`);
-      xhr.send(formData);
+      xhr.setRequestHeader('Content-Type', file.type || 'application/octet-stream');
+      xhr.setRequestHeader('X-Filename', encodeURIComponent(file.name));
+      xhr.setRequestHeader('X-Upload-Type', uploadType);
+      xhr.setRequestHeader('X-Upload-Id', uploadId);
+      xhr.send(file);
     });
   },
 